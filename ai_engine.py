@@ -10,7 +10,25 @@ import pandas as pd
 import numpy as np
 import time
 import os
-from datetime import datetime
+import select
+import argparse
+import multiprocessing
+import json
+import threading
+import warnings
+import itertools
+import contextlib
+import shutil
+from collections import deque
+from datetime import datetime, timezone
+import scipy.sparse
+
+from iforest_compiled import compile_isolation_forest, load_compiled, save_compiled, verify_compiled_model
+from model_shards import ModelShard, ShardedModelStore
+from feature_store import RollingFeatureStore, rolling_feature_names
+from prediction_cache import PredictionCache
+from engine_metrics import EngineMetrics, start_metrics_server
+from latest_cache import device_notify_payloads
 
 # --- KONFIGURASI ---
 DB_HOST = "127.0.0.1"
@@ -22,15 +40,146 @@ DB_PASS = "Naufal"        # Pastikan password benar
 # Nama file model tunggal Anda
 MODEL_FILE_PATH = 'safe_anomaly_model_multidevice.joblib' 
 
+# Array evaluator compiled disimpan sebagai .npy di '<file model>.compiled-<ukuran>-<mtime>/'
+# dan dimuat dengan np.load(mmap_mode='r'): semua worker berbagi array yang sama
+# lewat page cache OS, dan worker berikutnya tidak perlu mengompilasi ulang.
+# (Pohon sklearn sendiri selalu disalin saat unpickle, jadi tidak ikut dibagi.)
+# False = evaluator dibuat di memori setiap proses.
+MODEL_COMPILED_CACHE = True
+
+# Hot-reload: cek perubahan file model setiap N detik (0 = nonaktif).
+# Untuk rollout, tulis model baru ke file sementara lalu 'mv' ke MODEL_FILE_PATH.
+MODEL_RELOAD_CHECK_INTERVAL = 10
+
+# Evaluator "compiled" (pohon IsolationForest diratakan ke array NumPy).
+# Hanya dipakai jika hasilnya identik bit-for-bit dengan MODEL.predict pada
+# set uji sintetis berisi COMPILED_VERIFY_ROWS baris; jika tidak, pakai sklearn.
+USE_COMPILED_MODEL = True
+COMPILED_VERIFY_ROWS = 2000
+# Untuk batch sangat besar (mis. chunk rescore) loop Cython sklearn lebih cepat;
+# evaluator compiled hanya dipakai sampai jumlah baris ini
+COMPILED_MAX_BATCH_ROWS = 4000
+
+# --- KONFIGURASI ENCODING DEVICE ---
+# Awalan nama kolom One-Hot Encoding device di feature_names_
+DEVICE_FEATURE_PREFIX = 'device_id_'
+# Jika model memiliki setidaknya sebanyak ini kolom device, jalur sklearn memakai
+# matriks CSR (hanya sel bukan nol yang disimpan) alih-alih matriks penuh
+SPARSE_MIN_DEVICES = 64
+
+# --- KONFIGURASI MODEL PER GRUP DEVICE (SHARDING) ---
+# Direktori berisi '<device_atau_grup>.joblib' (+ opsional shards.json untuk
+# pemetaan device -> grup). None = hanya memakai model tunggal MODEL_FILE_PATH.
+# Model grup dimuat saat pertama dipakai; jika tidak ada file untuk suatu grup,
+# model tunggal dipakai sebagai cadangan. Tanpa keduanya, bacaan grup itu tidak
+# dinilai: device-nya diparkir (UNSCORABLE_RETRY_INTERVAL) sampai file modelnya ada.
+MODEL_SHARD_DIR = None
+# Anggaran memori untuk model grup yang dimuat; lewat dari ini, model LRU dikeluarkan
+MODEL_SHARD_MEMORY_BUDGET_MB = 512
+
+# --- KONFIGURASI FITUR ROLLING (PER DEVICE) ---
+# Rolling mean/std, delta dan EWMA untuk temperature & humidity, diperbarui
+# inkremental per bacaan. Jendela (dan warm-start dari DB) hanya dibuat jika
+# model aktif atau model grup memuat fitur tersebut di feature_names_
+# (cth: 'temperature_roll_mean', 'humidity_delta'); model lain tidak terkena biayanya.
+# Jendela hidup per proses, jadi model berfitur rolling ditolak jika satu proses
+# hanya melihat sebagian bacaan tiap device: --workers > 1, --rescore, dan inline
+# scoring mqtt_listener dengan shared subscription.
+ROLLING_FEATURES_ENABLED = True
+ROLLING_WINDOW_SIZE = 12
+ROLLING_EWMA_ALPHA = 0.3
+# Saat start, jendela diisi dari bacaan yang sudah dinilai dalam N jam terakhir
+ROLLING_WARM_START_HOURS = 24
+
+# --- KONFIGURASI CACHE PREDIKSI ---
+# Jumlah maksimum vektor fitur (sudah di-encode) yang hasil prediksinya disimpan
+# (LRU). 0 = nonaktif. Cache dikosongkan setiap kali model diganti.
+PREDICTION_CACHE_SIZE = 50000
+
+# --- KONFIGURASI METRIK ---
+# Endpoint Prometheus lokal (http://METRICS_HOST:METRICS_PORT/metrics). 0 = nonaktif.
+# Dengan --workers N, worker ke-i memakai port METRICS_PORT + i.
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+# Backlog (COUNT baris is_anomaly IS NULL) dihitung paling sering tiap N detik
+METRICS_BACKLOG_INTERVAL = 15
+
 # Interval polling (dalam detik)
 POLL_INTERVAL = 5
 
+# --- KONFIGURASI LISTEN/NOTIFY ---
+# Jika True, engine langsung bangun saat mqtt_listener memanggil pg_notify
+# pada channel ini. Polling tiap POLL_INTERVAL tetap berjalan sebagai cadangan.
+USE_NOTIFY = True
+NOTIFY_CHANNEL = "sensor_readings_new"
+# Dikirim setelah flag is_anomaly ditulis (dipakai cache latest_data di api_server)
+SCORED_NOTIFY_CHANNEL = "sensor_readings_scored"
+
 # --- VARIABEL GLOBAL MODEL ---
 # Variabel ini akan diisi saat skrip dimulai
 MODEL = None
+# Versi compiled dari MODEL (None = pakai MODEL.predict biasa)
+COMPILED_MODEL = None
 # Ini adalah daftar LENGKAP fitur yang diharapkan model
 # (cth: ['temp', 'hum', 'hour', 'dev_id_A', 'dev_id_B', ...])
 MODEL_FEATURES_LIST = []
+# Posisi kolom setiap fitur di dalam matriks fitur (dihitung sekali saat model dimuat)
+# (cth: {'temperature': 0, 'humidity': 1, ..., 'device_id_A': 5})
+FEATURE_INDEX = {}
+# Model aktif beserta tabel lookup yang dihitung sekali saat model dimuat
+# (kolom fitur non-device dan device_id -> indeks kolom 'device_id_xxxx')
+ACTIVE_SHARD = None
+# Cache model per grup device (None jika MODEL_SHARD_DIR tidak diset)
+MODEL_SHARDS = None
+# Jendela rolling per device (None jika ROLLING_FEATURES_ENABLED = False)
+FEATURE_STORE = None
+# Cache hasil prediksi per vektor fitur (None jika PREDICTION_CACHE_SIZE = 0)
+PREDICTION_CACHE = PredictionCache(PREDICTION_CACHE_SIZE) if PREDICTION_CACHE_SIZE > 0 else None
+# Sumber penanda unik untuk setiap model yang dimuat (bagian dari kunci cache)
+_cache_tokens = itertools.count(1)
+# Alasan model berfitur rolling ditolak pada mode ini (None = boleh dipakai):
+# proses ini hanya melihat sebagian bacaan setiap device, jadi fitur jendelanya
+# akan bergantung pada jumlah proses dan salah.
+ROLLING_FEATURES_UNSUPPORTED = None
+WORKERS_ROLLING_REASON = "--workers > 1 (SKIP LOCKED membagi bacaan satu device ke beberapa proses)"
+SHARED_STREAM_ROLLING_REASON = "shared subscription (bacaan satu device dibagi ke beberapa proses)"
+# Metrik engine (None jika endpoint metrik tidak dijalankan)
+METRICS = None
+# Waktu modifikasi file model yang sedang dipakai (untuk hot-reload)
+MODEL_FILE_MTIME = None
+
+# Model baru yang sudah dimuat & divalidasi oleh watcher, menunggu ditukar
+# di antara batch oleh loop utama: (model, daftar_fitur, mtime, compiled)
+_pending_model = None
+_pending_model_lock = threading.Lock()
+
+# Jumlah baris yang diambil dan diprediksi sekaligus dalam satu batch
+BATCH_SIZE = 100
+
+# Baris yang diklaim tetapi tidak mendapat hasil prediksi tetap is_anomaly IS NULL.
+# Device-nya dikeluarkan dari query klaim selama N detik, agar loop tidak
+# mengambil baris yang sama terus-menerus dan bacaan baru tidak tertahan di
+# belakangnya; setelah itu device dicoba lagi. Baris dengan device_id kosong
+# (NULL atau '') tidak pernah bisa dinilai dan tidak pernah diklaim.
+UNSCORABLE_RETRY_INTERVAL = 300
+# device_id -> waktu (time.monotonic()) device boleh diklaim lagi
+UNSCORABLE_DEVICES = {}
+# Kunci grup tanpa model -> waktu peringatan terakhir (maks. sekali per interval)
+_missing_shard_warned = {}
+
+# Koneksi kerja dipakai ulang antar batch; dicek dengan 'SELECT 1' jika
+# sudah menganggur lebih lama dari ini (detik)
+HEALTH_CHECK_INTERVAL = 30
+
+# --- KONFIGURASI RESCORE (BACKFILL HISTORIS) ---
+# Jumlah baris per chunk yang dibaca dari server-side cursor dan diprediksi per proses
+RESCORE_CHUNK_SIZE = 50000
+# Chunk yang boleh sedang diprediksi/menunggu ditulis per proses Pool. Pembacaan
+# cursor berhenti sampai ada chunk yang selesai, jadi memori proses induk tetap
+# sekitar (RESCORE_CHUNKS_IN_FLIGHT_PER_WORKER x workers x RESCORE_CHUNK_SIZE) baris
+RESCORE_CHUNKS_IN_FLIGHT_PER_WORKER = 2
+# File checkpoint agar rescore yang terputus bisa dilanjutkan (--resume)
+RESCORE_CHECKPOINT_FILE = 'rescore_checkpoint.json'
 
 # --- KONEKSI DATABASE ---
 def get_db_connection():
@@ -47,24 +196,289 @@ def get_db_connection():
         print(f"[ERROR] Gagal koneksi ke database: {e}")
         return None, None
 
+def prepare_engine_statements(cur):
+    """
+    Menyiapkan prepared statement SELECT/UPDATE di sisi server, sekali per koneksi.
+    Prepared statement berlaku selama sesi, jadi dipakai ulang oleh setiap batch.
+    """
+    # HARUS menyertakan 'device_id'.
+    # FOR UPDATE SKIP LOCKED membuat setiap worker mengklaim baris yang berbeda;
+    # kunci dilepas saat COMMIT/ROLLBACK setelah hasilnya ditulis.
+    # $2 = device yang sedang diparkir (lihat UNSCORABLE_RETRY_INTERVAL);
+    # device_id <> '' sekaligus membuang NULL
+    cur.execute("""
+        PREPARE fetch_pending (integer, varchar[]) AS
+        SELECT id, timestamp_utc, temperature, humidity, device_id
+        FROM sensor_readings
+        WHERE is_anomaly IS NULL AND device_id <> '' AND device_id <> ALL($2)
+        ORDER BY timestamp_utc ASC
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED;
+    """)
+    cur.execute("""
+        PREPARE update_anomaly (bigint[], boolean[]) AS
+        UPDATE sensor_readings AS s
+        SET is_anomaly = v.is_anomaly
+        FROM unnest($1, $2) AS v(id, is_anomaly)
+        WHERE s.id = v.id;
+    """)
+
+def get_engine_connection():
+    """
+    Membuat koneksi kerja jangka panjang untuk AI Engine (dengan prepared
+    statement). Mengembalikan (conn, cur) atau (None, None) jika gagal.
+    """
+    conn, cur = get_db_connection()
+    if not conn:
+        return None, None
+    try:
+        prepare_engine_statements(cur)
+        conn.commit()
+        return conn, cur
+    except psycopg2.Error as e:
+        print(f"[ERROR] Gagal menyiapkan prepared statement: {e}")
+        close_engine_connection(conn, cur)
+        return None, None
+
+def close_engine_connection(conn, cur):
+    """Menutup koneksi kerja tanpa melempar error (koneksi mungkin sudah putus)."""
+    try:
+        if cur: cur.close()
+        if conn: conn.close()
+    except psycopg2.Error:
+        pass
+
+def is_connection_healthy(conn, cur):
+    """Health check ringan: memastikan koneksi belum ditutup server."""
+    if conn is None or conn.closed:
+        return False
+    try:
+        cur.execute("SELECT 1;")
+        cur.fetchone()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def open_listen_connection():
+    """Membuat koneksi khusus (autocommit) yang men-LISTEN NOTIFY_CHANNEL."""
+    try:
+        conn = psycopg2.connect(
+            host=DB_HOST,
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASS
+        )
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {NOTIFY_CHANNEL};")
+        print(f"[INFO] Mendengarkan notifikasi pada channel '{NOTIFY_CHANNEL}'.")
+        return conn
+    except psycopg2.Error as e:
+        print(f"[WARN] Gagal LISTEN ke channel '{NOTIFY_CHANNEL}', kembali ke polling: {e}")
+        return None
+
+def wait_for_new_data(listen_conn, timeout):
+    """
+    Menunggu sampai ada NOTIFY baru atau timeout habis (polling cadangan).
+    Mengembalikan koneksi LISTEN yang (masih) aktif, atau None jika terputus.
+    """
+    if listen_conn is None:
+        time.sleep(timeout)
+        # Coba pasang kembali LISTEN jika mode notify aktif
+        return open_listen_connection() if USE_NOTIFY else None
+
+    try:
+        if select.select([listen_conn], [], [], timeout) != ([], [], []):
+            listen_conn.poll()
+            # Cukup tahu ada data baru; isi notifikasi tidak dipakai
+            listen_conn.notifies.clear()
+        return listen_conn
+    except (psycopg2.Error, OSError) as e:
+        print(f"\n[WARN] Koneksi LISTEN terputus: {e}")
+        try:
+            listen_conn.close()
+        except psycopg2.Error:
+            pass
+        return None
+
 # --- MANAJEMEN MODEL ---
+def read_model_file(path):
+    """
+    Memuat model dari file dan memvalidasinya tanpa mengubah model yang aktif.
+    Mengembalikan (model, daftar_fitur, compiled). Melempar AttributeError jika model
+    tidak menyimpan feature_names_, atau ValueError jika fiturnya tidak bisa dibuat.
+    """
+    # Kunci cache diambil SEBELUM load: jika file diganti di tengah jalan, array
+    # model baru tidak pernah tersimpan di bawah kunci versi baru dengan isi lama
+    cache_dir = compiled_cache_dir(path) if MODEL_COMPILED_CACHE else None
+    model = joblib.load(path)
+
+    # Ini adalah bagian terpenting:
+    # Mengambil daftar fitur yang disimpan di dalam model
+    features = list(model.feature_names_)
+    if not features:
+        raise ValueError("feature_names_ kosong.")
+    # Fitur non-device tanpa getter akan bernilai 0 untuk setiap baris: tolak modelnya
+    unknown = [f for f in features if not f.startswith(DEVICE_FEATURE_PREFIX) and f not in BASE_FEATURE_GETTERS]
+    if unknown:
+        raise ValueError(f"fitur model tidak dikenal (tidak ada di BASE_FEATURE_GETTERS): {unknown}")
+    if uses_rolling_features(features):
+        if not ROLLING_FEATURES_ENABLED:
+            raise ValueError("model memakai fitur rolling, tetapi ROLLING_FEATURES_ENABLED = False.")
+        if ROLLING_FEATURES_UNSUPPORTED:
+            raise ValueError(f"model memakai fitur rolling, tidak didukung untuk {ROLLING_FEATURES_UNSUPPORTED}.")
+
+    # Validasi: model harus bisa memprediksi satu baris dengan fitur tersebut
+    model.predict(pd.DataFrame(np.zeros((1, len(features))), columns=features))
+    return model, features, build_compiled_model(model, features, cache_dir)
+
+def compiled_cache_dir(path):
+    """Direktori cache .npy evaluator compiled untuk versi file model ini."""
+    stat = os.stat(path)
+    return f"{path}.compiled-{stat.st_size}-{stat.st_mtime_ns}"
+
+def load_or_compile(model, cache_dir):
+    """Evaluator compiled dari cache .npy (mmap, dibagi antar proses), atau dikompilasi lalu disimpan."""
+    if cache_dir is None:
+        return compile_isolation_forest(model)
+    compiled = load_compiled(cache_dir)
+    if compiled is not None:
+        return compiled
+    compiled = compile_isolation_forest(model)
+    if compiled is None:
+        return None
+    try:
+        save_compiled(compiled, cache_dir)
+        # Cache versi lama file model ini tidak dipakai lagi (mmap yang masih
+        # terbuka di proses lain tetap valid setelah file dihapus)
+        parent, current = os.path.split(os.path.abspath(cache_dir))
+        prefix = current[:current.rindex('.compiled-') + len('.compiled-')]
+        for name in os.listdir(parent):
+            if name.startswith(prefix) and name != current and '.tmp' not in name:
+                shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+        return load_compiled(cache_dir)
+    except OSError as e:
+        print(f"[WARN] Cache evaluator compiled tidak bisa disimpan di '{cache_dir}': {e}")
+        return compiled
+
+def make_verification_matrix(features, n_rows):
+    """Set uji sintetis (seed tetap) dengan rentang nilai yang realistis untuk sensor DHT."""
+    rng = np.random.default_rng(42)
+    matrix = np.zeros((n_rows, len(features)), dtype=np.float64)
+    base_ranges = {
+        'temperature': (10.0, 45.0),
+        'humidity': (20.0, 100.0),
+    }
+    base_integers = {'hour': 24, 'dayofweek': 7, 'minute': 60}
+    device_columns = [i for i, f in enumerate(features) if f.startswith(DEVICE_FEATURE_PREFIX)]
+
+    for i, feature in enumerate(features):
+        if feature in base_ranges:
+            # Dibulatkan ke resolusi sensor (0.1) agar banyak nilai jatuh tepat di threshold
+            matrix[:, i] = np.round(rng.uniform(*base_ranges[feature], n_rows), 1)
+        elif feature in base_integers:
+            matrix[:, i] = rng.integers(0, base_integers[feature], n_rows)
+    if device_columns:
+        matrix[np.arange(n_rows), rng.choice(device_columns, n_rows)] = 1
+    return matrix
+
+def build_compiled_model(model, features, cache_dir=None):
+    """
+    Membuat (atau memuat dari cache .npy) dan memverifikasi evaluator compiled;
+    None jika tidak dipakai. Hasil dari cache juga diverifikasi.
+    """
+    if not USE_COMPILED_MODEL:
+        return None
+    try:
+        compiled = load_or_compile(model, cache_dir)
+        if compiled is None:
+            print("[INFO] Tipe model tidak didukung evaluator compiled, memakai MODEL.predict.")
+            return None
+        test_df = pd.DataFrame(make_verification_matrix(features, COMPILED_VERIFY_ROWS), columns=features)
+        dense_columns, device_columns = build_feature_lookup(features)
+        if not verify_compiled_model(compiled, model, test_df, dense_columns, list(device_columns.values())):
+            print("[WARN] Hasil evaluator compiled berbeda dengan MODEL.predict, memakai MODEL.predict.")
+            return None
+    except Exception as e:
+        print(f"[WARN] Gagal membuat evaluator compiled, memakai MODEL.predict: {e}")
+        return None
+
+    print(f"[INFO] Evaluator compiled aktif ({compiled.n_trees} pohon, terverifikasi pada {COMPILED_VERIFY_ROWS} baris uji).")
+    return compiled
+
+def install_model(model, features, mtime=None, compiled=None):
+    """Memasang model sebagai model aktif (dipanggil di antara batch)."""
+    global MODEL, COMPILED_MODEL, MODEL_FEATURES_LIST, FEATURE_INDEX, MODEL_FILE_MTIME, ACTIVE_SHARD
+
+    MODEL = model
+    COMPILED_MODEL = compiled
+    MODEL_FEATURES_LIST = features
+    FEATURE_INDEX = {feature: i for i, feature in enumerate(features)}
+    MODEL_FILE_MTIME = mtime
+    ACTIVE_SHARD = make_model_shard(model, features, compiled, mtime)
+    # Hasil prediksi model lama tidak berlaku lagi
+    if PREDICTION_CACHE is not None:
+        PREDICTION_CACHE.clear()
+
+def estimate_model_bytes(model, compiled):
+    """Perkiraan memori model: array node setiap pohon + array evaluator compiled."""
+    total = 0
+    for estimator in getattr(model, 'estimators_', []):
+        tree = estimator.tree_
+        total += sum(a.nbytes for a in (
+            tree.children_left, tree.children_right, tree.feature, tree.threshold,
+            tree.impurity, tree.n_node_samples, tree.weighted_n_node_samples, tree.value,
+        ))
+    if compiled is not None:
+        total += sum(a.nbytes for a in (
+            compiled.feature, compiled.threshold, compiled.children,
+            compiled.missing_right, compiled.path_length,
+        ))
+    return total
+
+def make_model_shard(model, features, compiled, mtime=None):
+    """Membungkus model + tabel lookup fiturnya menjadi ModelShard."""
+    dense_columns, device_columns = build_feature_lookup(features)
+    shard = ModelShard(
+        model, features, compiled, dense_columns, device_columns,
+        estimate_model_bytes(model, compiled), mtime,
+    )
+    # Model grup yang dimuat ulang mendapat penanda baru, jadi entri cache
+    # versi lamanya tidak pernah cocok lagi dan akan keluar dengan sendirinya (LRU)
+    shard.cache_token = next(_cache_tokens)
+    shard.uses_rolling = uses_rolling_features(features)
+    return shard
+
+def load_model_shard(path):
+    """Loader untuk ShardedModelStore: muat + validasi satu file model grup."""
+    model, features, compiled = read_model_file(path)
+    return make_model_shard(model, features, compiled)
+
+def init_model_shards():
+    """Menyiapkan cache model per grup jika MODEL_SHARD_DIR diset."""
+    global MODEL_SHARDS
+    if not MODEL_SHARD_DIR:
+        MODEL_SHARDS = None
+        return
+    MODEL_SHARDS = ShardedModelStore(
+        MODEL_SHARD_DIR, MODEL_SHARD_MEMORY_BUDGET_MB * 1024 * 1024, load_model_shard
+    )
+    print(f"[INFO] Model per grup dari '{MODEL_SHARD_DIR}' ({len(MODEL_SHARDS.device_to_key)} device terpetakan), anggaran {MODEL_SHARD_MEMORY_BUDGET_MB} MB.")
+
 def load_model_and_features():
     """
     Memuat model tunggal dan daftar fitur yang disimpannya.
     """
-    global MODEL, MODEL_FEATURES_LIST
-    
     print(f"[INFO] Memuat model AI dari file: {MODEL_FILE_PATH}...")
     try:
         if not os.path.exists(MODEL_FILE_PATH):
             print(f"[FATAL ERROR] File model tidak ditemukan di: '{MODEL_FILE_PATH}'")
             return False
             
-        MODEL = joblib.load(MODEL_FILE_PATH)
-        
-        # Ini adalah bagian terpenting:
-        # Mengambil daftar fitur yang disimpan di dalam model
-        MODEL_FEATURES_LIST = MODEL.feature_names_
+        mtime = os.path.getmtime(MODEL_FILE_PATH)
+        model, features, compiled = read_model_file(MODEL_FILE_PATH)
+        install_model(model, features, mtime, compiled)
         
         print(f"[SUCCESS] Model '{MODEL_FILE_PATH}' berhasil dimuat.")
         print(f"[INFO] Model ini dilatih dengan {len(MODEL_FEATURES_LIST)} fitur:")
@@ -79,128 +493,741 @@ def load_model_and_features():
         print(f"[FATAL ERROR] Gagal memuat model: {e}")
         return False
 
+def load_models():
+    """
+    Memuat model saat start: model tunggal dan (jika diset) cache model per grup.
+    Dengan MODEL_SHARD_DIR, model tunggal hanya cadangan dan boleh tidak ada.
+    """
+    init_model_shards()
+    if load_model_and_features():
+        return True
+    if MODEL_SHARDS is not None:
+        print("[WARN] Model tunggal tidak tersedia; hanya memakai model per grup.")
+        print("       Bacaan dari grup tanpa file model tidak dinilai sampai file modelnya tersedia.")
+        return True
+    return False
+
+def watch_model_file(stop_event):
+    """
+    Loop watcher (thread background): jika file model berubah, muat & validasi
+    model baru lalu simpan sebagai _pending_model. Model TIDAK ditukar di sini.
+    """
+    global _pending_model
+    last_seen_mtime = MODEL_FILE_MTIME
+
+    while not stop_event.wait(MODEL_RELOAD_CHECK_INTERVAL):
+        try:
+            mtime = os.path.getmtime(MODEL_FILE_PATH)
+        except OSError:
+            continue
+        if mtime == last_seen_mtime:
+            continue
+        last_seen_mtime = mtime
+
+        print(f"\n[INFO] File model berubah, memuat ulang '{MODEL_FILE_PATH}' di background...")
+        try:
+            model, features, compiled = read_model_file(MODEL_FILE_PATH)
+        except AttributeError:
+            print("[ERROR] Model baru tidak memiliki feature_names_. Tetap memakai model lama.")
+            continue
+        except Exception as e:
+            print(f"[ERROR] Model baru gagal dimuat/divalidasi: {e}. Tetap memakai model lama.")
+            continue
+
+        with _pending_model_lock:
+            _pending_model = (model, features, mtime, compiled)
+
+def start_model_watcher():
+    """Menjalankan watch_model_file di thread daemon dan mengembalikan (thread, stop_event)."""
+    stop_event = threading.Event()
+    t = threading.Thread(target=watch_model_file, args=(stop_event,), daemon=True, name='model-watcher')
+    t.start()
+    return t, stop_event
+
+def apply_pending_model():
+    """Menukar model aktif dengan model baru dari watcher (jika ada). Aman dipanggil di antara batch."""
+    global _pending_model
+    with _pending_model_lock:
+        pending, _pending_model = _pending_model, None
+    if pending is None:
+        return False
+
+    model, features, mtime, compiled = pending
+    if features != MODEL_FEATURES_LIST:
+        print(f"[WARN] Daftar fitur model baru berbeda ({len(features)} fitur): {features}")
+    install_model(model, features, mtime, compiled)
+    print(f"[SUCCESS] Model baru dipasang tanpa restart ({len(features)} fitur).")
+    return True
+
+# --- METRIK ---
+def measure(stage):
+    """Context manager pengukur durasi tahap; tidak melakukan apa-apa tanpa METRICS."""
+    return METRICS.time_stage(stage) if METRICS is not None else contextlib.nullcontext()
+
+def init_metrics(port):
+    """Menyiapkan METRICS dan endpoint HTTP Prometheus (port 0 = nonaktif)."""
+    global METRICS
+    if not port:
+        return
+    METRICS = EngineMetrics(multiprocessing.current_process().name)
+    if PREDICTION_CACHE is not None:
+        METRICS.add_collector('safe_ai_prediction_cache_hits_total', 'counter',
+                              'Prediksi yang diambil dari cache.', lambda: PREDICTION_CACHE.hits)
+        METRICS.add_collector('safe_ai_prediction_cache_misses_total', 'counter',
+                              'Prediksi yang harus dihitung model.', lambda: PREDICTION_CACHE.misses)
+        METRICS.add_collector('safe_ai_prediction_cache_entries', 'gauge',
+                              'Jumlah entri di cache prediksi.', lambda: len(PREDICTION_CACHE))
+    METRICS.add_collector('safe_ai_model_shards_loaded', 'gauge', 'Model grup yang sedang dimuat.',
+                          lambda: len(MODEL_SHARDS) if MODEL_SHARDS is not None else None)
+    METRICS.add_collector('safe_ai_model_shard_evictions_total', 'counter', 'Model grup yang dikeluarkan (LRU).',
+                          lambda: MODEL_SHARDS.evictions if MODEL_SHARDS is not None else None)
+    try:
+        start_metrics_server(METRICS, METRICS_HOST, port)
+        print(f"[INFO] Endpoint metrik: http://{METRICS_HOST}:{port}/metrics")
+    except OSError as e:
+        print(f"[WARN] Endpoint metrik gagal dijalankan di port {port}: {e}")
+
+def update_backlog_metrics(cur):
+    """Mencatat jumlah baris yang belum dinilai dan umur baris tertua (detik)."""
+    cur.execute("""
+        SELECT COUNT(*) AS backlog,
+               EXTRACT(EPOCH FROM NOW() - MIN(timestamp_utc)) AS oldest_age
+        FROM sensor_readings
+        WHERE is_anomaly IS NULL;
+    """)
+    record = cur.fetchone()
+    METRICS.set_gauge('safe_ai_backlog_rows', record['backlog'])
+    METRICS.set_gauge('safe_ai_backlog_oldest_age_seconds', float(record['oldest_age'] or 0))
+
+def record_batch_metrics(rows, results):
+    """Jumlah baris/batch dan lag penilaian (sekarang - timestamp bacaan tertua di batch)."""
+    METRICS.inc('safe_ai_batches_total')
+    METRICS.inc('safe_ai_rows_fetched_total', len(rows))
+    METRICS.inc('safe_ai_rows_scored_total', len(results))
+    METRICS.inc('safe_ai_anomalies_total', sum(1 for _, is_anomaly in results if is_anomaly))
+    oldest = min(row['timestamp_utc'] for row in rows)
+    if oldest.tzinfo is None:
+        oldest = oldest.replace(tzinfo=timezone.utc)
+    METRICS.set_gauge('safe_ai_scoring_lag_seconds', (datetime.now(timezone.utc) - oldest).total_seconds())
+    METRICS.set_gauge('safe_ai_last_batch_timestamp_seconds', time.time())
+
 # --- FEATURE ENGINEERING (BARU) ---
-def create_features_for_prediction(data_row):
+# Cara mengambil nilai setiap fitur dasar dari satu baris database
+BASE_FEATURE_GETTERS = {
+    'temperature': lambda r: r['temperature'],
+    'humidity': lambda r: r['humidity'],
+    'hour': lambda r: r['timestamp_utc'].hour,
+    'dayofweek': lambda r: r['timestamp_utc'].weekday(),
+    'minute': lambda r: r['timestamp_utc'].minute,
+}
+# Fitur rolling sudah ditambahkan ke baris oleh FEATURE_STORE.update_rows
+ROLLING_FEATURE_NAMES = frozenset(rolling_feature_names())
+for _name in ROLLING_FEATURE_NAMES:
+    BASE_FEATURE_GETTERS[_name] = lambda r, name=_name: r.get(name, 0.0)
+
+def uses_rolling_features(features):
+    """True jika daftar fitur model memuat fitur rolling (temperature_roll_mean, dst.)."""
+    return not ROLLING_FEATURE_NAMES.isdisjoint(features)
+
+def update_rolling_features(rows, shards):
     """
-    Membuat DataFrame 1 baris yang cocok dengan fitur yang diharapkan model,
-    termasuk One-Hot Encoding untuk device_id.
+    Memperbarui jendela rolling untuk batch ini. Jendela baru dibuat (dan diisi
+    dari DB) saat pertama ada model di 'shards' yang memakai fitur rolling;
+    setelah itu semua baris ikut diperbarui agar jendela setiap device tetap utuh.
+    """
+    if FEATURE_STORE is None:
+        if not any(shard is not None and shard.uses_rolling for shard in shards):
+            return
+        init_feature_store()
+        if FEATURE_STORE is None:
+            return
+    with measure('rolling_features'):
+        FEATURE_STORE.update_rows(rows)
+
+def init_feature_store(warm_start=True):
+    """
+    Menyiapkan FEATURE_STORE dan (opsional) mengisi jendelanya dari bacaan
+    terbaru yang sudah dinilai, maks. ROLLING_WINDOW_SIZE bacaan per device.
     """
-    global MODEL_FEATURES_LIST
-    
+    global FEATURE_STORE
+    if not ROLLING_FEATURES_ENABLED:
+        FEATURE_STORE = None
+        return
+    FEATURE_STORE = RollingFeatureStore(ROLLING_WINDOW_SIZE, ROLLING_EWMA_ALPHA)
+    if not warm_start:
+        return
+
+    conn, cur = get_db_connection()
+    if not conn:
+        print("[WARN] Warm-start fitur rolling dilewati (koneksi DB gagal).")
+        return
     try:
-        # 1. Ambil data mentah dari baris database
-        device_id = data_row['device_id']
-        dt_object = data_row['timestamp_utc']
+        cur.execute("""
+            SELECT device_id, timestamp_utc, temperature, humidity
+            FROM (
+                SELECT device_id, timestamp_utc, temperature, humidity,
+                       ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY timestamp_utc DESC) AS rn
+                FROM sensor_readings
+                WHERE is_anomaly IS NOT NULL
+                  AND device_id IS NOT NULL
+                  AND timestamp_utc >= NOW() - make_interval(hours => %s)
+            ) AS recent
+            WHERE rn <= %s
+            ORDER BY timestamp_utc ASC;
+        """, (ROLLING_WARM_START_HOURS, ROLLING_WINDOW_SIZE))
+        FEATURE_STORE.warm_start(cur.fetchall())
+        print(f"[INFO] Fitur rolling: jendela {len(FEATURE_STORE)} device diisi dari database.")
+    except psycopg2.Error as e:
+        print(f"[WARN] Warm-start fitur rolling gagal: {e}")
+    finally:
+        cur.close()
+        conn.close()
 
-        # 2. Buat dictionary fitur, mulai dengan SEMUA fitur = 0
-        feature_dict = {feature: 0 for feature in MODEL_FEATURES_LIST}
-        
-        # 3. Isi fitur-fitur dasar (Time-based dan sensor)
-        # Gunakan 'if' untuk jaga-jaga jika model tidak dilatih dengan fitur tsb
-        if 'temperature' in feature_dict:
-            feature_dict['temperature'] = data_row['temperature']
-        if 'humidity' in feature_dict:
-            feature_dict['humidity'] = data_row['humidity']
-        if 'hour' in feature_dict:
-            feature_dict['hour'] = dt_object.hour
-        if 'dayofweek' in feature_dict:
-            feature_dict['dayofweek'] = dt_object.weekday()
-        if 'minute' in feature_dict:
-            feature_dict['minute'] = dt_object.minute
-
-        # 4. Buat dan set fitur One-Hot Encoding
-        one_hot_feature_name = f"device_id_{device_id}"
-        
-        # Set kolom 'device_id_xxxx' yang relevan menjadi 1
-        if one_hot_feature_name in feature_dict:
-            feature_dict[one_hot_feature_name] = 1
+def build_feature_lookup(features):
+    """
+    Memisahkan daftar fitur model menjadi kolom non-device dan tabel
+    device_id -> indeks kolom One-Hot. Dihitung sekali per model.
+    """
+    dense_columns = []
+    device_columns = {}
+    for i, feature in enumerate(features):
+        if feature.startswith(DEVICE_FEATURE_PREFIX):
+            device_columns[feature[len(DEVICE_FEATURE_PREFIX):]] = i
         else:
-            # Ini terjadi jika data datang dari device_id baru
-            # yang tidak ada saat model dilatih.
-            print(f"[WARN] Device '{device_id}' (dari baris ID {data_row['id']}) tidak dikenal oleh model.")
+            dense_columns.append(i)
+    return dense_columns, device_columns
+
+def encode_batch(rows, shard=None):
+    """
+    Encoding terindeks untuk satu batch: nilai fitur non-device disimpan rapat,
+    sedangkan One-Hot device hanya disimpan sebagai SATU indeks kolom per baris
+    (-1 jika device tidak dikenal). Biaya per baris tidak bergantung jumlah device.
+    Memakai tabel lookup dari 'shard' (default: model aktif).
+    Mengembalikan (dense, hot_columns, daftar ID baris yang valid).
+    """
+    shard = shard or ACTIVE_SHARD
+    valid_rows = []
+    for row in rows:
+        # Cek jika device_id ada
+        if not row['device_id']:
+            print(f"[WARN] Melewatkan data (ID: {row['id']}) karena 'device_id' kosong (NULL).")
+            continue
+        valid_rows.append(row)
+
+    dense = np.zeros((len(valid_rows), len(shard.dense_columns)), dtype=np.float64)
+    hot_columns = np.full(len(valid_rows), -1, dtype=np.intp)
+    if not valid_rows:
+        return dense, hot_columns, []
+
+    # 1. Isi fitur-fitur dasar per kolom (sekaligus untuk semua baris).
+    # Fitur non-device yang tidak dikenal tetap bernilai 0.
+    for position, col in enumerate(shard.dense_columns):
+        getter = BASE_FEATURE_GETTERS.get(shard.features[col])
+        if getter is not None:
+            dense[:, position] = [getter(r) for r in valid_rows]
+
+    # 2. Cari kolom One-Hot 'device_id_xxxx' lewat tabel lookup
+    for i, row in enumerate(valid_rows):
+        col = shard.device_columns.get(str(row['device_id']))
+        if col is not None:
+            hot_columns[i] = col
+        else:
+            print(f"[WARN] Device '{row['device_id']}' (dari baris ID {row['id']}) tidak dikenal oleh model.")
             print("       Hasil prediksi mungkin tidak akurat.")
 
-        # 5. Konversi ke DataFrame, pastikan urutan kolomnya BENAR
-        features_df = pd.DataFrame([feature_dict], columns=MODEL_FEATURES_LIST)
-        return features_df
+    return dense, hot_columns, [row['id'] for row in valid_rows]
+
+def expand_to_dense_matrix(dense, hot_columns, shard=None):
+    """Mengubah encoding terindeks menjadi matriks penuh (n_baris x n_fitur)."""
+    shard = shard or ACTIVE_SHARD
+    matrix = np.zeros((dense.shape[0], len(shard.features)), dtype=np.float64)
+    matrix[:, shard.dense_columns] = dense
+    known = hot_columns >= 0
+    matrix[np.flatnonzero(known), hot_columns[known]] = 1
+    return matrix
+
+def expand_to_sparse_matrix(dense, hot_columns, shard=None):
+    """Mengubah encoding terindeks menjadi matriks CSR (hanya sel bukan nol)."""
+    shard = shard or ACTIVE_SHARD
+    n_rows, n_dense = dense.shape
+    known = hot_columns >= 0
+    row_idx = np.concatenate((np.repeat(np.arange(n_rows), n_dense), np.flatnonzero(known)))
+    col_idx = np.concatenate((np.tile(shard.dense_columns, n_rows), hot_columns[known]))
+    values = np.concatenate((dense.ravel(), np.ones(known.sum())))
+    return scipy.sparse.csr_matrix((values, (row_idx, col_idx)), shape=(n_rows, len(shard.features)))
+
+def create_features_for_prediction(data_row):
+    """
+    Membuat DataFrame 1 baris yang cocok dengan fitur yang diharapkan model,
+    termasuk One-Hot Encoding untuk device_id.
+    """
+    try:
+        dense, hot_columns, row_ids = encode_batch([data_row])
+        if not row_ids:
+            return None
+        # Konversi ke DataFrame, pastikan urutan kolomnya BENAR
+        return pd.DataFrame(expand_to_dense_matrix(dense, hot_columns), columns=MODEL_FEATURES_LIST)
 
     except Exception as e:
         print(f"[ERROR] Gagal saat feature engineering (ID: {data_row.get('id')}): {e}")
         return None
 
+def create_feature_matrix(rows):
+    """
+    Membuat SATU matriks NumPy penuh untuk seluruh batch.
+    Mengembalikan (matriks, daftar ID baris yang valid).
+    """
+    dense, hot_columns, row_ids = encode_batch(rows)
+    return expand_to_dense_matrix(dense, hot_columns), row_ids
+
+def predict_encoded(dense, hot_columns, shard=None):
+    """Prediksi (-1/1) untuk batch dalam encoding terindeks."""
+    shard = shard or ACTIVE_SHARD
+    if shard.compiled is not None and dense.shape[0] <= COMPILED_MAX_BATCH_ROWS:
+        # Evaluator compiled membaca indeks device langsung, tanpa matriks One-Hot
+        return shard.compiled.predict_indexed(dense, shard.dense_columns, hot_columns)
+
+    if len(shard.device_columns) >= SPARSE_MIN_DEVICES:
+        # Urutan kolom CSR sudah sama dengan daftar fitur model, jadi peringatan
+        # sklearn soal nama fitur (input bukan DataFrame) aman diabaikan
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='X does not have valid feature names')
+            return shard.model.predict(expand_to_sparse_matrix(dense, hot_columns, shard))
+
+    # DataFrame dibuat sekali per batch agar nama fitur tetap cocok dengan model
+    features_df = pd.DataFrame(expand_to_dense_matrix(dense, hot_columns, shard), columns=shard.features)
+    return shard.model.predict(features_df)
+
+def predict_rows_with_shard(rows, shard):
+    """Prediksi sekelompok baris dengan satu model. Mengembalikan list (id, is_anomaly)."""
+    with measure('features'):
+        dense, hot_columns, row_ids = encode_batch(rows, shard)
+    if not row_ids:
+        return []
+
+    with measure('predict'):
+        if PREDICTION_CACHE is None:
+            predictions = predict_encoded(dense, hot_columns, shard)
+        else:
+            predictions = predict_encoded_cached(dense, hot_columns, shard)
+    return [(row_id, bool(pred == -1)) for row_id, pred in zip(row_ids, predictions)]
+
+def predict_encoded_cached(dense, hot_columns, shard):
+    """
+    predict_encoded dengan PREDICTION_CACHE: hanya baris yang vektor fiturnya
+    belum pernah dilihat (untuk model ini) yang dikirim ke model.
+    """
+    # Kunci = penanda model + byte persis dari (fitur dense, kolom device)
+    encoded = np.ascontiguousarray(np.column_stack((dense, hot_columns.astype(np.float64))))
+    keys = [(shard.cache_token, encoded[i].tobytes()) for i in range(encoded.shape[0])]
+
+    predictions = np.empty(len(keys), dtype=int)
+    # Vektor yang belum ada di cache: kunci -> semua posisinya di batch ini,
+    # sehingga vektor yang berulang di dalam batch cukup diprediksi sekali
+    misses = {}
+    for i, key in enumerate(keys):
+        if key in misses:
+            # Duplikat di dalam batch juga tidak dikirim ke model: hitung sebagai hit
+            misses[key].append(i)
+            PREDICTION_CACHE.hits += 1
+            continue
+        cached = PREDICTION_CACHE.get(key)
+        if cached is None:
+            misses[key] = [i]
+        else:
+            predictions[i] = cached
+
+    if misses:
+        first_positions = [positions[0] for positions in misses.values()]
+        fresh = predict_encoded(dense[first_positions], hot_columns[first_positions], shard)
+        for (key, positions), prediction in zip(misses.items(), fresh):
+            predictions[positions] = prediction
+            PREDICTION_CACHE.put(key, int(prediction))
+    return predictions
+
+def predict_batch(rows):
+    """
+    Memprediksi seluruh batch. Dengan model tunggal: SATU panggilan prediksi.
+    Dengan MODEL_SHARD_DIR: baris dikelompokkan per model grup dulu, lalu
+    setiap kelompok diprediksi sekaligus dengan modelnya.
+    Mengembalikan list (id, is_anomaly) untuk baris yang valid.
+    """
+    # Jendela rolling per device (urut waktu) diperbarui sebelum encoding
+    if MODEL_SHARDS is None:
+        update_rolling_features(rows, (ACTIVE_SHARD,))
+        return predict_rows_with_shard(rows, ACTIVE_SHARD)
+
+    groups = {}
+    for row in rows:
+        groups.setdefault(MODEL_SHARDS.key_for(row['device_id']), []).append(row)
+    # Tanpa file model untuk grup ini, pakai model tunggal sebagai cadangan
+    shards = {key: MODEL_SHARDS.get(key) or ACTIVE_SHARD for key in groups}
+    update_rolling_features(rows, shards.values())
+
+    results = []
+    for key, group_rows in groups.items():
+        shard = shards[key]
+        if shard is None:
+            warn_missing_shard(key, len(group_rows))
+            continue
+        results.extend(predict_rows_with_shard(group_rows, shard))
+    return results
+
+def warn_missing_shard(key, n_rows):
+    """Peringatan grup tanpa model, paling sering sekali per UNSCORABLE_RETRY_INTERVAL per grup."""
+    now = time.monotonic()
+    last = _missing_shard_warned.get(key)
+    if last is not None and now - last < UNSCORABLE_RETRY_INTERVAL:
+        return
+    _missing_shard_warned[key] = now
+    print(f"[WARN] Tidak ada model untuk grup '{key}' (dan tidak ada model tunggal), {n_rows} baris dilewati.")
+
+def update_anomaly_flags(cur, results, device_ids=()):
+    """
+    Menulis semua hasil prediksi ke database dalam SATU statement UPDATE.
+    device_ids (device dari baris batch) dikirim ke cache latest_data api_server.
+    """
+    if not results:
+        return
+    row_ids = [row_id for row_id, _ in results]
+    flags = [is_anomaly for _, is_anomaly in results]
+    cur.execute("EXECUTE update_anomaly(%s, %s);", (row_ids, flags))
+    # Dalam transaksi yang sama: baru terkirim saat commit
+    for payload in device_notify_payloads(device_ids):
+        cur.execute("SELECT pg_notify(%s, %s);", (SCORED_NOTIFY_CHANNEL, payload))
+
+def fetch_pending_rows(cur):
+    """Mengambil (dan mengunci) satu batch data yang belum diproses."""
+    cur.execute("EXECUTE fetch_pending(%s, %s::varchar[]);", (BATCH_SIZE, parked_device_ids()))
+    return cur.fetchall()
+
+def parked_device_ids():
+    """Device yang sedang dikeluarkan dari klaim; yang masa parkirnya habis dilepas."""
+    now = time.monotonic()
+    for device_id, retry_at in list(UNSCORABLE_DEVICES.items()):
+        if retry_at <= now:
+            del UNSCORABLE_DEVICES[device_id]
+    return list(UNSCORABLE_DEVICES)
+
+def park_unscorable_rows(rows, results):
+    """
+    Memarkir device dari baris batch yang tidak mendapat hasil prediksi.
+    Mengembalikan jumlah baris tersebut.
+    """
+    scored = {row_id for row_id, _ in results}
+    unscored = [row for row in rows if row['id'] not in scored]
+    if unscored:
+        retry_at = time.monotonic() + UNSCORABLE_RETRY_INTERVAL
+        devices = {str(row['device_id']) for row in unscored}
+        for device_id in devices:
+            UNSCORABLE_DEVICES[device_id] = retry_at
+        print(f"[WARN] {len(unscored)} baris tidak bisa dinilai; {len(devices)} device dilewati "
+              f"selama {UNSCORABLE_RETRY_INTERVAL} detik.")
+    return len(unscored)
+
 # --- FUNGSI UTAMA AI ENGINE ---
-def run_ai_engine():
-    """Fungsi utama untuk memproses data baru."""
-    
+def run_ai_engine(metrics_port=METRICS_PORT, shared_stream=False):
+    """
+    Fungsi utama untuk memproses data baru. shared_stream=True jika proses lain
+    ikut mengklaim baris dari tabel yang sama (--workers > 1).
+    """
+    global ROLLING_FEATURES_UNSUPPORTED
+    if shared_stream:
+        ROLLING_FEATURES_UNSUPPORTED = WORKERS_ROLLING_REASON
+
     # Muat model saat start. Jika gagal, skrip berhenti.
-    if not load_model_and_features():
+    if not load_models():
         print("[INFO] AI Engine berhenti karena model gagal dimuat.")
         return
+    init_metrics(metrics_port)
+
+    print(f"\n[INFO] AI Engine (Single-Model) dimulai [{multiprocessing.current_process().name}]. Menunggu data baru...")
+
+    listen_conn = open_listen_connection() if USE_NOTIFY else None
 
-    print("\n[INFO] AI Engine (Single-Model) dimulai. Menunggu data baru...")
+    if MODEL_RELOAD_CHECK_INTERVAL > 0:
+        start_model_watcher()
+
+    # Koneksi kerja dibuka sekali dan dipakai ulang; dibuka ulang jika terputus
+    conn, cur = None, None
+    last_used = 0.0
+    last_backlog_check = 0.0
 
     while True:
-        conn, cur = None, None
+        # Jeda setelah iterasi ini (detik); 0 berarti langsung lanjut
+        wait_seconds = 0
         try:
-            conn, cur = get_db_connection()
-            if not conn:
-                print("[WARN] Koneksi DB gagal, mencoba lagi...")
-                time.sleep(POLL_INTERVAL)
-                continue
+            # Tukar model (jika watcher sudah menyiapkan versi baru) di antara batch
+            apply_pending_model()
 
-            # Ambil data yang belum diproses (HARUS menyertakan 'device_id')
-            cur.execute("""
-                SELECT id, timestamp_utc, temperature, humidity, device_id
-                FROM sensor_readings
-                WHERE is_anomaly IS NULL
-                ORDER BY timestamp_utc ASC
-                LIMIT 100;
-            """)
-            new_rows = cur.fetchall()
+            if conn is not None and time.monotonic() - last_used > HEALTH_CHECK_INTERVAL:
+                if not is_connection_healthy(conn, cur):
+                    print("\n[WARN] Koneksi DB tidak sehat, membuka ulang...")
+                    close_engine_connection(conn, cur)
+                    conn, cur = None, None
+
+            if conn is None:
+                conn, cur = get_engine_connection()
+                if not conn:
+                    print("[WARN] Koneksi DB gagal, mencoba lagi...")
+                    wait_seconds = POLL_INTERVAL
+                    continue
+
+            # Ambil data yang belum diproses dan belum diklaim worker lain
+            with measure('fetch'):
+                new_rows = fetch_pending_rows(cur)
+            last_used = time.monotonic()
+
+            if METRICS is not None and last_used - last_backlog_check >= METRICS_BACKLOG_INTERVAL:
+                update_backlog_metrics(cur)
+                last_backlog_check = last_used
 
             if not new_rows:
-                print(f"Tidak ada data baru. Tidur selama {POLL_INTERVAL} detik...", end="\r")
-                time.sleep(POLL_INTERVAL)
+                # Akhiri transaksi kosong agar koneksi tidak 'idle in transaction'
+                conn.rollback()
+                print(f"Tidak ada data baru. Menunggu notifikasi (maks. {POLL_INTERVAL} detik)...", end="\r")
+                listen_conn = wait_for_new_data(listen_conn, POLL_INTERVAL)
                 continue
 
             print(f"\n[INFO] Ditemukan {len(new_rows)} data baru. Memproses...")
 
-            for row in new_rows:
-                # Cek jika device_id ada
-                if not row['device_id']:
-                    print(f"[WARN] Melewatkan data (ID: {row['id']}) karena 'device_id' kosong (NULL).")
-                    continue
-                    
-                # Buat Fitur (Metode One-Hot Encoding)
-                features_df = create_features_for_prediction(row)
-                if features_df is None:
-                    print(f"Melewatkan data (ID: {row['id']}) karena error feature engineering.")
-                    continue
+            # Feature engineering + prediksi + update untuk seluruh batch sekaligus
+            results = predict_batch(new_rows)
+            with measure('write'):
+                update_anomaly_flags(cur, results, (row['device_id'] for row in new_rows))
+                conn.commit()
+            unscorable = park_unscorable_rows(new_rows, results)
+            if METRICS is not None:
+                record_batch_metrics(new_rows, results)
+                METRICS.inc('safe_ai_rows_unscorable_total', unscorable)
+            print(f"[SUCCESS] Berhasil memproses dan update {len(results)} dari {len(new_rows)} baris data.")
+            if PREDICTION_CACHE is not None:
+                print(f"[INFO] Cache prediksi: {PREDICTION_CACHE.hits} hit / {PREDICTION_CACHE.misses} miss ({PREDICTION_CACHE.hit_rate():.0%}), {len(PREDICTION_CACHE)} entri.")
 
-                # Lakukan Prediksi (Menggunakan model tunggal)
-                prediction = MODEL.predict(features_df)[0]
-                is_anomaly_bool = True if prediction == -1 else False
-
-                # Update Database
-                cur.execute("""
-                    UPDATE sensor_readings
-                    SET is_anomaly = %s
-                    WHERE id = %s;
-                """, (is_anomaly_bool, row['id']))
-            
-            conn.commit()
-            print(f"[SUCCESS] Berhasil memproses dan update {len(new_rows)} baris data.")
+            # Tanpa LISTEN, beri jeda singkat seperti sebelumnya
+            if listen_conn is None:
+                wait_seconds = 2
 
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as conn_err:
+            # Koneksi putus: buang dan sambung ulang pada iterasi berikutnya
+            print(f"\n[ERROR] Koneksi database terputus: {conn_err}")
+            close_engine_connection(conn, cur)
+            conn, cur = None, None
+            wait_seconds = 2
         except psycopg2.Error as db_err:
             print(f"\n[ERROR] Database error: {db_err}")
             if conn: conn.rollback()
+            wait_seconds = 2
         except Exception as e:
             print(f"\n[ERROR] Terjadi error tidak terduga: {e}")
+            if conn and not conn.closed: conn.rollback()
+            wait_seconds = 2
         finally:
-            if cur: cur.close()
-            if conn: conn.close()
-            time.sleep(2) 
+            if wait_seconds:
+                time.sleep(wait_seconds)
+
+# --- RESCORE DATA HISTORIS ---
+RESCORE_ROLLING_REASON = "rescore (chunk dibagi ke banyak proses, tidak urut per device)"
+
+def _init_rescore_worker():
+    """Initializer Pool: setiap proses memuat model satu kali."""
+    global ROLLING_FEATURES_UNSUPPORTED
+    ROLLING_FEATURES_UNSUPPORTED = RESCORE_ROLLING_REASON
+    if not load_models():
+        raise RuntimeError("Model gagal dimuat di proses rescore.")
+
+def _score_chunk(rows):
+    """Dijalankan di proses Pool: prediksi satu chunk, kembalikan (id_terakhir, hasil, device)."""
+    return rows[-1]['id'], predict_batch(rows), {row['device_id'] for row in rows}
+
+def load_rescore_checkpoint(filters):
+    """Membaca checkpoint; hanya dipakai jika filternya sama dengan run sekarang."""
+    if not os.path.exists(RESCORE_CHECKPOINT_FILE):
+        return 0, 0
+    with open(RESCORE_CHECKPOINT_FILE) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('filters') != filters:
+        print("[WARN] Checkpoint dibuat dengan filter berbeda, mulai dari awal.")
+        return 0, 0
+    return checkpoint['last_id'], checkpoint['processed']
+
+def save_rescore_checkpoint(filters, last_id, processed):
+    """Menyimpan checkpoint secara atomik (tulis file sementara lalu rename)."""
+    tmp_path = RESCORE_CHECKPOINT_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'filters': filters, 'last_id': last_id, 'processed': processed}, f)
+    os.replace(tmp_path, RESCORE_CHECKPOINT_FILE)
+
+def iter_rescore_chunks(read_conn, filters, last_id):
+    """
+    Membaca sensor_readings lewat server-side (named) cursor, urut berdasarkan id,
+    dan menghasilkan chunk berisi list dict biasa (agar bisa dikirim ke Pool).
+    """
+    conditions = ["id > %s"]
+    params = [last_id]
+    if filters['start']:
+        conditions.append("timestamp_utc >= %s")
+        params.append(filters['start'])
+    if filters['end']:
+        conditions.append("timestamp_utc < %s")
+        params.append(filters['end'])
+    if filters['devices']:
+        conditions.append("device_id = ANY(%s)")
+        params.append(filters['devices'])
+
+    cur = read_conn.cursor(name='rescore_stream', cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.itersize = RESCORE_CHUNK_SIZE
+    try:
+        cur.execute(f"""
+            SELECT id, timestamp_utc, temperature, humidity, device_id
+            FROM sensor_readings
+            WHERE {' AND '.join(conditions)}
+            ORDER BY id ASC;
+        """, params)
+        while True:
+            rows = cur.fetchmany(RESCORE_CHUNK_SIZE)
+            if not rows:
+                break
+            yield [dict(row) for row in rows]
+    finally:
+        cur.close()
+
+def run_rescore(start=None, end=None, devices=None, num_workers=1, resume=False):
+    """
+    Menilai ulang data historis dengan model yang sedang dipakai.
+    Chunk diprediksi paralel di Pool, lalu ditulis balik per chunk dalam satu
+    UPDATE massal; checkpoint disimpan setelah setiap chunk berhasil di-COMMIT.
+    """
+    global ROLLING_FEATURES_UNSUPPORTED
+    filters = {'start': start, 'end': end, 'devices': sorted(devices) if devices else None}
+    last_id, processed = load_rescore_checkpoint(filters) if resume else (0, 0)
+    if last_id:
+        print(f"[INFO] Melanjutkan rescore dari id > {last_id} ({processed} baris sudah diproses).")
+
+    # Cek model di proses induk dulu: initializer Pool yang gagal akan diulang terus
+    ROLLING_FEATURES_UNSUPPORTED = RESCORE_ROLLING_REASON
+    if not load_models():
+        print("[ERROR] Rescore dibatalkan karena model gagal dimuat.")
+        return
+
+    read_conn, _ = get_db_connection()
+    write_conn, write_cur = get_engine_connection()
+    if not read_conn or not write_conn:
+        print("[ERROR] Rescore dibatalkan karena koneksi DB gagal.")
+        return
+
+    print(f"[INFO] Rescore dimulai dengan {num_workers} proses, chunk {RESCORE_CHUNK_SIZE} baris, filter: {filters}")
+    started = time.monotonic()
+    max_in_flight = RESCORE_CHUNKS_IN_FLIGHT_PER_WORKER * num_workers
+
+    def write_result(result):
+        nonlocal last_id, processed
+        chunk_last_id, results, device_ids = result
+        update_anomaly_flags(write_cur, results, device_ids)
+        write_conn.commit()
+
+        last_id = chunk_last_id
+        processed += len(results)
+        save_rescore_checkpoint(filters, last_id, processed)
+
+        elapsed = time.monotonic() - started
+        print(f"[INFO] Rescore: {processed} baris (id <= {last_id}), {processed / max(elapsed, 1e-9):.0f} baris/detik", end="\r")
+
+    try:
+        with multiprocessing.Pool(num_workers, initializer=_init_rescore_worker) as pool:
+            # imap tidak punya backpressure (generator dibaca habis ke antrean tugas),
+            # jadi chunk dikirim dengan apply_async dalam jendela berukuran tetap.
+            # Hasil ditulis urut chunk (FIFO), jadi checkpoint last_id selalu naik.
+            in_flight = deque()
+            for chunk in iter_rescore_chunks(read_conn, filters, last_id):
+                in_flight.append(pool.apply_async(_score_chunk, (chunk,)))
+                del chunk
+                while len(in_flight) >= max_in_flight:
+                    write_result(in_flight.popleft().get())
+            while in_flight:
+                write_result(in_flight.popleft().get())
+        print(f"\n[SUCCESS] Rescore selesai: {processed} baris dalam {time.monotonic() - started:.1f} detik.")
+    except psycopg2.Error as db_err:
+        print(f"\n[ERROR] Database error saat rescore (lanjutkan dengan --resume): {db_err}")
+        write_conn.rollback()
+    except KeyboardInterrupt:
+        print(f"\n[INFO] Rescore dihentikan di id {last_id}. Lanjutkan dengan --resume.")
+    finally:
+        read_conn.close()
+        close_engine_connection(write_conn, write_cur)
+
+def run_workers(num_workers):
+    """
+    Menjalankan beberapa proses AI Engine sekaligus. Setiap proses memuat
+    modelnya sendiri satu kali, lalu mengklaim batch yang berbeda lewat
+    FOR UPDATE SKIP LOCKED sehingga tidak ada baris yang diproses dua kali.
+    """
+    print(f"[INFO] Menjalankan {num_workers} worker AI Engine...")
+    workers = [
+        multiprocessing.Process(
+            target=run_ai_engine, name=f"ai-worker-{i + 1}",
+            # Setiap worker punya endpoint metrik sendiri
+            args=(METRICS_PORT + i if METRICS_PORT else 0, True),
+        )
+        for i in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        print("\n[INFO] Menghentikan semua worker...")
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
 
 # --- Titik Masuk Script ---
 if __name__ == "__main__":
-    run_ai_engine()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="SAFE AI Engine - deteksi anomali data sensor.")
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='Jumlah proses worker paralel (default: 1).'
+    )
+    parser.add_argument(
+        '--rescore', action='store_true', default=False,
+        help='Nilai ulang data historis dengan model saat ini, lalu berhenti.'
+    )
+    parser.add_argument(
+        '--start', type=datetime.fromisoformat, default=None,
+        help='Rescore: batas awal timestamp_utc (ISO 8601, inklusif).'
+    )
+    parser.add_argument(
+        '--end', type=datetime.fromisoformat, default=None,
+        help='Rescore: batas akhir timestamp_utc (ISO 8601, eksklusif).'
+    )
+    parser.add_argument(
+        '--device', action='append', default=None,
+        help='Rescore: hanya device_id ini (boleh diulang).'
+    )
+    parser.add_argument(
+        '--resume', action='store_true', default=False,
+        help=f'Rescore: lanjutkan dari checkpoint {RESCORE_CHECKPOINT_FILE}.'
+    )
+    parser.add_argument(
+        '--model-dir', default=None,
+        help='Direktori model per device/grup (<kunci>.joblib + shards.json).'
+    )
+    args = parser.parse_args()
+
+    if args.model_dir:
+        MODEL_SHARD_DIR = args.model_dir
+
+    if args.rescore:
+        run_rescore(
+            start=args.start.isoformat() if args.start else None,
+            end=args.end.isoformat() if args.end else None,
+            devices=args.device,
+            num_workers=max(1, args.workers),
+            resume=args.resume,
+        )
+    elif args.workers > 1:
+        run_workers(args.workers)
+    else:
+        run_ai_engine()
\ No newline at end of file
@@ -1,7 +1,16 @@
 from flask import Flask, jsonify, request
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 from psycopg2.extras import RealDictCursor
 from datetime import datetime, timedelta, timezone 
+import base64
+import json
+import math
+import threading
+import time
+from latest_cache import LatestReadingCache, latest_record_to_data
+from downsampling import lttb_indices
 # CORS dihapus sesuai permintaan
 
 app = Flask(__name__)
@@ -13,70 +22,271 @@ DB_USER = "postgres"
 DB_PASS = "Naufal"
 client_encoding='UTF8'
 
+# --- KONFIGURASI CONNECTION POOL ---
+# Koneksi dipakai ulang antar request (per proses server); tidak ada connect per request
+DB_POOL_MIN = 2                  # Koneksi yang dibuka saat pool dibuat
+DB_POOL_MAX = 20                 # Batas koneksi per proses (thread menunggu jika habis)
+DB_POOL_TIMEOUT = 5              # Detik maks. menunggu koneksi bebas
+DB_POOL_HEALTH_CHECK_INTERVAL = 30  # Koneksi yang menganggur selama ini dicek dulu (SELECT 1)
+
+# --- KONFIGURASI CACHE latest_data ---
+# Bacaan terbaru per device disimpan di memori dan diperbarui lewat LISTEN/NOTIFY
+# (lihat latest_cache.py); endpoint tidak menyentuh database selama cache segar.
+LATEST_CACHE_ENABLED = True
+LATEST_CACHE_REFRESH_INTERVAL = 1.0  # Detik antar refresh penuh (semua device di cache), di luar notifikasi
+LATEST_CACHE_MAX_AGE = 3.0           # Refresh penuh terakhir lebih lama dari ini = basi, pakai database
+LATEST_CACHE_MAX_MISSING = 10000     # Device tanpa data yang diingat (LRU); sisanya query database
+LATEST_CACHE_RECONNECT_DELAY = 5
+
+# --- KONFIGURASI DATA HISTORIS ---
+HISTORICAL_DEFAULT_HOURS = 24       # Rentang jika ?start= tidak diberikan
+HISTORICAL_MAX_HOURS = 24 * 31       # Rentang maks. mode 'bucket'/'lttb' (mode 'raw' berhalaman, tanpa batas)
+HISTORICAL_DEFAULT_MODE = 'bucket'   # 'bucket' (min/avg/max per bucket), 'lttb', atau 'raw'
+HISTORICAL_DEFAULT_POINTS = 500      # Target jumlah titik grafik (?points=)
+HISTORICAL_MAX_POINTS = 5000
+HISTORICAL_PAGE_SIZE = 500           # Mode 'raw': baris per halaman (?limit=)
+HISTORICAL_MAX_PAGE_SIZE = 5000
+# ?start=/?end= berupa angka hanya dianggap epoch detik di rentang ini;
+# selain itu dibaca sebagai ISO 8601 (mis. 20250101 = 1 Januari 2025)
+HISTORICAL_MIN_EPOCH = 946684800     # 2000-01-01T00:00:00Z
+HISTORICAL_MAX_EPOCH = 4102444800    # 2100-01-01T00:00:00Z
+# Halaman mode 'raw' memakai keyset (timestamp_utc, id), bukan OFFSET; agar setiap
+# halaman cukup satu index range scan, buat sekali:
+#   CREATE INDEX CONCURRENTLY sensor_readings_ts_id_idx ON sensor_readings (timestamp_utc, id);
+#   CREATE INDEX CONCURRENTLY sensor_readings_device_ts_id_idx ON sensor_readings (device_id, timestamp_utc, id);
+# Mode 'lttb' memuat baris mentah ke memori; jika rentang berisi lebih dari ini
+# (dicek dulu dengan probe OFFSET, tanpa memuat barisnya), baris dirata-rata dulu
+# per bucket di SQL sebanyak nilai ini sebelum LTTB
+HISTORICAL_LTTB_MAX_SOURCE_ROWS = 100000
+
+# Bucket dihitung dari awal rentang ($1), bukan dari epoch 0: bucket pertama
+# selalu utuh dan jumlah bucket tepat `points`
+HISTORICAL_BUCKET_COLUMNS = """
+    EXTRACT(EPOCH FROM $1) + floor((EXTRACT(EPOCH FROM timestamp_utc) - EXTRACT(EPOCH FROM $1)) / $3) * $3 AS timestamp,
+    avg(temperature) AS temperature, avg(humidity) AS humidity, bool_or(is_anomaly) AS is_anomaly,
+    min(temperature) AS temperature_min, max(temperature) AS temperature_max,
+    min(humidity) AS humidity_min, max(humidity) AS humidity_max,
+    count(*) AS samples
+"""
+
+# Query endpoint yang di-PREPARE sekali per koneksi (nama -> SQL)
+PREPARED_STATEMENTS = {
+    'latest_all': """
+        SELECT id, EXTRACT(EPOCH FROM timestamp_utc) AS timestamp, temperature, humidity, device_id, is_anomaly
+        FROM sensor_readings
+        ORDER BY id DESC
+        LIMIT 1
+    """,
+    'latest_device(varchar)': """
+        SELECT id, EXTRACT(EPOCH FROM timestamp_utc) AS timestamp, temperature, humidity, device_id, is_anomaly
+        FROM sensor_readings
+        WHERE device_id = $1
+        ORDER BY id DESC
+        LIMIT 1
+    """,
+    'historical_raw_all(timestamptz, timestamptz, int)': """
+        SELECT EXTRACT(EPOCH FROM timestamp_utc) AS timestamp, temperature, humidity, is_anomaly
+        FROM sensor_readings
+        WHERE timestamp_utc >= $1 AND timestamp_utc < $2
+        ORDER BY timestamp_utc ASC
+        LIMIT $3
+    """,
+    'historical_raw_device(timestamptz, timestamptz, int, varchar)': """
+        SELECT EXTRACT(EPOCH FROM timestamp_utc) AS timestamp, temperature, humidity, is_anomaly
+        FROM sensor_readings
+        WHERE timestamp_utc >= $1 AND timestamp_utc < $2 AND device_id = $4
+        ORDER BY timestamp_utc ASC
+        LIMIT $3
+    """,
+    # Halaman keyset: baris setelah ($3, $4) = (timestamp_utc, id) baris terakhir halaman sebelumnya
+    'historical_page_all(timestamptz, timestamptz, timestamptz, bigint, int)': """
+        SELECT id, timestamp_utc, EXTRACT(EPOCH FROM timestamp_utc) AS timestamp, temperature, humidity, is_anomaly
+        FROM sensor_readings
+        WHERE timestamp_utc >= $1 AND timestamp_utc < $2 AND (timestamp_utc, id) > ($3, $4)
+        ORDER BY timestamp_utc ASC, id ASC
+        LIMIT $5
+    """,
+    'historical_page_device(timestamptz, timestamptz, timestamptz, bigint, int, varchar)': """
+        SELECT id, timestamp_utc, EXTRACT(EPOCH FROM timestamp_utc) AS timestamp, temperature, humidity, is_anomaly
+        FROM sensor_readings
+        WHERE timestamp_utc >= $1 AND timestamp_utc < $2 AND (timestamp_utc, id) > ($3, $4) AND device_id = $6
+        ORDER BY timestamp_utc ASC, id ASC
+        LIMIT $5
+    """,
+    # Apakah rentang berisi lebih dari $3 baris (mode 'lttb'), tanpa memuat barisnya
+    'historical_probe_all(timestamptz, timestamptz, int)': """
+        SELECT EXISTS (
+            SELECT 1 FROM sensor_readings
+            WHERE timestamp_utc >= $1 AND timestamp_utc < $2
+            OFFSET $3
+        )
+    """,
+    'historical_probe_device(timestamptz, timestamptz, int, varchar)': """
+        SELECT EXISTS (
+            SELECT 1 FROM sensor_readings
+            WHERE timestamp_utc >= $1 AND timestamp_utc < $2 AND device_id = $4
+            OFFSET $3
+        )
+    """,
+    # Agregasi per bucket waktu selebar $3 detik sejak $1 (awal bucket sebagai timestamp)
+    'historical_bucket_all(timestamptz, timestamptz, float8)': f"""
+        SELECT {HISTORICAL_BUCKET_COLUMNS}
+        FROM sensor_readings
+        WHERE timestamp_utc >= $1 AND timestamp_utc < $2
+        GROUP BY 1
+        ORDER BY 1
+    """,
+    'historical_bucket_device(timestamptz, timestamptz, float8, varchar)': f"""
+        SELECT {HISTORICAL_BUCKET_COLUMNS}
+        FROM sensor_readings
+        WHERE timestamp_utc >= $1 AND timestamp_utc < $2 AND device_id = $4
+        GROUP BY 1
+        ORDER BY 1
+    """,
+}
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Koneksi pool yang mengingat apakah statement sudah di-PREPARE dan kapan terakhir dipakai."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = False
+        self.last_used = time.monotonic()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# Membatasi thread yang memegang koneksi; getconn() pool langsung gagal jika habis
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+
+def open_listen_connection():
+    """Koneksi khusus (di luar pool) untuk thread LISTEN cache latest_data."""
+    return psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
+
+
+LATEST_CACHE = LatestReadingCache(
+    open_listen_connection,
+    refresh_interval=LATEST_CACHE_REFRESH_INTERVAL,
+    max_age=LATEST_CACHE_MAX_AGE,
+    max_missing=LATEST_CACHE_MAX_MISSING,
+    reconnect_delay=LATEST_CACHE_RECONNECT_DELAY,
+) if LATEST_CACHE_ENABLED else None
+
+
+def get_pool():
+    """Pool dibuat saat pertama dipakai (setelah fork worker gunicorn / reloader Flask)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = psycopg2.pool.ThreadedConnectionPool(
+                    DB_POOL_MIN, DB_POOL_MAX,
+                    host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS,
+                    connection_factory=PooledConnection,
+                )
+    return _pool
+
+
+def prepare_statements(conn):
+    with conn.cursor() as cur:
+        for name, sql in PREPARED_STATEMENTS.items():
+            cur.execute(f"PREPARE {name} AS {sql};")
+    conn.prepared = True
+
+
+def is_connection_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - conn.last_used < DB_POOL_HEALTH_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        return True
+    except psycopg2.Error:
+        return False
+
+
 def get_db_connection():
-    """Membuat koneksi DB dan mengembalikan cursor sebagai dictionary."""
+    """Mengambil koneksi dari pool dan mengembalikan cursor sebagai dictionary."""
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        print("ERROR: Semua koneksi database sedang dipakai.")
+        return None, None
+    conn = None
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS
-        )
+        pool = get_pool()
+        # Koneksi mati (DB restart, timeout jaringan) dibuang dan diganti yang baru
+        for _ in range(DB_POOL_MAX + 1):
+            conn = pool.getconn()
+            if is_connection_healthy(conn):
+                break
+            pool.putconn(conn, close=True)
+            conn = None
+        else:
+            raise psycopg2.OperationalError("tidak ada koneksi sehat di pool")
+        if not conn.prepared:
+            # Read-only API: autocommit agar koneksi tidak 'idle in transaction' di pool
+            conn.autocommit = True
+            prepare_statements(conn)
         return conn, conn.cursor(cursor_factory=RealDictCursor)
     except psycopg2.Error as e:
         print(f"ERROR: Gagal koneksi ke database: {e}") 
+        if conn is not None:
+            get_pool().putconn(conn, close=True)
+        _pool_slots.release()
         return None, None
 
+
+def release_db_connection(conn, cur):
+    """Mengembalikan koneksi ke pool (ditutup jika sudah rusak)."""
+    if cur:
+        cur.close()
+    if not conn:
+        return
+    conn.last_used = time.monotonic()
+    broken = bool(conn.closed) or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+    try:
+        get_pool().putconn(conn, close=broken)
+    finally:
+        _pool_slots.release()
+
 # ----------------------------------------------------------------------
 # --- ENDPOINT 1: DATA TERBARU (Live Data) ---
 # ----------------------------------------------------------------------
 @app.route('/api/v1/latest_data', methods=['GET'])
 def get_latest_data():
+    target_device = request.args.get('device_id')
+
+    # Jalur cepat: dilayani dari memori tanpa round-trip ke database
+    if LATEST_CACHE is not None:
+        hit, data = LATEST_CACHE.get(target_device)
+        if hit:
+            if data is None:
+                return jsonify({"status": "error", "message": "No data found"}), 404
+            return jsonify({"status": "success", "data": data})
+
     conn, cur = None, None
     try:
         conn, cur = get_db_connection()
         if not conn:
             return jsonify({"status": "error", "message": "Failed to connect to database"}), 500
         
-        target_device = request.args.get('device_id') 
-        
-        where_clause = ""
-        params = []
+        # Query sudah di-PREPARE di koneksi ini; cukup EXECUTE (tanpa parse/plan ulang)
         if target_device:
-            where_clause = "WHERE device_id = %s"
-            params = [target_device] 
-            
-        sql = f"""
-        SELECT 
-            EXTRACT(EPOCH FROM timestamp_utc) AS timestamp, 
-            temperature, 
-            humidity, 
-            device_id,
-            is_anomaly
-        FROM 
-            sensor_readings
-        {where_clause} 
-        ORDER BY 
-            id DESC -- ✅ PERBAIKAN: Prioritaskan ID sebagai penunjuk baris terbaru
-        LIMIT 1;
-        """
-        cur.execute(sql, params) 
+            cur.execute("EXECUTE latest_device(%s);", (target_device,))
+        else:
+            cur.execute("EXECUTE latest_all;")
         record = cur.fetchone()
 
+        if LATEST_CACHE is not None:
+            LATEST_CACHE.remember(target_device, record)
+
         if record:
-            temp_float = float(record['temperature'])
-            hum_float = float(record['humidity'])
-            is_anomaly_value = record.get('is_anomaly') 
-            
             return jsonify({
                 "status": "success",
-                "data": {
-                    "timestamp": int(record['timestamp']), 
-                    "temperature": temp_float,
-                    "humidity": hum_float,
-                    "device_id": record['device_id'],
-                    "is_anomaly": is_anomaly_value
-                }
+                "data": latest_record_to_data(record)
             })
         else:
             return jsonify({"status": "error", "message": "No data found"}), 404
@@ -88,64 +298,226 @@ def get_latest_data():
         print(f"General Error in latest_data: {e}")
         return jsonify({"status": "error", "message": "Server processing error"}), 500
     finally:
-        if cur: cur.close()
-        if conn: conn.close()
+        release_db_connection(conn, cur)
 
 # ----------------------------------------------------------------------
 # --- ENDPOINT 2: DATA HISTORIS (Untuk Grafik) ---
 # ----------------------------------------------------------------------
+def parse_time_arg(value):
+    """
+    ISO 8601 ('2025-01-01T00:00:00Z', '20250101') atau epoch detik berupa bilangan
+    bulat di antara HISTORICAL_MIN_EPOCH dan HISTORICAL_MAX_EPOCH; tanpa zona
+    waktu dianggap UTC. ValueError untuk nilai lain.
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        if not (value.isascii() and value.isdigit()) or not HISTORICAL_MIN_EPOCH <= int(value) <= HISTORICAL_MAX_EPOCH:
+            raise ValueError(f"invalid time: {value!r}")
+        return datetime.fromtimestamp(int(value), timezone.utc)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def encode_cursor(timestamp_utc, row_id, end, device_id):
+    """
+    Cursor opaque untuk klien: posisi keyset (timestamp_utc, id) baris terakhir,
+    plus akhir rentang dan device, sehingga ?cursor= saja cukup untuk lanjut.
+    """
+    state = [timestamp_utc.isoformat(), row_id, end.isoformat(), device_id]
+    raw = json.dumps(state, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Mengembalikan (timestamp_utc, id, end, device_id)."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp_text, row_id, end_text, device_id = json.loads(raw)
+        if not (type(row_id) is int and (device_id is None or isinstance(device_id, str))):
+            raise ValueError("invalid cursor fields")
+        timestamp_utc, end = (parse_time_arg(text) for text in (timestamp_text, end_text))
+        return timestamp_utc, row_id, end, device_id
+    except (ValueError, TypeError):
+        raise ValueError("invalid 'cursor'")
+
+
+def parse_historical_args(args):
+    """Validasi query string historical_data; ValueError berisi pesan untuk klien."""
+    try:
+        hours = float(args.get('hours', HISTORICAL_DEFAULT_HOURS))
+        points = int(args.get('points', HISTORICAL_DEFAULT_POINTS))
+        limit = int(args.get('limit', HISTORICAL_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("'hours', 'points' and 'limit' must be numbers")
+    if not (math.isfinite(hours) and hours > 0):
+        raise ValueError("'hours' must be a positive number")
+    if not 3 <= points <= HISTORICAL_MAX_POINTS:
+        raise ValueError(f"'points' must be between 3 and {HISTORICAL_MAX_POINTS}")
+    if not 1 <= limit <= HISTORICAL_MAX_PAGE_SIZE:
+        raise ValueError(f"'limit' must be between 1 and {HISTORICAL_MAX_PAGE_SIZE}")
+
+    cursor = args.get('cursor')
+    # Cursor hanya ada di mode 'raw', jadi cukup ?cursor= untuk halaman berikutnya
+    mode = args.get('mode', 'raw' if cursor else HISTORICAL_DEFAULT_MODE)
+    if mode not in ('bucket', 'lttb', 'raw'):
+        raise ValueError("'mode' must be one of: bucket, lttb, raw")
+    if cursor and mode != 'raw':
+        raise ValueError("'cursor' is only supported with mode=raw")
+
+    device_id = args.get('device_id')
+    try:
+        end = parse_time_arg(args['end']) if 'end' in args else datetime.now(timezone.utc)
+        start = parse_time_arg(args['start']) if 'start' in args else None
+    except ValueError:
+        raise ValueError("'start' and 'end' must be epoch seconds or ISO 8601 timestamps")
+    if start is None:
+        try:
+            start = end - timedelta(hours=hours)
+        except OverflowError:
+            # Mode 'raw' tanpa batas: ?hours= sangat besar berarti sejak awal data
+            start = datetime.min.replace(tzinfo=timezone.utc)
+    if cursor:
+        # Lanjutan halaman: mulai dari posisi cursor, rentang & device dari query pertama
+        cursor = decode_cursor(cursor)
+        start, cursor_end, device_id = cursor[0], cursor[2], cursor[3]
+        end = parse_time_arg(args['end']) if 'end' in args else cursor_end
+    if start >= end:
+        raise ValueError("'start' must be before 'end'")
+    # Juga berlaku untuk ?hours=: hanya mode 'raw' (berhalaman) yang tanpa batas
+    if mode != 'raw' and end - start > timedelta(hours=HISTORICAL_MAX_HOURS):
+        raise ValueError(f"range longer than {HISTORICAL_MAX_HOURS} hours requires mode=raw (paginated)")
+
+    return {
+        "start": start,
+        "end": end,
+        "mode": mode,
+        "points": points,
+        "limit": limit,
+        "device_id": device_id,
+        "cursor": cursor[:2] if cursor else None,
+    }
+
+
+def execute_historical(cur, kind, device_id, *params):
+    """EXECUTE statement historical_<kind>_{all,device} yang sudah di-PREPARE."""
+    if device_id:
+        cur.execute(f"EXECUTE historical_{kind}_device({', '.join(['%s'] * (len(params) + 1))});",
+                    params + (device_id,))
+    else:
+        cur.execute(f"EXECUTE historical_{kind}_all({', '.join(['%s'] * len(params))});", params)
+
+
+def historical_point(timestamp, temperature, humidity, is_anomaly):
+    return {
+        "timestamp": int(timestamp),
+        "temperature": round(float(temperature), 2),
+        "humidity": round(float(humidity), 2),
+        "is_anomaly": is_anomaly,
+    }
+
+
+def fetch_bucketed(cur, device_id, start, end, points):
+    """Mode 'bucket': min/avg/max per bucket waktu, dihitung di PostgreSQL."""
+    bucket_seconds = (end - start).total_seconds() / points
+    execute_historical(cur, 'bucket', device_id, start, end, bucket_seconds)
+    data = []
+    for record in cur.fetchall():
+        point = historical_point(record['timestamp'], record['temperature'], record['humidity'], record['is_anomaly'])
+        point.update({
+            "temperature_min": float(record['temperature_min']),
+            "temperature_max": float(record['temperature_max']),
+            "humidity_min": float(record['humidity_min']),
+            "humidity_max": float(record['humidity_max']),
+            "samples": record['samples'],
+        })
+        data.append(point)
+    return data, {"bucket_seconds": bucket_seconds}
+
+
+def fetch_lttb(conn, device_id, start, end, points):
+    """Mode 'lttb': titik asli terpilih (LTTB atas temperature), dihitung dengan NumPy."""
+    # Cursor tuple biasa: jauh lebih ringan daripada RealDictCursor untuk banyak baris
+    with conn.cursor() as raw_cur:
+        execute_historical(raw_cur, 'probe', device_id, start, end, HISTORICAL_LTTB_MAX_SOURCE_ROWS)
+        too_many = raw_cur.fetchone()[0]
+        rows = []
+        if not too_many:
+            # Tetap satu baris ekstra: data bisa bertambah di antara probe dan query ini
+            execute_historical(raw_cur, 'raw', device_id, start, end, HISTORICAL_LTTB_MAX_SOURCE_ROWS + 1)
+            rows = raw_cur.fetchall()
+        pre_bucket_seconds = None
+        if too_many or len(rows) > HISTORICAL_LTTB_MAX_SOURCE_ROWS:
+            pre_bucket_seconds = (end - start).total_seconds() / HISTORICAL_LTTB_MAX_SOURCE_ROWS
+            execute_historical(raw_cur, 'bucket', device_id, start, end, pre_bucket_seconds)
+            rows = raw_cur.fetchall()
+
+    if not rows:
+        return [], {}
+    x = [float(row[0]) for row in rows]
+    y = [float(row[1]) for row in rows]
+    data = [historical_point(*rows[i][:4]) for i in lttb_indices(x, y, points)]
+    return data, {"source_rows": len(rows), "pre_bucket_seconds": pre_bucket_seconds}
+
+
+def fetch_page(cur, device_id, start, end, limit, cursor):
+    """Mode 'raw': satu halaman keyset; biaya sama untuk halaman ke-1 maupun ke-1000."""
+    # Tanpa cursor: mulai dari awal rentang (id selalu positif)
+    after_timestamp, after_id = cursor if cursor else (start, 0)
+    # Satu baris ekstra untuk mengetahui apakah masih ada halaman berikutnya
+    execute_historical(cur, 'page', device_id, start, end, after_timestamp, after_id, limit + 1)
+    records = cur.fetchall()
+    has_more = len(records) > limit
+    records = records[:limit]
+
+    data = [
+        historical_point(r['timestamp'], r['temperature'], r['humidity'], r['is_anomaly'])
+        for r in records
+    ]
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(records[-1]['timestamp_utc'], records[-1]['id'], end, device_id)
+    return data, {"next_cursor": next_cursor}
+
+
+# Query string: device_id; start/end (ISO 8601 atau epoch detik bulat, default: `hours`
+# terakhir); mode 'bucket' | 'lttb' dengan points (target jumlah titik), atau
+# mode 'raw' dengan limit (baris per halaman) dan cursor (dari next_cursor).
 @app.route('/api/v1/historical_data', methods=['GET'])
 def get_historical_data():
+    try:
+        params = parse_historical_args(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    target_device = params['device_id']
+
     conn, cur = None, None
     try:
         conn, cur = get_db_connection()
         if not conn:
             return jsonify({"status": "error", "message": "Failed to connect to database"}), 500
-            
-        target_device = request.args.get('device_id')
-        
-        # Menggunakan 24 jam terakhir dari sekarang
-        time_24_hours_ago = datetime.now(timezone.utc) - timedelta(hours=24) 
-        
-        params = [time_24_hours_ago]
-        device_filter = ""
 
-        if target_device:
-            device_filter = "AND device_id = %s"
-            params.append(target_device) 
-        
-        sql = f"""
-        SELECT 
-            EXTRACT(EPOCH FROM timestamp_utc) AS timestamp, 
-            temperature, 
-            humidity,
-            is_anomaly
-        FROM 
-            sensor_readings
-        WHERE 
-            timestamp_utc >= %s 
-            {device_filter} 
-        ORDER BY 
-            timestamp_utc ASC
-        LIMIT 500; -- Batasan 500 baris tetap dipertahankan untuk menghindari timeout di emulator
-        """
-        cur.execute(sql, params)
-        records = cur.fetchall()
-
-        historical_data = []
-        for record in records:
-            historical_data.append({
-                "timestamp": int(record['timestamp']), 
-                "temperature": float(record['temperature']), 
-                "humidity": float(record['humidity']),
-                "is_anomaly": record.get('is_anomaly')
-            })
+        # Seluruh rentang diringkas menjadi maks. `points` titik, jadi ukuran
+        # payload dan biaya grafik tetap terbatas berapa pun jumlah barisnya
+        start, end, mode = params['start'], params['end'], params['mode']
+        if mode == 'bucket':
+            historical_data, details = fetch_bucketed(cur, target_device, start, end, params['points'])
+        elif mode == 'lttb':
+            historical_data, details = fetch_lttb(conn, target_device, start, end, params['points'])
+        else:
+            historical_data, details = fetch_page(cur, target_device, start, end, params['limit'], params['cursor'])
 
-        if historical_data:
-            return jsonify({
+        # Halaman lanjutan yang kosong (data terhapus) tetap sukses agar klien berhenti normal
+        if historical_data or params['cursor']:
+            response = {
                 "status": "success",
-                "data": historical_data
-            })
+                "data": historical_data,
+                "range": {"start": int(start.timestamp()), "end": int(end.timestamp())},
+            }
+            if mode == 'raw':
+                response["next_cursor"] = details["next_cursor"]
+            else:
+                response["downsampling"] = {"mode": mode, "points": len(historical_data), **details}
+            return jsonify(response)
         else:
             return jsonify({"status": "error", "message": "No historical data found"}), 404
 
@@ -156,9 +528,7 @@ def get_historical_data():
         print(f"General Error in historical_data: {e}")
         return jsonify({"status": "error", "message": "Server processing error"}), 500
     finally:
-        if cur: cur.close()
-        if conn: conn.close()
-
+        release_db_connection(conn, cur)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
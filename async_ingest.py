@@ -0,0 +1,316 @@
+# async_ingest.py
+# Mode asyncio untuk mqtt_listener: jaringan MQTT, decode payload dan penulisan DB
+# berjalan sebagai tahap terpisah yang dihubungkan oleh antrean berbatas:
+#
+#   socket MQTT --(on_message)--> raw_queue --(decode)--> row_queue --(writer)--> PostgreSQL
+#
+# Socket MQTT dilayani langsung oleh event loop (add_reader/add_writer), jadi
+# keepalive broker tidak pernah menunggu database. Jika database lambat,
+# row_queue penuh dan tahap decode menunggu (backpressure); jika raw_queue ikut
+# penuh, pesan baru dibuang di pintu masuk dan dihitung sebagai 'dropped'.
+#
+# Saat berhenti (Ctrl+C / SIGTERM) koneksi broker diputus dulu, lalu isi kedua
+# antrean dan batch yang sedang ditulis dikuras ke database (maks.
+# SHUTDOWN_DRAIN_TIMEOUT detik), sama seperti BufferedWriter.stop pada mode thread.
+#
+# Contoh: python mqtt_listener.py --asyncio --metrics-port 9110
+
+import asyncio
+import multiprocessing
+import select
+import signal
+import time
+
+import paho.mqtt.client as mqtt
+import psycopg2
+
+import mqtt_listener
+from engine_metrics import EngineMetrics, start_metrics_server
+from sensor_payload import PayloadError, decode_payload
+
+# --- KONFIGURASI PIPELINE ---
+RAW_QUEUE_SIZE = 10000      # Payload mentah yang menunggu di-decode
+ROW_QUEUE_SIZE = 20000      # Bacaan valid yang menunggu ditulis ke DB
+DECODE_WORKERS = 2          # Jumlah task decode
+DECODE_BATCH_SIZE = 256     # Payload yang di-decode sebelum memberi giliran ke task lain
+STATS_INTERVAL = 10         # Detik antar ringkasan statistik di log
+RECONNECT_DELAY = 5         # Detik jeda sebelum reconnect ke broker
+READ_PACKETS_PER_WAKEUP = 256  # Paket MQTT maks. yang dibaca per event socket
+SHUTDOWN_DRAIN_TIMEOUT = 10    # Detik maks. menguras antrean ke database saat berhenti
+
+METRICS_HOST = '127.0.0.1'
+
+
+class AsyncioMqttHelper:
+    """Menghubungkan socket paho-mqtt ke event loop asyncio (tanpa loop_forever)."""
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.misc_task = None
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, self._on_readable, client, sock)
+        self.misc_task = self.loop.create_task(self.misc_loop())
+
+    def _on_readable(self, client, sock):
+        # loop_read hanya membaca satu paket per panggilan: kuras paket yang sudah
+        # menunggu di socket tanpa kembali ke event loop untuk setiap pesan
+        for _ in range(READ_PACKETS_PER_WAKEUP):
+            if client.loop_read() != mqtt.MQTT_ERR_SUCCESS:
+                break
+            if not select.select([sock], [], [], 0)[0]:
+                break
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc_task is not None:
+            self.misc_task.cancel()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        # Keepalive (PINGREQ) dan retry QoS ditangani loop_misc
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+
+class IngestPipeline:
+    """Antrean dan tahap-tahap pipeline ingest asyncio beserta metriknya."""
+
+    def __init__(self, metrics, raw_queue_size=RAW_QUEUE_SIZE, row_queue_size=ROW_QUEUE_SIZE):
+        self.metrics = metrics
+        self.raw_queue = asyncio.Queue(maxsize=raw_queue_size)
+        self.row_queue = asyncio.Queue(maxsize=row_queue_size)
+        self.conn = None
+        # SpooledWriter jika --spool: writer hanya menyalin ke spool, drainer yang menulis ke DB
+        self.spooled = None
+        # Bacaan yang sudah keluar dari antrean tetapi belum selesai diproses,
+        # dihitung saat berhenti jika tidak sempat tersimpan
+        self.unqueued = 0           # sudah di-decode, menunggu tempat di row_queue
+        self.in_flight = []         # batch yang sedang dikumpulkan/ditulis writer
+        metrics.add_collector('safe_listener_raw_queue_depth', 'gauge',
+                              'Payload MQTT yang menunggu di-decode.', self.raw_queue.qsize)
+        metrics.add_collector('safe_listener_row_queue_depth', 'gauge',
+                              'Bacaan valid yang menunggu ditulis ke database.', self.row_queue.qsize)
+        metrics.add_collector('safe_listener_duplicates_suppressed_total', 'counter',
+                              'Bacaan duplikat yang dibuang penyaring memori.',
+                              mqtt_listener.suppressed_duplicates)
+
+    def on_message(self, client, userdata, msg):
+        """Callback paho (berjalan di thread event loop): hanya memasukkan ke antrean."""
+        self.metrics.inc('safe_listener_messages_received_total')
+        try:
+            self.raw_queue.put_nowait(msg.payload)
+        except asyncio.QueueFull:
+            self.metrics.inc('safe_listener_messages_dropped_total')
+
+    async def decode_worker(self):
+        while True:
+            payloads = [await self.raw_queue.get()]
+            while len(payloads) < DECODE_BATCH_SIZE and not self.raw_queue.empty():
+                payloads.append(self.raw_queue.get_nowait())
+
+            started = time.perf_counter()
+            readings = []
+            for payload in payloads:
+                try:
+                    items = decode_payload(payload)
+                except PayloadError as e:
+                    print(f"ERROR: Gagal decode payload: {e}")
+                    self.metrics.inc('safe_listener_messages_invalid_total')
+                    continue
+                for data in items:
+                    reading = mqtt_listener.parse_reading(data)
+                    if reading is None:
+                        self.metrics.inc('safe_listener_readings_invalid_total')
+                    elif not mqtt_listener.is_duplicate_reading(reading):
+                        readings.append(reading)
+            self.metrics.observe_stage('decode', time.perf_counter() - started)
+
+            self.unqueued += len(readings)
+            for reading in readings:
+                # Menunggu jika writer tertinggal (backpressure ke raw_queue)
+                await self.row_queue.put(reading)
+                self.unqueued -= 1
+            for _ in payloads:
+                self.raw_queue.task_done()
+
+    async def _take_batch(self):
+        """Mengambil satu batch dari row_queue (BULK_FLUSH_ROWS atau BULK_FLUSH_INTERVAL)."""
+        batch = self.in_flight = []
+        batch.append(await self.row_queue.get())
+        deadline = time.monotonic() + mqtt_listener.BULK_FLUSH_INTERVAL
+        while len(batch) < mqtt_listener.BULK_FLUSH_ROWS:
+            if not self.row_queue.empty():
+                batch.append(self.row_queue.get_nowait())
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.row_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        """
+        Berjalan di thread executor: (inline scoring lalu) COPY satu batch,
+        menyambung ulang bila perlu. Mengembalikan (duplikat, ditolak) seperti
+        mqtt_listener.write_batch.
+        """
+        if self.conn is None or self.conn.closed:
+            self.conn = mqtt_listener.connect_db()
+            if self.conn is None:
+                raise psycopg2.OperationalError("database tidak tersedia")
+        try:
+            return mqtt_listener.write_batch(self.conn, batch, mqtt_listener.score_readings(batch))
+        except psycopg2.Error:
+            try:
+                self.conn.rollback()
+            except psycopg2.Error:
+                self.conn.close()
+            raise
+
+    async def writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._take_batch()
+            if self.spooled is not None:
+                for reading in batch:
+                    self.spooled.add(reading)
+                self.metrics.inc('safe_listener_rows_spooled_total', len(batch))
+                self.in_flight = []
+                for _ in batch:
+                    self.row_queue.task_done()
+                continue
+            while True:
+                started = time.perf_counter()
+                try:
+                    duplicates, rejected = await loop.run_in_executor(None, self._write_batch, batch)
+                    break
+                except psycopg2.Error as e:
+                    # Batch ditahan dan dicoba lagi; antrean di belakangnya menahan decode
+                    self.metrics.inc('safe_listener_write_errors_total')
+                    print(f"ERROR: Gagal insert {len(batch)} data: {e}")
+                    await asyncio.sleep(mqtt_listener.BULK_RETRY_DELAY)
+            self.metrics.observe_stage('write', time.perf_counter() - started)
+            self.metrics.inc('safe_listener_rows_written_total', len(batch) - duplicates - rejected)
+            self.metrics.inc('safe_listener_duplicates_db_total', duplicates)
+            self.metrics.inc('safe_listener_rows_rejected_total', rejected)
+            self.in_flight = []
+            for _ in batch:
+                self.row_queue.task_done()
+
+    async def shutdown(self, tasks, timeout=SHUTDOWN_DRAIN_TIMEOUT):
+        """
+        Menunggu tahap decode dan writer (tasks) menghabiskan kedua antrean, maks.
+        timeout detik, lalu menghentikannya. Sisa yang tidak sempat tersimpan
+        (mis. database mati) dicatat sebagai dibuang.
+        """
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        lost_messages = self.raw_queue.qsize()
+        lost_rows = self.unqueued + self.row_queue.qsize() + len(self.in_flight)
+        if lost_messages or lost_rows:
+            self.metrics.inc('safe_listener_messages_dropped_total', lost_messages)
+            self.metrics.inc('safe_listener_rows_dropped_total', lost_rows)
+            print(f"ERROR: {lost_rows} bacaan dan {lost_messages} payload tidak tersimpan saat berhenti.")
+
+    async def _drain(self):
+        await self.raw_queue.join()
+        await self.row_queue.join()
+
+    async def report_stats(self):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            counter = self.metrics.counter_value
+            print(f"[STATS] diterima={counter('safe_listener_messages_received_total')} "
+                  f"ditulis={counter('safe_listener_rows_written_total')} "
+                  f"dibuang={counter('safe_listener_messages_dropped_total')} "
+                  f"ditolak={counter('safe_listener_rows_rejected_total')} "
+                  f"antrean raw={self.raw_queue.qsize()} rows={self.row_queue.qsize()}")
+
+
+async def keep_connected(client, helper):
+    """Menyambung ulang ke broker setiap kali koneksi (dan misc_loop) berakhir."""
+    while True:
+        if helper.misc_task is not None:
+            await asyncio.wait([helper.misc_task])
+        print(f"Koneksi MQTT terputus, mencoba lagi dalam {RECONNECT_DELAY} detik...")
+        await asyncio.sleep(RECONNECT_DELAY)
+        try:
+            client.reconnect()
+        except OSError as e:
+            print(f"Gagal reconnect ke broker: {e}")
+            helper.misc_task = None
+
+
+async def run_async_listener(metrics_port=None, topics=None, use_spool=False):
+    metrics = EngineMetrics(multiprocessing.current_process().name)
+    if metrics_port:
+        try:
+            start_metrics_server(metrics, METRICS_HOST, metrics_port)
+            print(f"[INFO] Endpoint metrik aktif di http://{METRICS_HOST}:{metrics_port}/metrics")
+        except OSError as e:
+            print(f"[WARN] Endpoint metrik tidak bisa dibuka di port {metrics_port}: {e}")
+
+    loop = asyncio.get_running_loop()
+    pipeline = IngestPipeline(metrics)
+    if use_spool:
+        pipeline.spooled = mqtt_listener.create_writer(None, use_spool=True).start()
+        metrics.add_collector('safe_listener_spool_pending', 'gauge',
+                              'Bacaan di spool disk yang belum tersimpan di database.',
+                              lambda: len(pipeline.spooled))
+    client = mqtt.Client(userdata={"topics": topics or mqtt_listener.MQTT_TOPICS})
+    helper = AsyncioMqttHelper(loop, client)
+    client.on_connect = mqtt_listener.on_connect
+    client.on_message = pipeline.on_message
+
+    print(f"Mencoba koneksi ke broker di {mqtt_listener.MQTT_BROKER}:{mqtt_listener.MQTT_PORT}...")
+    client.connect(mqtt_listener.MQTT_BROKER, mqtt_listener.MQTT_PORT, 60)
+
+    # SIGTERM menghentikan listener dengan rapi (bukan KeyboardInterrupt di tengah
+    # event loop, yang membatalkan semua task sekaligus tanpa menguras antrean)
+    stop_requested = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stop_requested.set)
+
+    pipeline_tasks = [asyncio.create_task(pipeline.decode_worker()) for _ in range(DECODE_WORKERS)]
+    pipeline_tasks.append(asyncio.create_task(pipeline.writer()))
+    other_tasks = [asyncio.create_task(pipeline.report_stats()),
+                   asyncio.create_task(keep_connected(client, helper))]
+    stop_task = asyncio.create_task(stop_requested.wait())
+    try:
+        # asyncio.wait (bukan gather): pembatalan task ini (Ctrl+C) tidak ikut
+        # membatalkan tahap pipeline, sehingga antreannya masih bisa dikuras
+        done, _ = await asyncio.wait(pipeline_tasks + other_tasks + [stop_task],
+                                     return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+        print("MQTT Listener dihentikan.")
+    finally:
+        loop.remove_signal_handler(signal.SIGTERM)
+        for task in other_tasks + [stop_task]:
+            task.cancel()
+        client.disconnect()
+        await pipeline.shutdown(pipeline_tasks)
+        if pipeline.spooled is not None:
+            pipeline.spooled.stop()
+        if pipeline.conn is not None and not pipeline.in_flight:
+            # Batch yang masih ditulis thread executor tetap memegang koneksinya
+            pipeline.conn.close()
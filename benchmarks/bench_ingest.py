@@ -0,0 +1,333 @@
+# benchmarks/bench_ingest.py
+# Benchmark end-to-end ingest: simulator armada (fleet_loadgen.py) -> broker
+# MQTT lokal (mini_broker.py) -> mqtt_listener -> database.
+#
+# Broker, listener dan simulator berjalan di proses terpisah. Setiap bacaan
+# dicocokkan lewat (device_id, timestamp) antara waktu publish dan waktu
+# bacaan itu ter-COMMIT, sehingga hasilnya:
+#   - laju kirim dan laju tersimpan (bacaan/detik)
+#   - insert lag p50/p95/p99/max (publish -> commit)
+#   - drop rate (bacaan terkirim yang tidak pernah tersimpan)
+#
+# Sink:
+#   - memory  : koneksi DB listener diganti penampung di memori yang melaporkan
+#               setiap COMMIT (mengukur broker + listener tanpa database)
+#   - postgres: database lokal (--dsn), sebaiknya database khusus benchmark.
+#               Tabel sensor_readings dibuat jika belum ada; baris device
+#               'loadgen_*' dari run ini dihapus lagi kecuali --keep-rows.
+#
+# Contoh:
+#   python benchmarks/bench_ingest.py --devices 1000 --rate 5 --duration 20
+#   python benchmarks/bench_ingest.py --sink postgres --dsn "dbname=bench_db user=postgres" --listener-mode asyncio --spool
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import select
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import paho.mqtt.client as mqtt
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+import mqtt_listener  # noqa: E402
+from fleet_loadgen import BASE_EPOCH, DEVICE_PREFIX, add_fleet_arguments, run_fleet  # noqa: E402
+from mini_broker import MiniBroker  # noqa: E402
+
+WARMUP_DEVICE = f"{DEVICE_PREFIX}warmup"
+
+POSTGRES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sensor_readings (
+    id BIGSERIAL PRIMARY KEY,
+    timestamp_utc TIMESTAMPTZ NOT NULL,
+    temperature NUMERIC(5, 1),
+    humidity NUMERIC(5, 1),
+    device_id VARCHAR(100),
+    is_anomaly BOOLEAN
+);
+"""
+
+
+class MemorySinkConnection:
+    """Pengganti koneksi psycopg2 (--sink memory): COPY diurai, COMMIT dilaporkan ke antrean."""
+
+    closed = 0
+
+    def __init__(self, sink_queue):
+        self.sink_queue = sink_queue
+        self.pending = []
+
+    def cursor(self):
+        return _MemorySinkCursor(self)
+
+    def commit(self):
+        if self.pending:
+            self.sink_queue.put((time.time(), self.pending))
+            self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+class _MemorySinkCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchone(self):
+        # Dipakai untuk cek unique index dedup: anggap tidak ada
+        return None
+
+    def copy_expert(self, sql, buf):
+        for line in buf.getvalue().splitlines():
+            ts, _, _, device_id = line.split('\t')[:4]
+            self.conn.pending.append((device_id, int(datetime.fromisoformat(ts).timestamp())))
+
+
+def broker_process(host, port):
+    import asyncio
+    asyncio.run(MiniBroker().serve(host, port))
+
+
+def listener_process(args, sink_queue, spool_dir):
+    """Menjalankan mqtt_listener yang diarahkan ke broker lokal dan sink benchmark."""
+    mqtt_listener.MQTT_BROKER, mqtt_listener.MQTT_PORT = args.host, args.port
+    mqtt_listener.SPOOL_DIR = spool_dir
+    if args.inline_scoring:
+        import ai_engine
+        # Path model relatif terhadap root repo, agar benchmark bisa dijalankan dari mana saja
+        ai_engine.MODEL_FILE_PATH = os.path.join(REPO_ROOT, ai_engine.MODEL_FILE_PATH)
+    if args.sink == 'postgres':
+        import psycopg2
+        mqtt_listener.connect_db = lambda: psycopg2.connect(args.dsn)
+    else:
+        mqtt_listener.connect_db = lambda: MemorySinkConnection(sink_queue)
+    # Log per batch dari listener tidak ikut diukur sebagai I/O terminal
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        mqtt_listener.run_listener_worker(
+            [args.topic], args.listener_mode == 'asyncio', 0, args.inline_scoring, args.spool,
+        )
+
+
+def wait_for_port(host, port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection((host, port), timeout=0.5):
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def collect_memory(sink_queue, arrivals, stop_event):
+    while not stop_event.is_set():
+        try:
+            committed_at, items = sink_queue.get(timeout=0.2)
+        except queue.Empty:
+            continue
+        for key in items:
+            arrivals[key] = committed_at
+
+
+def collect_postgres(dsn, start_id, arrivals, stop_event):
+    """LISTEN pada channel notify listener, lalu ambil baris baru setiap kali ada COMMIT."""
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"LISTEN {mqtt_listener.NOTIFY_CHANNEL};")
+    last_id = start_id
+    while not stop_event.is_set():
+        if select.select([conn], [], [], 0.2) != ([], [], []):
+            conn.poll()
+            conn.notifies.clear()
+        seen_at = time.time()
+        cur.execute("""
+            SELECT id, device_id, EXTRACT(EPOCH FROM timestamp_utc)::bigint
+            FROM sensor_readings WHERE id > %s ORDER BY id;
+        """, (last_id,))
+        for row_id, device_id, epoch in cur.fetchall():
+            arrivals[(device_id, epoch)] = seen_at
+            last_id = row_id
+    conn.close()
+
+
+def prepare_postgres(dsn):
+    import psycopg2
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cur:
+        cur.execute(POSTGRES_SCHEMA)
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM sensor_readings;")
+        return cur.fetchone()[0]
+
+
+def cleanup_postgres(dsn, start_id):
+    import psycopg2
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM sensor_readings WHERE id > %s AND device_id LIKE %s;",
+                    (start_id, f"{DEVICE_PREFIX}%"))
+
+
+def warm_up(args, arrivals, timeout=60):
+    """Mengirim bacaan pemanasan sampai satu tersimpan (listener sudah subscribe & siap)."""
+    client = mqtt.Client(client_id=f"{DEVICE_PREFIX}warmup")
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+    try:
+        deadline = time.monotonic() + timeout
+        epoch = BASE_EPOCH - 100000
+        while time.monotonic() < deadline:
+            client.publish(args.topic, json.dumps({
+                'timestamp': epoch, 'temperature': 27.0, 'humidity': 70.0, 'device_id': WARMUP_DEVICE,
+            }))
+            epoch += 1
+            time.sleep(0.2)
+            if any(device_id == WARMUP_DEVICE for device_id, _ in list(arrivals)):
+                return True
+        return False
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+
+def summarize(fleet_stats, publish_log, arrivals, drain_s):
+    stored_keys = [key for key in publish_log if key in arrivals]
+    lags_ms = np.array([(arrivals[key] - publish_log[key]) * 1000.0 for key in stored_keys])
+    sent = len(publish_log)
+    result = dict(fleet_stats)
+    result.update({
+        'stored_readings': len(stored_keys),
+        'drop_rate': round(1.0 - len(stored_keys) / sent, 6) if sent else None,
+        'drain_s': round(drain_s, 3),
+    })
+    if stored_keys:
+        span = max(arrivals[key] for key in stored_keys) - min(publish_log.values())
+        result['stored_readings_per_s'] = round(len(stored_keys) / span, 1) if span > 0 else None
+        for name, q in (('p50', 50), ('p95', 95), ('p99', 99)):
+            result[f'insert_lag_ms_{name}'] = round(float(np.percentile(lags_ms, q)), 2)
+        result['insert_lag_ms_max'] = round(float(lags_ms.max()), 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end ingest MQTT -> mqtt_listener -> database.")
+    add_fleet_arguments(parser)
+    parser.set_defaults(port=18830)
+    parser.add_argument('--external-broker', action='store_true',
+                        help='Pakai broker yang sudah berjalan di --host/--port (mis. Mosquitto).')
+    parser.add_argument('--listener-mode', choices=('thread', 'asyncio'), default='thread')
+    parser.add_argument('--spool', action='store_true', help='Listener memakai spool disk.')
+    parser.add_argument('--inline-scoring', action='store_true', help='Listener menilai bacaan sebelum ditulis.')
+    parser.add_argument('--sink', choices=('memory', 'postgres'), default='memory')
+    parser.add_argument('--dsn', default=None, help='DSN PostgreSQL untuk --sink postgres.')
+    parser.add_argument('--keep-rows', action='store_true', help='Jangan hapus baris hasil benchmark (--sink postgres).')
+    parser.add_argument('--drain-timeout', type=float, default=30.0,
+                        help='Detik menunggu bacaan yang masih di perjalanan setelah simulasi selesai.')
+    parser.add_argument('--output', default='bench_ingest.json', help='File JSON hasil.')
+    args = parser.parse_args()
+
+    if args.sink == 'postgres' and not args.dsn:
+        parser.error('--sink postgres membutuhkan --dsn')
+
+    processes = []
+    sink_queue = multiprocessing.Queue()
+    arrivals = {}
+    stop_event = threading.Event()
+    start_id = prepare_postgres(args.dsn) if args.sink == 'postgres' else None
+    spool_dir = tempfile.mkdtemp(prefix='bench_ingest_spool_')
+
+    try:
+        if not args.external_broker:
+            broker = multiprocessing.Process(target=broker_process, args=(args.host, args.port), daemon=True)
+            broker.start()
+            processes.append(broker)
+        if not wait_for_port(args.host, args.port):
+            print(f"[FATAL ERROR] Broker tidak bisa dihubungi di {args.host}:{args.port}")
+            sys.exit(1)
+
+        if args.sink == 'postgres':
+            collector_args = (args.dsn, start_id, arrivals, stop_event)
+            collector = threading.Thread(target=collect_postgres, args=collector_args, daemon=True)
+        else:
+            collector = threading.Thread(target=collect_memory, args=(sink_queue, arrivals, stop_event), daemon=True)
+        collector.start()
+
+        listener = multiprocessing.Process(target=listener_process, args=(args, sink_queue, spool_dir),
+                                           name='mqtt-worker-1')
+        listener.start()
+        processes.append(listener)
+        if not warm_up(args, arrivals):
+            print("[FATAL ERROR] Listener tidak menyimpan bacaan pemanasan, benchmark dibatalkan.")
+            sys.exit(1)
+
+        print(f"[INFO] {args.devices} device x {args.rate}/detik selama {args.duration} detik "
+              f"(format {args.format}, batch {args.batch}, listener {args.listener_mode})...")
+        publish_log = {}
+        fleet_stats = run_fleet(args, publish_log)
+
+        # Tunggu bacaan yang masih di broker / buffer listener / spool
+        drain_started = time.monotonic()
+        while time.monotonic() - drain_started < args.drain_timeout:
+            if all(key in arrivals for key in list(publish_log)):
+                break
+            time.sleep(0.1)
+        drain_s = time.monotonic() - drain_started
+    finally:
+        stop_event.set()
+        for process in reversed(processes):
+            if process.is_alive():
+                process.terminate()
+            process.join(10)
+        if args.sink == 'postgres' and not args.keep_rows:
+            cleanup_postgres(args.dsn, start_id)
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    result = summarize(fleet_stats, publish_log, arrivals, drain_s)
+    result.update({
+        'format': args.format,
+        'batch': args.batch,
+        'qos': args.qos,
+        'listener_mode': args.listener_mode,
+        'spool': args.spool,
+        'inline_scoring': args.inline_scoring,
+        'sink': args.sink,
+    })
+    print(f"[INFO] terkirim {result['sent_readings']} ({result['readings_per_s']}/detik), "
+          f"tersimpan {result['stored_readings']}, drop rate {result['drop_rate']}, "
+          f"lag p50={result.get('insert_lag_ms_p50')} ms p99={result.get('insert_lag_ms_p99')} ms")
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'result': result,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"[SUCCESS] Hasil benchmark disimpan ke {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+# benchmarks/bench_scoring.py
+# Benchmark throughput pipeline penilaian ai_engine:
+# fetch batch -> feature engineering + prediksi (ai_engine.predict_batch) -> write-back.
+#
+# Data sintetis dibuat untuk N device memakai model bawaan
+# (safe_anomaly_model_multidevice.joblib) dan feature_names_-nya. Database:
+#   - sqlite  : SQLite in-memory (default, tanpa server)
+#   - postgres: tabel TEMP 'sensor_readings' di server PostgreSQL (--dsn). Tabel TEMP
+#               menutupi tabel asli dalam sesi ini, jadi data produksi tidak tersentuh,
+#               dan prepared statement ai_engine yang sebenarnya ikut diukur.
+#
+# Hasil (rows/s, latensi batch p50/p99, memori puncak) disimpan sebagai JSON
+# agar dua run bisa dibandingkan.
+#
+# Contoh:
+#   python benchmarks/bench_scoring.py --rows 20000 --batch-sizes 100,1000 --device-counts 2,500
+#   python benchmarks/bench_scoring.py --backend postgres --dsn "dbname=bench_db user=postgres"
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import sqlite3
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+import ai_engine  # noqa: E402
+from feature_store import RollingFeatureStore  # noqa: E402
+from prediction_cache import PredictionCache  # noqa: E402
+
+SQLITE_SCHEMA = """
+CREATE TABLE sensor_readings (
+    id INTEGER PRIMARY KEY,
+    timestamp_utc TIMESTAMP NOT NULL,
+    temperature REAL,
+    humidity REAL,
+    device_id TEXT,
+    is_anomaly BOOLEAN
+);
+CREATE INDEX idx_pending ON sensor_readings (timestamp_utc) WHERE is_anomaly IS NULL;
+"""
+
+POSTGRES_SCHEMA = """
+CREATE TEMP TABLE sensor_readings (
+    id BIGINT PRIMARY KEY,
+    timestamp_utc TIMESTAMPTZ NOT NULL,
+    temperature NUMERIC(5, 1),
+    humidity NUMERIC(5, 1),
+    device_id VARCHAR(100),
+    is_anomaly BOOLEAN
+);
+CREATE INDEX ON sensor_readings (timestamp_utc) WHERE is_anomaly IS NULL;
+"""
+
+
+def make_device_ids(n_devices):
+    """Device yang dikenal model dipakai lebih dulu; sisanya device sintetis."""
+    known = [f[len(ai_engine.DEVICE_FEATURE_PREFIX):] for f in ai_engine.MODEL_FEATURES_LIST
+             if f.startswith(ai_engine.DEVICE_FEATURE_PREFIX)]
+    extra = [f"bench_device_{i:05d}" for i in range(max(0, n_devices - len(known)))]
+    return (known + extra)[:n_devices]
+
+
+def make_readings(n_rows, device_ids, seed=42):
+    """Bacaan DHT sintetis (resolusi 0.1) berurutan waktu, device bergiliran acak."""
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 1, 6, tzinfo=timezone.utc)
+    devices = rng.integers(0, len(device_ids), n_rows)
+    temperatures = np.round(rng.normal(27.0, 1.5, n_rows), 1)
+    humidities = np.round(np.clip(rng.normal(70.0, 5.0, n_rows), 0, 100), 1)
+    return [
+        (i + 1, start + timedelta(seconds=5 * i), float(temperatures[i]), float(humidities[i]), device_ids[devices[i]])
+        for i in range(n_rows)
+    ]
+
+
+class SqliteBackend:
+    name = 'sqlite'
+
+    def __init__(self, _dsn=None):
+        self.conn = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES)
+        self.conn.row_factory = lambda cur, row: {col[0]: row[i] for i, col in enumerate(cur.description)}
+        self.conn.executescript(SQLITE_SCHEMA)
+
+    def load(self, readings):
+        self.conn.execute("DELETE FROM sensor_readings;")
+        self.conn.executemany(
+            "INSERT INTO sensor_readings (id, timestamp_utc, temperature, humidity, device_id) VALUES (?, ?, ?, ?, ?);",
+            [(i, ts.replace(tzinfo=None), t, h, d) for i, ts, t, h, d in readings],
+        )
+        self.conn.commit()
+
+    def fetch(self, batch_size):
+        return self.conn.execute("""
+            SELECT id, timestamp_utc, temperature, humidity, device_id
+            FROM sensor_readings
+            WHERE is_anomaly IS NULL
+            ORDER BY timestamp_utc ASC
+            LIMIT ?;
+        """, (batch_size,)).fetchall()
+
+    def write(self, results):
+        self.conn.executemany(
+            "UPDATE sensor_readings SET is_anomaly = ? WHERE id = ?;",
+            [(is_anomaly, row_id) for row_id, is_anomaly in results],
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class PostgresBackend:
+    name = 'postgres'
+
+    def __init__(self, dsn):
+        import psycopg2
+        import psycopg2.extras
+        self.conn = psycopg2.connect(dsn)
+        self.cur = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        self.cur.execute(POSTGRES_SCHEMA)
+        # Prepared statement yang sama dengan engine, tapi mengarah ke tabel TEMP
+        ai_engine.prepare_engine_statements(self.cur)
+        self.conn.commit()
+
+    def load(self, readings):
+        import psycopg2.extras
+        self.cur.execute("TRUNCATE sensor_readings;")
+        psycopg2.extras.execute_values(
+            self.cur,
+            "INSERT INTO sensor_readings (id, timestamp_utc, temperature, humidity, device_id) VALUES %s;",
+            readings, page_size=5000,
+        )
+        self.conn.commit()
+
+    def fetch(self, batch_size):
+        ai_engine.BATCH_SIZE = batch_size
+        return ai_engine.fetch_pending_rows(self.cur)
+
+    def write(self, results):
+        ai_engine.update_anomaly_flags(self.cur, results)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def reset_engine_state(use_cache):
+    """Cache dan jendela rolling dikosongkan agar setiap konfigurasi mulai dingin."""
+    ai_engine.PREDICTION_CACHE = PredictionCache(ai_engine.PREDICTION_CACHE_SIZE) if use_cache else None
+    # Jendela hanya dibuat jika model memakai fitur rolling (seperti di engine)
+    if ai_engine.ACTIVE_SHARD is not None and ai_engine.ACTIVE_SHARD.uses_rolling:
+        ai_engine.FEATURE_STORE = RollingFeatureStore(ai_engine.ROLLING_WINDOW_SIZE, ai_engine.ROLLING_EWMA_ALPHA)
+    else:
+        ai_engine.FEATURE_STORE = None
+
+
+def drain(backend, batch_size):
+    """Menilai semua baris di tabel; mengembalikan daftar latensi per batch (detik)."""
+    latencies = []
+    while True:
+        started = time.perf_counter()
+        rows = backend.fetch(batch_size)
+        if not rows:
+            break
+        results = ai_engine.predict_batch(rows)
+        backend.write(results)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def run_case(backend, readings, batch_size, n_devices, use_cache):
+    backend.load(readings)
+    reset_engine_state(use_cache)
+    # Peringatan device tidak dikenal dibuang agar tidak ikut terukur sebagai I/O terminal
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        latencies = drain(backend, batch_size)
+        elapsed = time.perf_counter() - started
+
+        # Pass kedua hanya untuk memori puncak (tracemalloc memperlambat eksekusi)
+        backend.load(readings)
+        reset_engine_state(use_cache)
+        tracemalloc.start()
+        drain(backend, batch_size)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    latencies_ms = np.array(latencies) * 1000.0
+    cache = ai_engine.PREDICTION_CACHE
+    return {
+        'backend': backend.name,
+        'batch_size': batch_size,
+        'devices': n_devices,
+        'rows': len(readings),
+        'batches': len(latencies),
+        'elapsed_s': round(elapsed, 4),
+        'rows_per_s': round(len(readings) / elapsed, 1) if elapsed else None,
+        'batch_latency_ms_p50': round(float(np.percentile(latencies_ms, 50)), 3),
+        'batch_latency_ms_p99': round(float(np.percentile(latencies_ms, 99)), 3),
+        'peak_traced_mb': round(peak_bytes / 1e6, 2),
+        'cache_hit_rate': round(cache.hit_rate(), 4) if cache is not None else None,
+    }
+
+
+def parse_int_list(text):
+    return [int(x) for x in text.split(',') if x.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline penilaian ai_engine.")
+    parser.add_argument('--rows', type=int, default=20000, help='Jumlah bacaan sintetis per konfigurasi.')
+    parser.add_argument('--batch-sizes', type=parse_int_list, default=[100, 1000, 5000])
+    parser.add_argument('--device-counts', type=parse_int_list, default=[2, 100, 1000])
+    parser.add_argument('--backend', choices=('sqlite', 'postgres'), default='sqlite')
+    parser.add_argument('--dsn', default=None, help='DSN PostgreSQL untuk --backend postgres.')
+    parser.add_argument('--no-cache', action='store_true', help='Nonaktifkan cache prediksi.')
+    parser.add_argument('--output', default='bench_scoring.json', help='File JSON hasil.')
+    args = parser.parse_args()
+
+    if args.backend == 'postgres' and not args.dsn:
+        parser.error('--backend postgres membutuhkan --dsn')
+
+    # Path model relatif terhadap root repo, agar benchmark bisa dijalankan dari mana saja
+    ai_engine.MODEL_FILE_PATH = os.path.join(REPO_ROOT, ai_engine.MODEL_FILE_PATH)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        loaded = ai_engine.load_models()
+    if not loaded:
+        print("[FATAL ERROR] Model gagal dimuat, benchmark dibatalkan.")
+        sys.exit(1)
+
+    backend = (PostgresBackend if args.backend == 'postgres' else SqliteBackend)(args.dsn)
+    results = []
+    try:
+        for n_devices in args.device_counts:
+            readings = make_readings(args.rows, make_device_ids(n_devices))
+            for batch_size in args.batch_sizes:
+                result = run_case(backend, readings, batch_size, n_devices, not args.no_cache)
+                results.append(result)
+                print(f"[INFO] devices={n_devices:>5} batch={batch_size:>5}: "
+                      f"{result['rows_per_s']:>10} baris/detik, p50={result['batch_latency_ms_p50']} ms, "
+                      f"p99={result['batch_latency_ms_p99']} ms, peak={result['peak_traced_mb']} MB")
+    finally:
+        backend.close()
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'model_file': ai_engine.MODEL_FILE_PATH,
+        'compiled_model': ai_engine.COMPILED_MODEL is not None,
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"[SUCCESS] Hasil benchmark disimpan ke {args.output}")
+
+
+if __name__ == '__main__':
+    main()
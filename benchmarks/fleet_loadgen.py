@@ -0,0 +1,164 @@
+# benchmarks/fleet_loadgen.py
+# Simulator armada ESP8266: N device memublikasikan bacaan DHT ke broker MQTT
+# dengan laju dan jitter yang bisa diatur, dalam format JSON (seperti firmware
+# sekarang) atau biner ringkas (sensor_payload.encode_binary), opsional per batch.
+#
+# Device dibagi ke beberapa koneksi MQTT (--clients) agar ribuan device tidak
+# membutuhkan ribuan socket. Timestamp setiap bacaan unik per device
+# (epoch awal + nomor urut), sehingga penerima bisa mencocokkan setiap bacaan.
+#
+# Contoh:
+#   python benchmarks/fleet_loadgen.py --embedded-broker --devices 500 --rate 2 --duration 30
+#   python benchmarks/fleet_loadgen.py --host 127.0.0.1 --port 1883 --format binary --batch 10
+
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensor_payload import encode_binary  # noqa: E402
+
+DEVICE_PREFIX = 'loadgen_'
+BASE_EPOCH = 1735689600  # 2025-01-01T00:00:00Z
+
+
+def make_payload(device_id, readings, payload_format):
+    """readings: daftar (epoch, temperature, humidity) milik satu device."""
+    if payload_format == 'binary':
+        return encode_binary(device_id, readings)
+    items = [
+        {'timestamp': epoch, 'temperature': temp, 'humidity': hum, 'device_id': device_id}
+        for epoch, temp, hum in readings
+    ]
+    return json.dumps(items[0] if len(items) == 1 else items)
+
+
+class FleetClient:
+    """Satu koneksi MQTT yang mensimulasikan sekelompok device."""
+
+    def __init__(self, index, device_ids, args, publish_log):
+        self.device_ids = device_ids
+        self.args = args
+        self.publish_log = publish_log
+        self.sent_messages = 0
+        self.sent_readings = 0
+        self.rng = random.Random(index)
+        self.client = mqtt.Client(client_id=f"{DEVICE_PREFIX}client_{index}")
+        self.client.max_queued_messages_set(0)
+
+    def _next_delay(self):
+        period = 1.0 / self.args.rate
+        return period * (1.0 + self.rng.uniform(-self.args.jitter, self.args.jitter))
+
+    def run(self, stop_at):
+        args = self.args
+        self.client.connect(args.host, args.port, 60)
+        self.client.loop_start()
+        try:
+            now = time.monotonic()
+            # Jadwal bacaan berikutnya per device: (waktu, device_index)
+            schedule = [(now + self.rng.uniform(0, 1.0 / args.rate), i) for i in range(len(self.device_ids))]
+            heapq.heapify(schedule)
+            sequence = [0] * len(self.device_ids)
+            pending = [[] for _ in self.device_ids]
+            temperatures = [self.rng.uniform(24.0, 30.0) for _ in self.device_ids]
+
+            while schedule:
+                due, i = heapq.heappop(schedule)
+                if due >= stop_at:
+                    continue
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+                device_id = self.device_ids[i]
+                # Random walk kecil beresolusi 0.1, seperti sensor DHT di ruangan
+                temperatures[i] += self.rng.choice((-0.1, 0.0, 0.0, 0.1))
+                reading = (BASE_EPOCH + sequence[i], round(temperatures[i], 1),
+                           round(self.rng.uniform(55.0, 80.0), 1))
+                sequence[i] += 1
+                pending[i].append(reading)
+
+                if len(pending[i]) >= args.batch:
+                    self.client.publish(args.topic, make_payload(device_id, pending[i], args.format), qos=args.qos)
+                    published_at = time.time()
+                    if self.publish_log is not None:
+                        for epoch, _, _ in pending[i]:
+                            self.publish_log[(device_id, epoch)] = published_at
+                    self.sent_messages += 1
+                    self.sent_readings += len(pending[i])
+                    pending[i] = []
+                heapq.heappush(schedule, (due + self._next_delay(), i))
+        finally:
+            self.client.loop_stop()
+            self.client.disconnect()
+
+
+def run_fleet(args, publish_log=None):
+    """
+    Menjalankan simulasi sampai args.duration habis. Jika publish_log (dict)
+    diberikan, diisi (device_id, epoch) -> waktu publish (time.time()).
+    Mengembalikan ringkasan statistik.
+    """
+    device_ids = [f"{DEVICE_PREFIX}{i:05d}" for i in range(args.devices)]
+    groups = [device_ids[i::args.clients] for i in range(args.clients)]
+    fleet = [FleetClient(i, group, args, publish_log) for i, group in enumerate(groups) if group]
+
+    started = time.monotonic()
+    stop_at = started + args.duration
+    threads = [threading.Thread(target=client.run, args=(stop_at,), daemon=True) for client in fleet]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    sent_messages = sum(client.sent_messages for client in fleet)
+    sent_readings = sum(client.sent_readings for client in fleet)
+    return {
+        'devices': args.devices,
+        'target_readings_per_s': args.devices * args.rate,
+        'sent_messages': sent_messages,
+        'sent_readings': sent_readings,
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_s': round(sent_messages / elapsed, 1),
+        'readings_per_s': round(sent_readings / elapsed, 1),
+    }
+
+
+def add_fleet_arguments(parser):
+    parser.add_argument('--host', default='127.0.0.1', help='Alamat broker MQTT.')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--topic', default='dht/sensor_data')
+    parser.add_argument('--devices', type=int, default=100, help='Jumlah device yang disimulasikan.')
+    parser.add_argument('--rate', type=float, default=1.0, help='Bacaan per detik per device.')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Variasi relatif interval (0.2 = +-20%%).')
+    parser.add_argument('--duration', type=float, default=30.0, help='Lama simulasi (detik).')
+    parser.add_argument('--format', choices=('json', 'binary'), default='json')
+    parser.add_argument('--batch', type=int, default=1, help='Bacaan per pesan MQTT.')
+    parser.add_argument('--qos', type=int, choices=(0, 1), default=0)
+    parser.add_argument('--clients', type=int, default=4, help='Jumlah koneksi MQTT untuk seluruh armada.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulator armada sensor ESP8266 (MQTT).")
+    add_fleet_arguments(parser)
+    parser.add_argument('--embedded-broker', action='store_true',
+                        help='Jalankan broker minimal (mini_broker.py) di proses ini pada --host/--port.')
+    args = parser.parse_args()
+
+    if args.embedded_broker:
+        from mini_broker import start_broker_thread
+        start_broker_thread(args.host, args.port)
+        print(f"[INFO] Broker minimal berjalan di {args.host}:{args.port}")
+
+    print(f"[INFO] Mensimulasikan {args.devices} device x {args.rate}/detik selama {args.duration} detik...")
+    stats = run_fleet(args)
+    print(json.dumps(stats, indent=2))
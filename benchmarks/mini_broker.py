@@ -0,0 +1,207 @@
+# benchmarks/mini_broker.py
+# Broker MQTT 3.1.1 minimal (asyncio, tanpa dependensi) sebagai pengganti
+# broker.emqx.io / Mosquitto untuk benchmark dan load test lokal.
+#
+# Yang didukung: CONNECT, SUBSCRIBE/UNSUBSCRIBE dengan wildcard '+' dan '#',
+# shared subscription '$share/<grup>/<filter>' (round-robin di dalam grup),
+# PUBLISH QoS 0/1, PINGREQ, DISCONNECT. Tidak ada retained message, will,
+# sesi persisten maupun QoS 2 (tidak dipakai oleh SAFE).
+#
+# Seperti broker sungguhan, pesan untuk subscriber yang tidak sanggup mengikuti
+# (buffer kirim > MAX_SUBSCRIBER_BUFFER) dibuang dan dihitung di 'dropped'.
+#
+# Contoh: python benchmarks/mini_broker.py --port 1883
+
+import argparse
+import asyncio
+import itertools
+import struct
+import threading
+
+MAX_SUBSCRIBER_BUFFER = 8 * 1024 * 1024
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(topic_filter, topic):
+    """Pencocokan filter MQTT ('+' satu level, '#' sisa level)."""
+    filter_parts = topic_filter.split('/')
+    topic_parts = topic.split('/')
+    for i, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != '+' and part != topic_parts[i]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def encode_remaining_length(length):
+    out = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def encode_string(text):
+    data = text.encode('utf-8')
+    return struct.pack('!H', len(data)) + data
+
+
+def packet(packet_type, flags, body):
+    return bytes([(packet_type << 4) | flags]) + encode_remaining_length(len(body)) + body
+
+
+class _Session:
+    __slots__ = ('writer', 'subscriptions', 'next_packet_id')
+
+    def __init__(self, writer):
+        self.writer = writer
+        # filter -> (qos, grup shared subscription atau None)
+        self.subscriptions = {}
+        self.next_packet_id = itertools.cycle(range(1, 65536))
+
+
+class MiniBroker:
+    def __init__(self):
+        self.sessions = set()
+        self._round_robin = {}
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    async def _read_packet(self, reader):
+        header = await reader.readexactly(1)
+        multiplier, length = 1, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        body = await reader.readexactly(length) if length else b''
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    def _send(self, session, data):
+        transport = session.writer.transport
+        if transport.is_closing() or transport.get_write_buffer_size() > MAX_SUBSCRIBER_BUFFER:
+            self.dropped += 1
+            return
+        session.writer.write(data)
+        self.delivered += 1
+
+    def _route(self, topic, payload, qos):
+        self.received += 1
+        shared_targets = {}
+        for session in self.sessions:
+            for topic_filter, (sub_qos, group) in session.subscriptions.items():
+                if not topic_matches(topic_filter, topic):
+                    continue
+                if group is None:
+                    self._deliver(session, topic, payload, min(qos, sub_qos))
+                else:
+                    shared_targets.setdefault((group, topic_filter), []).append((session, sub_qos))
+                break
+        # Shared subscription: satu anggota grup per pesan, bergiliran
+        for key, members in shared_targets.items():
+            index = self._round_robin.get(key, 0) % len(members)
+            self._round_robin[key] = index + 1
+            session, sub_qos = members[index]
+            self._deliver(session, topic, payload, min(qos, sub_qos))
+
+    def _deliver(self, session, topic, payload, qos):
+        body = encode_string(topic)
+        if qos:
+            body += struct.pack('!H', next(session.next_packet_id))
+        self._send(session, packet(PUBLISH, qos << 1, body + payload))
+
+    async def handle_client(self, reader, writer):
+        session = _Session(writer)
+        try:
+            packet_type, _, _ = await self._read_packet(reader)
+            if packet_type != CONNECT:
+                return
+            writer.write(packet(CONNACK, 0, b'\x00\x00'))
+            self.sessions.add(session)
+
+            while True:
+                packet_type, flags, body = await self._read_packet(reader)
+                if packet_type == PUBLISH:
+                    qos = (flags >> 1) & 0x03
+                    topic_len = struct.unpack_from('!H', body)[0]
+                    topic = body[2:2 + topic_len].decode('utf-8')
+                    offset = 2 + topic_len
+                    if qos:
+                        packet_id = body[offset:offset + 2]
+                        offset += 2
+                        writer.write(packet(PUBACK, 0, packet_id))
+                    self._route(topic, body[offset:], qos)
+                elif packet_type == SUBSCRIBE:
+                    packet_id, offset, granted = body[:2], 2, bytearray()
+                    while offset < len(body):
+                        length = struct.unpack_from('!H', body, offset)[0]
+                        topic_filter = body[offset + 2:offset + 2 + length].decode('utf-8')
+                        qos = min(body[offset + 2 + length], 1)
+                        offset += 3 + length
+                        group = None
+                        if topic_filter.startswith('$share/'):
+                            _, group, topic_filter = topic_filter.split('/', 2)
+                        session.subscriptions[topic_filter] = (qos, group)
+                        granted.append(qos)
+                    writer.write(packet(SUBACK, 0, packet_id + bytes(granted)))
+                elif packet_type == UNSUBSCRIBE:
+                    offset = 2
+                    while offset < len(body):
+                        length = struct.unpack_from('!H', body, offset)[0]
+                        topic_filter = body[offset + 2:offset + 2 + length].decode('utf-8')
+                        if topic_filter.startswith('$share/'):
+                            topic_filter = topic_filter.split('/', 2)[2]
+                        session.subscriptions.pop(topic_filter, None)
+                        offset += 2 + length
+                    writer.write(packet(UNSUBACK, 0, body[:2]))
+                elif packet_type == PINGREQ:
+                    writer.write(packet(PINGRESP, 0, b''))
+                elif packet_type == DISCONNECT:
+                    return
+                # PUBACK dari subscriber tidak perlu diproses (tanpa retry)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+
+    async def serve(self, host, port, ready=None):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+
+def start_broker_thread(host='127.0.0.1', port=1883):
+    """Menjalankan MiniBroker di thread daemon; mengembalikan objek broker setelah siap."""
+    broker = MiniBroker()
+    ready = threading.Event()
+    threading.Thread(
+        target=lambda: asyncio.run(broker.serve(host, port, ready)), daemon=True, name='mini-broker',
+    ).start()
+    if not ready.wait(5):
+        raise RuntimeError(f"Broker gagal dijalankan di {host}:{port}")
+    return broker
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Broker MQTT minimal untuk pengujian lokal.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1883)
+    args = parser.parse_args()
+    print(f"[INFO] Broker MQTT minimal berjalan di {args.host}:{args.port}")
+    try:
+        asyncio.run(MiniBroker().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
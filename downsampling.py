@@ -0,0 +1,40 @@
+# downsampling.py
+# Downsampling deret waktu untuk /api/v1/historical_data (api_server).
+# LTTB (Largest-Triangle-Three-Buckets, Steinarsson 2013) memilih titik asli
+# yang paling menjaga bentuk grafik: per bucket dipilih titik yang membentuk
+# segitiga terbesar dengan titik terpilih sebelumnya dan rata-rata bucket
+# berikutnya. Titik pertama dan terakhir selalu ikut.
+
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    """Indeks (urut naik) maks. threshold titik dari deret (x, y) yang sudah urut menurut x."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # threshold - 2 bucket di antara titik pertama dan terakhir; batas dihitung
+    # dengan aritmetika integer agar setiap bucket berisi minimal satu titik
+    bounds = (np.arange(threshold - 1, dtype=np.int64) * (n - 2)) // (threshold - 2) + 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        if i + 2 < len(bounds):
+            next_lo, next_hi = bounds[i + 1], bounds[i + 2]
+        else:
+            next_lo, next_hi = n - 1, n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+
+        ax, ay = x[a], y[a]
+        # Dua kali luas segitiga (a, kandidat, rata-rata bucket berikutnya)
+        area = np.abs((ax - avg_x) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (avg_y - ay))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
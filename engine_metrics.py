@@ -0,0 +1,134 @@
+# engine_metrics.py
+# Metrik internal ai_engine dan endpoint HTTP lokal dalam format teks Prometheus.
+# Mencatat durasi per tahap batch (fetch, features, predict, write) sebagai
+# histogram, jumlah baris/batch, backlog (baris is_anomaly IS NULL) dan lag.
+#
+# Contoh: curl http://127.0.0.1:9108/metrics
+
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Batas bucket histogram durasi tahap (detik)
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Histogram:
+    __slots__ = ('bucket_counts', 'total', 'count')
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(DURATION_BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+
+class EngineMetrics:
+    """Wadah metrik thread-safe (loop utama menulis, thread HTTP membaca)."""
+
+    def __init__(self, worker_name):
+        self.worker_name = worker_name
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._gauges = {}
+        # Sumber metrik tambahan yang dibaca saat scrape: nama -> (tipe, bantuan, fungsi)
+        self._collectors = {}
+
+    @contextmanager
+    def time_stage(self, stage):
+        """Mengukur durasi satu tahap batch: with metrics.time_stage('fetch'): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - started)
+
+    def observe_stage(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = _Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def counter_value(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def add_collector(self, name, metric_type, help_text, func):
+        """Metrik yang nilainya diambil dari func() setiap kali di-scrape."""
+        self._collectors[name] = (metric_type, help_text, func)
+
+    def render(self):
+        """Semua metrik dalam format teks Prometheus (exposition format 0.0.4)."""
+        label = f'worker="{self.worker_name}"'
+        lines = []
+        with self._lock:
+            lines.append('# HELP safe_ai_stage_duration_seconds Durasi setiap tahap pemrosesan batch.')
+            lines.append('# TYPE safe_ai_stage_duration_seconds histogram')
+            for stage, histogram in sorted(self._stages.items()):
+                stage_label = f'{label},stage="{stage}"'
+                for bound, bucket_count in zip(DURATION_BUCKETS, histogram.bucket_counts):
+                    lines.append(f'safe_ai_stage_duration_seconds_bucket{{{stage_label},le="{bound}"}} {bucket_count}')
+                lines.append(f'safe_ai_stage_duration_seconds_bucket{{{stage_label},le="+Inf"}} {histogram.count}')
+                lines.append(f'safe_ai_stage_duration_seconds_sum{{{stage_label}}} {histogram.total}')
+                lines.append(f'safe_ai_stage_duration_seconds_count{{{stage_label}}} {histogram.count}')
+
+            for name, value in sorted(self._counters.items()):
+                lines.append(f'# TYPE {name} counter')
+                lines.append(f'{name}{{{label}}} {value}')
+            for name, value in sorted(self._gauges.items()):
+                lines.append(f'# TYPE {name} gauge')
+                lines.append(f'{name}{{{label}}} {value}')
+
+        for name, (metric_type, help_text, func) in sorted(self._collectors.items()):
+            try:
+                value = func()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{name}{{{label}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def start_metrics_server(metrics, host, port):
+    """Menjalankan endpoint /metrics di thread daemon dan mengembalikan server-nya."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Jangan membanjiri log engine dengan setiap scrape
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics-http').start()
+    return server
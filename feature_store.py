@@ -0,0 +1,151 @@
+# feature_store.py
+# Fitur rolling-window inkremental untuk ai_engine.
+# Setiap device memiliki ring buffer berukuran tetap (array.array) per sinyal
+# (temperature, humidity). Setiap bacaan baru memperbarui rolling mean, std,
+# delta dan EWMA dalam O(1), tanpa query histori ke database per baris.
+#
+# Nama fitur yang dihasilkan (dipakai jika ada di feature_names_ model):
+#   <sinyal>_roll_mean, <sinyal>_roll_std, <sinyal>_delta, <sinyal>_ewma
+# Definisinya mengikuti pandas agar cocok dengan skrip training:
+#   rolling(window).mean(), rolling(window).std() (ddof=1), diff(),
+#   ewm(alpha=..., adjust=False).mean()
+
+from array import array
+import math
+
+SIGNALS = ('temperature', 'humidity')
+FEATURE_SUFFIXES = ('roll_mean', 'roll_std', 'delta', 'ewma')
+
+
+def rolling_feature_names():
+    """Semua nama fitur yang bisa dihasilkan RollingFeatureStore."""
+    return [f"{signal}_{suffix}" for signal in SIGNALS for suffix in FEATURE_SUFFIXES]
+
+
+class SignalWindow:
+    """Ring buffer satu sinyal untuk satu device, dengan statistik berjalan."""
+
+    __slots__ = ('values', 'size', 'count', 'pos', 'shift', 'total', 'total_sq', 'ewma', 'last', 'pushes')
+
+    def __init__(self, size):
+        self.values = array('d', bytes(8 * size))
+        self.size = size
+        self.count = 0
+        self.pos = 0
+        # Jumlah berjalan disimpan relatif terhadap nilai pertama ('shifted data')
+        # agar variansi sinyal yang stabil tidak rusak oleh cancellation
+        self.shift = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.ewma = None
+        self.last = None
+        self.pushes = 0
+
+    def push(self, value, alpha):
+        """Menambah satu nilai; nilai tertua keluar dari jendela jika buffer penuh."""
+        if self.shift is None:
+            self.shift = value
+        if self.count == self.size:
+            old = self.values[self.pos] - self.shift
+            self.total -= old
+            self.total_sq -= old * old
+        else:
+            self.count += 1
+        self.values[self.pos] = value
+        self.pos = (self.pos + 1) % self.size
+        shifted = value - self.shift
+        self.total += shifted
+        self.total_sq += shifted * shifted
+
+        # Jumlah berjalan dihitung ulang dari buffer setiap 'size' kali push agar
+        # galat pembulatan tidak menumpuk (biaya amortisasi tetap O(1)); shift
+        # ikut digeser ke nilai terbaru agar tetap dekat dengan isi jendela
+        self.pushes += 1
+        if self.pushes >= self.size:
+            self.pushes = 0
+            self.shift = value
+            shifted = [self.values[i] - self.shift for i in range(self.count)]
+            self.total = math.fsum(shifted)
+            self.total_sq = math.fsum(x * x for x in shifted)
+
+        delta = 0.0 if self.last is None else value - self.last
+        self.last = value
+        self.ewma = value if self.ewma is None else (1.0 - alpha) * self.ewma + alpha * value
+        return delta
+
+    def mean(self):
+        return self.shift + self.total / self.count if self.count else 0.0
+
+    def std(self):
+        if self.count < 2:
+            return 0.0
+        shifted_mean = self.total / self.count
+        variance = (self.total_sq - self.count * shifted_mean * shifted_mean) / (self.count - 1)
+        return math.sqrt(variance) if variance > 0.0 else 0.0
+
+
+class RollingFeatureStore:
+    """Kumpulan SignalWindow per device, diperbarui satu bacaan setiap kali."""
+
+    def __init__(self, window_size, ewma_alpha):
+        self.window_size = window_size
+        self.ewma_alpha = ewma_alpha
+        # device_id -> (timestamp terakhir, {sinyal: SignalWindow})
+        self._devices = {}
+
+    def __len__(self):
+        return len(self._devices)
+
+    def update(self, device_id, timestamp, values):
+        """
+        Memasukkan satu bacaan (values = {sinyal: nilai}) dan mengembalikan dict
+        fitur rolling setelah bacaan ini. Bacaan yang tidak lebih baru dari
+        bacaan terakhir device (mis. diambil ulang setelah rollback) tidak
+        dimasukkan lagi; fiturnya dihitung dari keadaan jendela saat ini.
+        """
+        state = self._devices.get(device_id)
+        if state is None:
+            state = [None, {signal: SignalWindow(self.window_size) for signal in SIGNALS}]
+            self._devices[device_id] = state
+
+        windows = state[1]
+        is_new = state[0] is None or timestamp > state[0]
+        if is_new:
+            state[0] = timestamp
+
+        features = {}
+        for signal in SIGNALS:
+            window = windows[signal]
+            value = values.get(signal)
+            if is_new and value is not None:
+                delta = window.push(float(value), self.ewma_alpha)
+            else:
+                delta = 0.0
+            features[f"{signal}_roll_mean"] = window.mean()
+            features[f"{signal}_roll_std"] = window.std()
+            features[f"{signal}_delta"] = delta
+            features[f"{signal}_ewma"] = window.ewma if window.ewma is not None else 0.0
+        return features
+
+    def update_rows(self, rows):
+        """
+        Memperbarui jendela untuk setiap baris (urut waktu) dan menambahkan
+        fitur rolling langsung ke dict baris tersebut.
+        """
+        for row in rows:
+            if not row.get('device_id'):
+                continue
+            row.update(self.update(
+                str(row['device_id']),
+                row['timestamp_utc'],
+                {signal: row.get(signal) for signal in SIGNALS},
+            ))
+
+    def warm_start(self, rows):
+        """Mengisi jendela dari histori (baris harus urut timestamp_utc naik)."""
+        for row in rows:
+            self.update(
+                str(row['device_id']),
+                row['timestamp_utc'],
+                {signal: row.get(signal) for signal in SIGNALS},
+            )
@@ -0,0 +1,271 @@
+# iforest_compiled.py
+# Evaluator "compiled" untuk model IsolationForest (sklearn).
+# Semua pohon di dalam model diratakan menjadi array NumPy yang bersebelahan
+# saat model dimuat, lalu satu batch dievaluasi dengan traversal tervektorisasi
+# (semua pohon x semua baris sekaligus) tanpa overhead per-panggilan sklearn.
+#
+# Hasilnya dibuat identik (bit-for-bit) dengan IsolationForest.predict:
+# - input di-cast ke float32 seperti tree.apply() di sklearn,
+# - panjang jalur dijumlahkan per pohon dengan urutan yang sama,
+# - rumus skor dan offset_ sama persis dengan _compute_score_samples().
+#
+# Array hasil kompilasi bisa disimpan sebagai file .npy (save_compiled) lalu
+# dimuat dengan np.load(mmap_mode='r') (load_compiled): semua proses worker
+# yang memuat model yang sama berbagi halaman array yang sama lewat page cache OS.
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+from sklearn.ensemble._iforest import _average_path_length
+
+# Jumlah baris per blok traversal; blok kecil lebih ramah cache untuk batch besar
+BLOCK_ROWS = 256
+
+
+class CompiledIsolationForest:
+    """Representasi datar (flattened) dari IsolationForest untuk prediksi batch."""
+
+    def __init__(self, model):
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        node_counts = [tree.node_count for tree in trees]
+        offsets = np.concatenate(([0], np.cumsum(node_counts)[:-1])).astype(np.intp)
+
+        features, thresholds, children, missing_right, path_lengths = [], [], [], [], []
+        max_depth = 0
+        for tree, tree_features, offset in zip(trees, model.estimators_features_, offsets):
+            node_ids = np.arange(tree.node_count, dtype=np.intp)
+            is_leaf = tree.children_left == -1
+
+            # Anak kiri/kanan disimpan berselang-seling: children[2*node + ke_kanan].
+            # Daun menunjuk ke dirinya sendiri (threshold +inf) sehingga traversal
+            # cukup diulang max_depth kali tanpa masker per-baris.
+            left = np.where(is_leaf, node_ids, tree.children_left) + offset
+            right = np.where(is_leaf, node_ids, tree.children_right) + offset
+            children.append(np.column_stack((left, right)).ravel())
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            # Arah nilai NaN per node (sklearn >= 1.3 menyimpan missing_go_to_left)
+            missing_go_to_left = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8))
+            missing_right.append(np.asarray(missing_go_to_left) == 0)
+            # Indeks fitur pohon dipetakan ke kolom matriks input (max_features < 1.0)
+            features.append(np.where(is_leaf, 0, np.asarray(tree_features)[np.maximum(tree.feature, 0)]))
+
+            # Kontribusi panjang jalur per daun, dihitung persis seperti di fit():
+            # node_depth (akar = 1) + c(n_node_samples) - 1.0
+            depths = tree.compute_node_depths()
+            path_lengths.append(depths + _average_path_length(tree.n_node_samples) - 1.0)
+            max_depth = max(max_depth, int(depths.max()) - 1)
+
+        # Indeks int32 (lebih hemat cache) selama jumlah node masih muat
+        index_dtype = np.int32 if 2 * sum(node_counts) < np.iinfo(np.int32).max else np.intp
+
+        self.n_trees = len(trees)
+        self.n_features = model.n_features_in_
+        self.index_dtype = index_dtype
+        self.roots = offsets.astype(index_dtype)
+        self.feature = np.ascontiguousarray(np.concatenate(features), dtype=index_dtype)
+        self.threshold = np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64)
+        self.children = np.ascontiguousarray(np.concatenate(children), dtype=index_dtype)
+        self.missing_right = np.concatenate(missing_right)
+        self.path_length = np.ascontiguousarray(np.concatenate(path_lengths), dtype=np.float64)
+        self.max_depth = max_depth
+        self.denominator = self.n_trees * _average_path_length([model._max_samples])
+        self.offset = model.offset_
+
+    def _path_depths(self, lookup_values, n_samples):
+        """
+        Total panjang jalur per baris untuk satu blok kecil.
+        lookup_values(fitur) mengembalikan nilai float32 X[baris, fitur] untuk
+        array indeks fitur berbentuk (n_pohon, n_baris).
+        """
+        # nodes[t, i] = posisi baris i di pohon t; semua pohon berjalan bersamaan
+        nodes = np.repeat(self.roots[:, np.newaxis], n_samples, axis=1)
+        for _ in range(self.max_depth):
+            values = lookup_values(self.feature.take(nodes))
+            # Sama dengan sklearn: ke kiri jika X <= threshold; NaN mengikuti missing_go_to_left
+            go_right = ~(values <= self.threshold.take(nodes))
+            is_missing = np.isnan(values)
+            if is_missing.any():
+                go_right[is_missing] = self.missing_right.take(nodes[is_missing])
+            nodes = self.children.take(2 * nodes + go_right)
+
+        # Dijumlahkan per pohon (urutan sama dengan sklearn) agar hasil bit-for-bit sama
+        contributions = self.path_length.take(nodes)
+        depths = np.zeros(n_samples, dtype=np.float64)
+        for tree_idx in range(self.n_trees):
+            depths += contributions[tree_idx]
+        return depths
+
+    def _dense_depths(self, X):
+        """Blok matriks penuh X (float32, C-contiguous)."""
+        X_flat = X.ravel()
+        row_base = (np.arange(X.shape[0], dtype=self.index_dtype) * self.n_features)[np.newaxis, :]
+        return self._path_depths(lambda feature: X_flat.take(row_base + feature), X.shape[0])
+
+    def _indexed_depths(self, dense, dense_position, hot_columns):
+        """
+        Blok dalam bentuk terindeks: kolom 'dense' (fitur dasar) + SATU kolom
+        one-hot bernilai 1 per baris. Kolom one-hot lain bernilai 0 tanpa perlu
+        disimpan, jadi biayanya tidak bergantung pada jumlah device.
+        """
+        n_samples, n_dense = dense.shape
+        dense_flat = dense.ravel()
+        row_base = (np.arange(n_samples, dtype=self.index_dtype) * n_dense)[np.newaxis, :]
+        hot = hot_columns[np.newaxis, :]
+
+        def lookup_values(feature):
+            position = dense_position.take(feature)
+            return np.where(
+                position >= 0,
+                dense_flat.take(row_base + np.maximum(position, 0)),
+                (feature == hot).astype(np.float32),
+            )
+
+        return self._path_depths(lookup_values, n_samples)
+
+    def _scores_from_depths(self, depths):
+        scores = 2 ** (
+            -np.divide(depths, self.denominator, out=np.ones_like(depths), where=self.denominator != 0)
+        )
+        return -scores
+
+    def score_samples(self, X):
+        """Sama dengan IsolationForest.score_samples (semakin kecil = semakin anomali)."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        # Diproses per blok agar array (n_pohon x n_baris) tetap muat di cache CPU
+        depths = np.concatenate([
+            self._dense_depths(X[start:start + BLOCK_ROWS])
+            for start in range(0, X.shape[0], BLOCK_ROWS)
+        ]) if X.shape[0] else np.zeros(0, dtype=np.float64)
+        return self._scores_from_depths(depths)
+
+    def score_samples_indexed(self, dense, dense_columns, hot_columns):
+        """
+        score_samples untuk input terindeks (tanpa membangun matriks one-hot penuh).
+
+        dense        : array (n_baris, k) berisi nilai fitur non-one-hot
+        dense_columns: indeks kolom model untuk setiap kolom 'dense' (panjang k)
+        hot_columns  : array (n_baris,) indeks kolom one-hot yang bernilai 1
+                       untuk tiap baris, atau -1 jika tidak ada
+        """
+        dense = np.ascontiguousarray(dense, dtype=np.float32)
+        hot_columns = np.asarray(hot_columns, dtype=self.index_dtype)
+        dense_position = np.full(self.n_features, -1, dtype=self.index_dtype)
+        dense_position[np.asarray(dense_columns, dtype=np.intp)] = np.arange(len(dense_columns))
+
+        depths = np.concatenate([
+            self._indexed_depths(dense[start:start + BLOCK_ROWS], dense_position, hot_columns[start:start + BLOCK_ROWS])
+            for start in range(0, dense.shape[0], BLOCK_ROWS)
+        ]) if dense.shape[0] else np.zeros(0, dtype=np.float64)
+        return self._scores_from_depths(depths)
+
+    def predict_indexed(self, dense, dense_columns, hot_columns):
+        """predict untuk input terindeks (lihat score_samples_indexed)."""
+        return self._predict_from_scores(self.score_samples_indexed(dense, dense_columns, hot_columns))
+
+    def _predict_from_scores(self, scores):
+        is_inlier = np.ones(scores.shape[0], dtype=int)
+        is_inlier[scores - self.offset < 0] = -1
+        return is_inlier
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset
+
+    def predict(self, X):
+        """Sama dengan IsolationForest.predict: -1 untuk anomali, 1 untuk normal."""
+        return self._predict_from_scores(self.score_samples(X))
+
+
+# Array yang disimpan ke .npy; sisanya (skalar) ke meta.json
+COMPILED_ARRAYS = ('roots', 'feature', 'threshold', 'children', 'missing_right', 'path_length', 'denominator')
+COMPILED_META_FILE = 'meta.json'
+
+
+def save_compiled(compiled, directory):
+    """
+    Menyimpan array compiled ke directory (satu file .npy per array). Ditulis ke
+    direktori sementara lalu di-rename, jadi proses lain tidak pernah melihat isi
+    setengah jadi; jika proses lain sudah lebih dulu menyimpan, hasil ini dibuang.
+    """
+    tmp_dir = f"{directory}.tmp{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    try:
+        for name in COMPILED_ARRAYS:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.asarray(getattr(compiled, name)))
+        meta = {
+            'n_trees': compiled.n_trees,
+            'n_features': int(compiled.n_features),
+            'max_depth': compiled.max_depth,
+            'offset': float(compiled.offset),
+        }
+        with open(os.path.join(tmp_dir, COMPILED_META_FILE), 'w') as f:
+            json.dump(meta, f)
+        os.rename(tmp_dir, directory)
+    except OSError:
+        if os.path.isdir(directory):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        raise
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_compiled(directory, mmap_mode='r'):
+    """Memuat CompiledIsolationForest dari save_compiled; None jika belum ada."""
+    meta_path = os.path.join(directory, COMPILED_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+
+    compiled = CompiledIsolationForest.__new__(CompiledIsolationForest)
+    for name in COMPILED_ARRAYS:
+        # np.asarray: ndarray biasa (tanpa overhead subclass memmap) di atas mmap yang sama
+        setattr(compiled, name, np.asarray(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)))
+    compiled.n_trees = meta['n_trees']
+    compiled.n_features = meta['n_features']
+    compiled.max_depth = meta['max_depth']
+    compiled.offset = meta['offset']
+    compiled.index_dtype = compiled.feature.dtype.type
+    return compiled
+
+
+def compile_isolation_forest(model):
+    """
+    Membuat CompiledIsolationForest dari model, atau None jika model bukan
+    IsolationForest berbasis pohon (mis. tipe model lain).
+    """
+    if not all(hasattr(model, attr) for attr in ('estimators_', 'estimators_features_', 'offset_', '_max_samples')):
+        return None
+    return CompiledIsolationForest(model)
+
+
+def verify_compiled_model(compiled, model, X_df, dense_columns=None, hot_candidates=None):
+    """
+    Membandingkan hasil compiled dengan model asli pada satu set uji.
+    Mengembalikan True hanya jika predict DAN score_samples identik bit-for-bit.
+    Jika dense_columns/hot_candidates (kolom One-Hot) diberikan, jalur terindeks
+    juga diverifikasi; setiap baris uji harus memiliki paling banyak satu kolom
+    One-Hot bernilai 1.
+    """
+    X = X_df.to_numpy(dtype=np.float64)
+    expected_scores = model.score_samples(X_df)
+    if not (
+        np.array_equal(compiled.predict(X), model.predict(X_df))
+        and np.array_equal(compiled.score_samples(X), expected_scores)
+    ):
+        return False
+    if dense_columns is None:
+        return True
+
+    hot_columns = np.full(X.shape[0], -1, dtype=np.intp)
+    if hot_candidates:
+        hot_candidates = np.asarray(hot_candidates, dtype=np.intp)
+        hot_block = X[:, hot_candidates]
+        has_hot = hot_block.max(axis=1) == 1
+        hot_columns[has_hot] = hot_candidates[hot_block[has_hot].argmax(axis=1)]
+    indexed_scores = compiled.score_samples_indexed(X[:, dense_columns], dense_columns, hot_columns)
+    return np.array_equal(indexed_scores, expected_scores)
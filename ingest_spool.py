@@ -0,0 +1,229 @@
+# ingest_spool.py
+# Spool append-only di disk untuk mqtt_listener (write-ahead sebelum database).
+# Bacaan ditulis ke file segmen berukuran tetap yang di-mmap, sehingga append
+# hanyalah salinan memori: latensi ingest tidak bergantung pada kondisi database.
+# Drainer membaca spool per batch, menulisnya ke DB, lalu menyimpan posisi baca
+# (checkpoint). Segmen yang sudah habis dibaca dihapus.
+#
+# Isi direktori spool:
+#   0000000000.spool, 0000000001.spool, ...   segmen (diisi nol saat dibuat)
+#   checkpoint.json                           {"segment": n, "offset": byte}
+#
+# Format record: uint16 panjang isi, uint32 crc32 isi, isi = float64 epoch,
+# float64 temperature, float64 humidity, device_id (UTF-8). Panjang 0 menandai
+# akhir data di segmen; record yang terpotong (crash saat menulis) gagal cek
+# CRC dan dianggap akhir segmen saat pemulihan.
+
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+SEGMENT_SUFFIX = '.spool'
+CHECKPOINT_FILE_NAME = 'checkpoint.json'
+RECORD_HEADER = struct.Struct('<HI')
+READING = struct.Struct('<ddd')
+# device_id VARCHAR(100) dalam UTF-8 terpanjang (4 byte per karakter)
+MAX_DEVICE_BYTES = 400
+
+
+class DiskSpool:
+    """
+    Antrean FIFO bacaan (epoch, temperature, humidity, device_id) di disk.
+    Aman dipakai satu thread penulis (append) dan satu thread pembaca
+    (read_batch/commit) sekaligus.
+    """
+
+    def __init__(self, directory, segment_bytes, max_bytes):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max(2, max_bytes // segment_bytes)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # seq -> (file, mmap) untuk segmen yang belum habis dibaca; hanya commit()
+        # yang menutupnya, jadi penulis dan pembaca tidak saling menutup mmap
+        self._maps = {}
+        self._maps_lock = threading.Lock()
+
+        self.read_seq, self.read_offset = self._load_checkpoint()
+        segments = self._list_segments()
+        for seq in segments:
+            if seq < self.read_seq:
+                # Sisa segmen yang sudah selesai dibaca sebelum proses berhenti
+                os.remove(self._segment_path(seq))
+        segments = [seq for seq in segments if seq >= self.read_seq]
+        if not segments:
+            self.read_offset = 0
+            segments = [self.read_seq]
+
+        # Pemulihan: posisi tulis = akhir record valid di segmen terakhir
+        self.write_seq = segments[-1]
+        self.write_offset = self._scan_end(self.write_seq)
+        self.pending = self._count_pending()
+
+    # --- file & segmen ---
+    def _segment_path(self, seq):
+        return os.path.join(self.directory, f"{seq:010d}{SEGMENT_SUFFIX}")
+
+    def _list_segments(self):
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+
+    def _map(self, seq):
+        """mmap segmen (dibuat dan diisi nol jika belum ada)."""
+        with self._maps_lock:
+            entry = self._maps.get(seq)
+            if entry is None:
+                path = self._segment_path(seq)
+                f = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+                if os.fstat(f.fileno()).st_size < self.segment_bytes:
+                    f.truncate(self.segment_bytes)
+                entry = self._maps[seq] = (f, mmap.mmap(f.fileno(), self.segment_bytes))
+            return entry[1]
+
+    def _unmap(self, seq):
+        with self._maps_lock:
+            entry = self._maps.pop(seq, None)
+        if entry is not None:
+            entry[1].close()
+            entry[0].close()
+
+    def _load_checkpoint(self):
+        path = os.path.join(self.directory, CHECKPOINT_FILE_NAME)
+        if not os.path.exists(path):
+            return 0, 0
+        with open(path) as f:
+            data = json.load(f)
+        return int(data['segment']), int(data['offset'])
+
+    def _save_checkpoint(self):
+        path = os.path.join(self.directory, CHECKPOINT_FILE_NAME)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'segment': self.read_seq, 'offset': self.read_offset}, f)
+        # Ganti secara atomik agar checkpoint tidak pernah setengah tertulis
+        os.replace(tmp_path, path)
+
+    # --- record ---
+    def _read_record(self, buf, offset, limit):
+        """Mengembalikan (bacaan, offset berikutnya) atau (None, offset) di akhir data."""
+        if offset + RECORD_HEADER.size > limit:
+            return None, offset
+        length, crc = RECORD_HEADER.unpack_from(buf, offset)
+        start = offset + RECORD_HEADER.size
+        end = start + length
+        if length <= READING.size or end > limit:
+            return None, offset
+        body = buf[start:end]
+        if zlib.crc32(body) != crc:
+            return None, offset
+        epoch, temp, hum = READING.unpack_from(body)
+        return (epoch, temp, hum, body[READING.size:].decode('utf-8')), end
+
+    def _scan_end(self, seq):
+        buf = self._map(seq)
+        offset = 0
+        while True:
+            reading, offset = self._read_record(buf, offset, self.segment_bytes)
+            if reading is None:
+                return offset
+
+    def _count_pending(self):
+        """Jumlah bacaan yang belum dibaca (dipanggil sekali saat pemulihan)."""
+        count = 0
+        for seq in range(self.read_seq, self.write_seq + 1):
+            buf = self._map(seq)
+            offset = self.read_offset if seq == self.read_seq else 0
+            limit = self.write_offset if seq == self.write_seq else self.segment_bytes
+            while True:
+                reading, offset = self._read_record(buf, offset, limit)
+                if reading is None:
+                    break
+                count += 1
+        return count
+
+    # --- API ---
+    def __len__(self):
+        return self.pending
+
+    def append(self, reading):
+        """
+        Menambah satu bacaan. False jika spool penuh (SPOOL_MAX_BYTES tercapai).
+        ValueError jika device_id lebih dari MAX_DEVICE_BYTES byte UTF-8: memotongnya
+        bisa membelah karakter multibyte sehingga record tidak bisa dibaca drainer.
+        """
+        epoch, temp, hum, device = reading
+        device_bytes = device.encode('utf-8')
+        if len(device_bytes) > MAX_DEVICE_BYTES:
+            raise ValueError(f"device_id {len(device_bytes)} byte, maks. {MAX_DEVICE_BYTES}")
+        body = READING.pack(epoch, temp, hum) + device_bytes
+        record = RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+        with self._lock:
+            if self.write_offset + len(record) > self.segment_bytes:
+                if self.write_seq + 1 - self.read_seq >= self.max_segments:
+                    return False
+                # Segmen penuh: sisa byte nol di akhirnya menjadi penanda akhir data
+                self._map(self.write_seq).flush()
+                self.write_seq += 1
+                self.write_offset = 0
+            buf = self._map(self.write_seq)
+            buf[self.write_offset:self.write_offset + len(record)] = record
+            self.write_offset += len(record)
+            self.pending += 1
+        return True
+
+    def _read_from(self, seq, offset, max_records):
+        with self._lock:
+            write_seq, write_offset = self.write_seq, self.write_offset
+        readings = []
+        while len(readings) < max_records:
+            limit = write_offset if seq == write_seq else self.segment_bytes
+            reading, next_offset = self._read_record(self._map(seq), offset, limit)
+            if reading is not None:
+                readings.append(reading)
+                offset = next_offset
+                continue
+            if seq >= write_seq:
+                break
+            # Akhir segmen lama: lanjut ke segmen berikutnya
+            seq, offset = seq + 1, 0
+        return readings, (seq, offset)
+
+    def read_batch(self, max_records):
+        """
+        Membaca maks. max_records bacaan mulai dari checkpoint, tanpa memajukannya.
+        Mengembalikan (bacaan, posisi); panggil commit(posisi, len(bacaan)) setelah
+        bacaan tersimpan di database.
+        """
+        return self._read_from(self.read_seq, self.read_offset, max_records)
+
+    def commit(self, position, count):
+        """Memajukan checkpoint dan menghapus segmen yang sudah habis dibaca."""
+        seq, offset = position
+        old_seq = self.read_seq
+        with self._lock:
+            self.read_seq, self.read_offset = seq, offset
+            self.pending -= count
+            self._save_checkpoint()
+            for done_seq in range(old_seq, seq):
+                self._unmap(done_seq)
+                try:
+                    os.remove(self._segment_path(done_seq))
+                except FileNotFoundError:
+                    pass
+
+    def flush(self):
+        """msync segmen yang sedang ditulis (bertahan saat listrik padam, bukan hanya crash proses)."""
+        with self._lock:
+            self._map(self.write_seq).flush()
+
+    def close(self):
+        with self._lock:
+            for seq in list(self._maps):
+                self._map(seq).flush()
+                self._unmap(seq)
@@ -0,0 +1,252 @@
+# latest_cache.py
+# Cache bacaan terbaru per device di memori untuk api_server (/api/v1/latest_data).
+# Satu thread latar memegang koneksi khusus yang men-LISTEN:
+#   - "sensor_readings_new"    (mqtt_listener, setiap batch insert)
+#   - "sensor_readings_scored" (ai_engine, setiap batch flag is_anomaly ditulis)
+# Payload keduanya = JSON daftar device_id yang berubah (device_notify_payloads).
+# Notifikasi baru dikirim PostgreSQL setelah transaksinya COMMIT, jadi bacaan
+# terbaru setiap device di payload dibaca ulang saat notifikasi tiba. Urutan
+# id antar penulis (beberapa listener, spool yang diputar ulang) tidak
+# berpengaruh: tidak ada watermark id yang bisa terlewati.
+#
+# Penulis yang tidak mengirim notifikasi (atau notifikasi yang hilang) tetap
+# terlihat: setiap refresh_interval SEMUA device di cache dibaca ulang. Cache
+# dianggap segar hanya jika refresh penuh terakhir belum lebih lama dari max_age;
+# jika tidak (DB mati, koneksi putus), get() melaporkan miss dan pemanggil
+# kembali ke query database biasa.
+
+import json
+import select
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+NEW_ROWS_CHANNEL = "sensor_readings_new"
+SCORED_CHANNEL = "sensor_readings_scored"
+
+LATEST_COLUMNS = "id, EXTRACT(EPOCH FROM timestamp_utc) AS timestamp, temperature, humidity, device_id, is_anomaly"
+# Batas payload NOTIFY PostgreSQL adalah 8000 byte
+NOTIFY_PAYLOAD_MAX_BYTES = 7900
+
+
+def device_notify_payloads(device_ids):
+    """JSON daftar device_id unik untuk pg_notify, dipecah per NOTIFY_PAYLOAD_MAX_BYTES."""
+    payloads, chunk, size = [], [], 2
+    # ensure_ascii: panjang string = panjang byte payload
+    for device in sorted({str(device) for device in device_ids if device is not None}):
+        encoded = json.dumps(device)
+        if chunk and size + len(encoded) + 1 > NOTIFY_PAYLOAD_MAX_BYTES:
+            payloads.append('[' + ','.join(chunk) + ']')
+            chunk, size = [], 2
+        chunk.append(encoded)
+        size += len(encoded) + 1
+    if chunk:
+        payloads.append('[' + ','.join(chunk) + ']')
+    return payloads
+
+
+def latest_record_to_data(record):
+    """Baris sensor_readings -> isi 'data' respons latest_data."""
+    return {
+        "timestamp": int(record['timestamp']),
+        "temperature": float(record['temperature']),
+        "humidity": float(record['humidity']),
+        "device_id": record['device_id'],
+        "is_anomaly": record.get('is_anomaly'),
+    }
+
+
+class LatestReadingCache:
+    """
+    device_id -> (id, data) bacaan terbaru, plus bacaan terbaru secara keseluruhan.
+    Device yang diketahui belum punya data diingat terpisah, maks. max_missing
+    device (LRU), agar device_id acak dari request tidak membuat cache tumbuh
+    tanpa batas.
+    """
+
+    def __init__(self, connect, refresh_interval, max_age, max_missing, reconnect_delay):
+        self._connect = connect
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.max_missing = max_missing
+        self.reconnect_delay = reconnect_delay
+
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._missing = OrderedDict()   # device_id -> None, urut dari yang paling lama tidak dipakai
+        self._overall = None            # (id, data) atau None jika tabel kosong
+        self._loaded = False            # False = belum dimuat sejak (re)connect
+        self._refreshed_at = None       # time.monotonic() awal refresh penuh sukses terakhir
+        self._thread = None
+        self.refreshes = 0
+        self.hits = 0
+        self.misses = 0
+
+    # --- sisi request ---
+    def start(self):
+        """Thread dibuat saat pertama dipakai (setelah fork worker / reloader Flask)."""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True, name='latest-cache')
+                    self._thread.start()
+
+    def is_fresh(self):
+        refreshed_at = self._refreshed_at
+        return refreshed_at is not None and time.monotonic() - refreshed_at <= self.max_age
+
+    def get(self, device_id=None):
+        """
+        Mengembalikan (hit, data). hit False = cache dingin/basi atau device belum
+        dikenal; pemanggil harus query database lalu memanggil remember().
+        data None (dengan hit True) = memang belum ada data.
+        """
+        self.start()
+        if self.is_fresh():
+            with self._lock:
+                if device_id is None:
+                    entry, known = self._overall, True
+                elif device_id in self._missing:
+                    self._missing.move_to_end(device_id)
+                    entry, known = None, True
+                else:
+                    known = device_id in self._devices
+                    entry = self._devices.get(device_id)
+            if known:
+                self.hits += 1
+                return True, entry[1] if entry is not None else None
+        self.misses += 1
+        return False, None
+
+    def remember(self, device_id, record):
+        """Menyimpan hasil query fallback (record memuat kolom id) atau None jika tidak ada data."""
+        if device_id is None or not self._loaded:
+            return
+        with self._lock:
+            if record is not None:
+                self._store(record)
+            elif device_id not in self._devices:
+                self._missing[device_id] = None
+                self._missing.move_to_end(device_id)
+                while len(self._missing) > self.max_missing:
+                    self._missing.popitem(last=False)
+
+    # --- sisi thread refresh ---
+    def _store(self, record):
+        """Dipanggil dengan _lock dipegang; hanya menimpa entri yang lebih lama."""
+        row_id = record['id']
+        entry = (row_id, latest_record_to_data(record))
+        self._missing.pop(record['device_id'], None)
+        current = self._devices.get(record['device_id'])
+        if current is None or current[0] <= row_id:
+            self._devices[record['device_id']] = entry
+        if self._overall is None or self._overall[0] <= row_id:
+            self._overall = entry
+
+    def _load_initial(self, cur):
+        """
+        Setelah (re)connect notifikasi selama terputus hilang: buang semua entri.
+        Device dimuat lagi saat diminta (remember) atau saat ada bacaan barunya.
+        """
+        with self._lock:
+            self._devices.clear()
+            self._missing.clear()
+            self._overall = None
+        self._refresh_overall(cur)
+        self._loaded = True
+
+    def _refresh_overall(self, cur):
+        cur.execute(f"SELECT {LATEST_COLUMNS} FROM sensor_readings ORDER BY id DESC LIMIT 1;")
+        record = cur.fetchone()
+        if record is not None:
+            with self._lock:
+                self._store(record)
+
+    def _refresh_all(self, cur):
+        """Refresh penuh: bacaan terbaru keseluruhan dan setiap device yang di-cache."""
+        with self._lock:
+            device_ids = list(self._devices)
+        if device_ids:
+            self._refresh_devices(cur, device_ids)
+        self._refresh_overall(cur)
+
+    def _refresh_devices(self, cur, device_ids):
+        """
+        Membaca ulang bacaan terbaru (id terbesar) setiap device. Entri diganti
+        dengan dict baru (flag is_anomaly ikut terbaca), tidak pernah diubah di
+        tempat: dict lama mungkin sedang dipakai request.
+        """
+        cur.execute(
+            f"""
+            SELECT latest.*
+            FROM unnest(%s::varchar[]) AS wanted(device_id)
+            CROSS JOIN LATERAL (
+                SELECT {LATEST_COLUMNS}
+                FROM sensor_readings
+                WHERE sensor_readings.device_id = wanted.device_id
+                ORDER BY id DESC
+                LIMIT 1
+            ) AS latest;
+            """,
+            (sorted(device_ids),),
+        )
+        records = cur.fetchall()
+        with self._lock:
+            for record in records:
+                self._store(record)
+
+    def _wait_for_notifications(self, conn, timeout):
+        """
+        Mengembalikan (set channel yang mengirim notifikasi, set device_id yang
+        berubah); keduanya kosong jika timeout.
+        """
+        channels, device_ids = set(), set()
+        if select.select([conn], [], [], timeout) != ([], [], []):
+            conn.poll()
+            # Semua notifikasi yang menumpuk digabung menjadi satu refresh
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                channels.add(notify.channel)
+                try:
+                    device_ids.update(json.loads(notify.payload))
+                except (ValueError, TypeError):
+                    print(f"[WARN] Payload notifikasi {notify.channel} tidak dikenali, diabaikan.")
+        return channels, device_ids
+
+    def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute(f"LISTEN {NEW_ROWS_CHANNEL};")
+                    cur.execute(f"LISTEN {SCORED_CHANNEL};")
+                    self._load_initial(cur)
+                    print("[INFO] Cache latest_data aktif.")
+                    channels, device_ids = set(), set()
+                    next_full_refresh = time.monotonic()
+                    while True:
+                        started = time.monotonic()
+                        if started >= next_full_refresh:
+                            self._refresh_all(cur)
+                            self._refreshed_at = started
+                            next_full_refresh = started + self.refresh_interval
+                        else:
+                            if device_ids:
+                                self._refresh_devices(cur, device_ids)
+                            if NEW_ROWS_CHANNEL in channels:
+                                self._refresh_overall(cur)
+                        self.refreshes += 1
+                        timeout = max(next_full_refresh - time.monotonic(), 0)
+                        channels, device_ids = self._wait_for_notifications(conn, timeout)
+            except (psycopg2.Error, OSError) as e:
+                self._loaded = False
+                print(f"[WARN] Cache latest_data terputus, request kembali ke database: {e}")
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+            time.sleep(self.reconnect_delay)
@@ -0,0 +1,132 @@
+# model_shards.py
+# Penyimpanan model per device / grup device untuk ai_engine.
+# Satu direktori berisi banyak file model '<kunci>.joblib'. Model dimuat saat
+# pertama kali dibutuhkan (lazy) dan dikeluarkan dari memori dengan urutan LRU
+# jika total ukurannya melebihi anggaran memori.
+#
+# Pemetaan device -> grup dibaca dari '<direktori>/shards.json', contoh:
+#   {"sensor_001": "gedung_a", "sensor_002": "gedung_a", "sensor_101": "gedung_b"}
+# Device yang tidak ada di pemetaan memakai device_id-nya sendiri sebagai kunci.
+
+import json
+import os
+from collections import OrderedDict
+
+SHARD_MAP_FILE_NAME = 'shards.json'
+SHARD_FILE_SUFFIX = '.joblib'
+
+
+class ModelShard:
+    """Satu model yang siap dipakai beserta tabel lookup fiturnya."""
+
+    def __init__(self, model, features, compiled, dense_columns, device_columns, nbytes, mtime=None):
+        self.model = model
+        self.features = features
+        self.compiled = compiled
+        # Indeks kolom fitur non-device dan tabel device_id -> kolom One-Hot
+        self.dense_columns = dense_columns
+        self.device_columns = device_columns
+        # Perkiraan memori yang dipakai model (untuk anggaran LRU)
+        self.nbytes = nbytes
+        self.mtime = mtime
+        # Penanda unik model ini di cache prediksi (diisi oleh ai_engine)
+        self.cache_token = None
+        # True jika feature_names_ memuat fitur rolling (diisi oleh ai_engine)
+        self.uses_rolling = False
+
+
+class ShardedModelStore:
+    """
+    Cache LRU untuk model-model di satu direktori.
+    loader(path) harus mengembalikan ModelShard atau melempar exception.
+    """
+
+    def __init__(self, directory, memory_budget_bytes, loader):
+        self.directory = directory
+        self.memory_budget_bytes = memory_budget_bytes
+        self.loader = loader
+        self.device_to_key = self._read_shard_map()
+        self._shards = OrderedDict()
+        self._total_bytes = 0
+        # Kunci yang file-nya tidak ada / gagal dimuat, beserta mtime saat dicoba
+        self._failed = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def _read_shard_map(self):
+        path = os.path.join(self.directory, SHARD_MAP_FILE_NAME)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return {str(device): str(key) for device, key in json.load(f).items()}
+
+    def key_for(self, device_id):
+        """Kunci model untuk satu device (grup dari shards.json atau device_id itu sendiri)."""
+        if device_id is None:
+            return None
+        device_id = str(device_id)
+        return self.device_to_key.get(device_id, device_id)
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}{SHARD_FILE_SUFFIX}")
+
+    def get(self, key):
+        """
+        Mengembalikan ModelShard untuk kunci ini, memuatnya jika belum ada di
+        memori (atau jika file-nya sudah diganti). None jika tidak tersedia.
+        """
+        if key is None:
+            return None
+        path = self.path_for(key)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+
+        shard = self._shards.get(key)
+        if shard is not None and shard.mtime == mtime:
+            self._shards.move_to_end(key)
+            return shard
+        if shard is not None:
+            # File model grup ini diganti (retrain): buang versi lama
+            print(f"[INFO] Model grup '{key}' berubah, memuat ulang.")
+            self._remove(key)
+
+        if mtime is None or self._failed.get(key) == mtime:
+            return None
+        try:
+            shard = self.loader(path)
+        except Exception as e:
+            print(f"[ERROR] Gagal memuat model grup '{key}' dari {path}: {e}")
+            self._failed[key] = mtime
+            return None
+
+        shard.mtime = mtime
+        self._failed.pop(key, None)
+        self._shards[key] = shard
+        self._total_bytes += shard.nbytes
+        self.loads += 1
+        print(f"[INFO] Model grup '{key}' dimuat (~{shard.nbytes / 1e6:.1f} MB, total {self._total_bytes / 1e6:.1f} MB).")
+        self._evict_over_budget(keep=key)
+        return shard
+
+    def _remove(self, key):
+        shard = self._shards.pop(key)
+        self._total_bytes -= shard.nbytes
+
+    def _evict_over_budget(self, keep):
+        """Keluarkan model yang paling lama tidak dipakai sampai total <= anggaran."""
+        while self._total_bytes > self.memory_budget_bytes and len(self._shards) > 1:
+            oldest_key = next(iter(self._shards))
+            if oldest_key == keep:
+                break
+            self._remove(oldest_key)
+            self.evictions += 1
+            print(f"[INFO] Model grup '{oldest_key}' dikeluarkan dari memori (LRU).")
+
+    def __len__(self):
+        return len(self._shards)
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
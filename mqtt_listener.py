@@ -1,7 +1,19 @@
 import paho.mqtt.client as mqtt
 import psycopg2
-import json
-from datetime import datetime
+import io
+import math
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from ingest_spool import DiskSpool
+from latest_cache import device_notify_payloads
+from reading_dedup import DuplicateFilter
+from sensor_payload import PayloadError, decode_payload
 
 # --- KONFIGURASI DATABASE ---
 DB_HOST = "127.0.0.1"  # Ganti dengan 'test_db' jika di lingkungan Docker test
@@ -13,6 +25,74 @@ DB_PASS = "Naufal"
 MQTT_BROKER = "broker.emqx.io" # Mosquitto berjalan di VPS yang sama
 MQTT_PORT = 1883
 MQTT_TOPIC = "dht/sensor_data"
+# Topik yang di-subscribe; boleh memakai wildcard, mis. "dht/+/sensor_data" (per site)
+MQTT_TOPICS = [MQTT_TOPIC]
+# Grup shared subscription ($share/<grup>/<topik>) saat listener dijalankan multi-proses:
+# broker membagi pesan ke anggota grup sehingga setiap pesan diterima satu proses saja
+SHARED_SUBSCRIPTION_GROUP = "safe-ingest"
+
+# --- KONFIGURASI SUPERVISOR (--workers) ---
+SUPERVISOR_CHECK_INTERVAL = 2      # Detik antar pengecekan proses worker
+WORKER_RESTART_BACKOFF_MAX = 60    # Detik; jeda restart maksimum untuk worker yang terus crash
+WORKER_STABLE_SECONDS = 60         # Worker yang hidup selama ini dianggap sehat (backoff di-reset)
+
+# --- KONFIGURASI NOTIFY ---
+# Channel yang di-LISTEN oleh ai_engine agar langsung memproses data baru
+NOTIFY_CHANNEL = "sensor_readings_new"
+
+# --- KONFIGURASI BUFFERED WRITER ---
+# Bacaan ditampung lalu ditulis dengan COPY per batch dari thread terpisah
+BULK_FLUSH_ROWS = 500              # Flush begitu buffer berisi sebanyak ini
+BULK_FLUSH_INTERVAL = 0.5          # Detik; flush paling lambat setelah selang ini
+BULK_MAX_BUFFERED_ROWS = 100000    # Batas buffer saat DB lambat/putus (bacaan tertua dibuang)
+BULK_RETRY_DELAY = 2               # Detik jeda sebelum mencoba lagi setelah insert gagal
+
+# --- VALIDASI BACAAN ---
+# Batas kolom sensor_readings. Satu baris yang ditolak database menggagalkan
+# seluruh batch COPY, jadi bacaan di luar batas ini sudah dibuang di parse_reading.
+DEVICE_ID_MAX_LENGTH = 100         # device_id VARCHAR(100)
+READING_VALUE_LIMIT = 9999.9       # temperature/humidity NUMERIC(5,1)
+
+# Port endpoint /metrics (Prometheus) untuk mode --asyncio
+LISTENER_METRICS_PORT = 9110
+
+# --- KONFIGURASI INLINE SCORING ---
+# Jika True (atau --inline-scoring), listener memuat model ai_engine sekali dan
+# menilai setiap micro-batch sebelum ditulis, sehingga baris langsung tersimpan
+# dengan is_anomaly terisi. Baris yang gagal dinilai tetap NULL dan diproses ai_engine.
+INLINE_SCORING = False
+INLINE_FLUSH_INTERVAL = 0.05       # Detik; micro-batch lebih pendek demi latensi sensor -> vonis
+
+# --- KONFIGURASI SPOOL DISK ---
+# Jika True (atau --spool), bacaan ditulis dulu ke spool append-only di disk lalu
+# diputar ulang ke database oleh thread drainer (lihat ingest_spool.py)
+SPOOL_ENABLED = False
+SPOOL_DIR = "ingest_spool"
+SPOOL_SEGMENT_BYTES = 64 * 1024 * 1024     # Ukuran satu file segmen
+SPOOL_MAX_BYTES = 1024 * 1024 * 1024       # Batas total spool; di atas ini bacaan baru dibuang
+SPOOL_DRAIN_BATCH_ROWS = 5000              # Bacaan per COPY saat memutar ulang spool
+SPOOL_SYNC_INTERVAL = 1.0                  # Detik antar msync segmen aktif
+
+# --- KONFIGURASI DEDUP ---
+# Bacaan dengan (device_id, timestamp) yang baru saja diterima dibuang di memori.
+# Bacaan yang dibuang listener sebelum tersimpan (buffer/spool penuh, ditolak
+# database) dihapus lagi dari penyaring, jadi kiriman ulang device tetap diterima.
+DEDUP_ENABLED = True
+DEDUP_WINDOW_PER_DEVICE = 256              # Epoch terakhir yang diingat per device
+DEDUP_MAX_DEVICES = 100000                 # Device yang diingat (LRU)
+# Jaminan kebenaran ada di database. Jika unique index ini ada, batch ditulis lewat
+# tabel staging + ON CONFLICT DO NOTHING (COPY langsung akan gagal satu batch penuh).
+# Buat sekali, setelah duplikat lama dibersihkan:
+#   CREATE UNIQUE INDEX CONCURRENTLY sensor_readings_device_ts_key
+#       ON sensor_readings (device_id, timestamp_utc);
+DEDUP_UNIQUE_INDEX = "sensor_readings_device_ts_key"
+
+DEDUP_FILTER = DuplicateFilter(DEDUP_WINDOW_PER_DEVICE, DEDUP_MAX_DEVICES) if DEDUP_ENABLED else None
+# None = belum dicek; True/False = unique index DEDUP_UNIQUE_INDEX ada/tidak
+_dedup_index_available = None
+
+# Modul ai_engine yang sudah memuat model (diisi init_inline_scoring)
+SCORER = None
 
 def connect_db():
     """Membuat koneksi ke database PostgreSQL."""
@@ -28,65 +108,483 @@ def connect_db():
         print(f"ERROR: Gagal koneksi ke database: {e}")
         return None
 
-def insert_data(conn, data):
-    """Menyimpan data sensor ke tabel database."""
-    # Pastikan data memiliki timestamp, temperature, dan humidity
-    sql = """
-    INSERT INTO sensor_readings (timestamp_utc, temperature, humidity, device_id)
-    VALUES (to_timestamp(%s), %s, %s, %s);
+def parse_reading(data):
+    """
+    Memvalidasi satu pesan sensor dan mengubahnya menjadi tuple
+    (timestamp_epoch, temperature, humidity, device_id), atau None jika tidak valid.
     """
-    
     # Data dari ESP8266 menggunakan Unix Epoch Time (detik)
     timestamp_epoch = data.get('timestamp')
     temp = data.get('temperature')
     hum = data.get('humidity')
     device = data.get('device_id')
-    
+
     if not all([timestamp_epoch, temp, hum, device]):
         print("Data tidak lengkap, mengabaikan.")
-        return
-        
+        return None
     try:
-        cur = conn.cursor()
-        cur.execute(sql, (timestamp_epoch, temp, hum, device))
-        conn.commit()
-        print(f"Data tersimpan: T={temp}C, H={hum}%")
-    except psycopg2.Error as e:
-        print(f"ERROR: Gagal insert data: {e}")
+        reading = (float(timestamp_epoch), float(temp), float(hum), str(device))
+        # Epoch di luar jangkauan akan menggagalkan seluruh batch COPY nanti
+        datetime.fromtimestamp(reading[0], tz=timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        print("Data tidak valid (bukan angka), mengabaikan.")
+        return None
+    if not (math.isfinite(reading[1]) and math.isfinite(reading[2])):
+        print("Data tidak valid (bukan angka), mengabaikan.")
+        return None
+    # NUMERIC(5,1) membulatkan ke 1 desimal dulu, jadi 9999.95 sudah overflow
+    if abs(round(reading[1], 1)) > READING_VALUE_LIMIT or abs(round(reading[2], 1)) > READING_VALUE_LIMIT:
+        print("Data tidak valid (di luar jangkauan kolom), mengabaikan.")
+        return None
+    device = reading[3]
+    if len(device) > DEVICE_ID_MAX_LENGTH or '\x00' in device:
+        print(f"device_id tidak valid (maks. {DEVICE_ID_MAX_LENGTH} karakter, tanpa NUL), mengabaikan.")
+        return None
+    try:
+        # Surrogate tunggal dari JSON tidak bisa dikirim ke PostgreSQL (UTF-8)
+        device.encode('utf-8')
+    except UnicodeEncodeError:
+        print("device_id bukan teks UTF-8 yang valid, mengabaikan.")
+        return None
+    return reading
+
+def _copy_escape(value):
+    """Escape teks untuk format text COPY (backslash, tab, newline)."""
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+def init_inline_scoring(shared_stream=False):
+    """
+    Memuat model ai_engine satu kali untuk inline scoring. Mengembalikan True jika siap.
+    shared_stream=True jika proses ini hanya menerima sebagian pesan (shared subscription).
+    """
+    global SCORER, BULK_FLUSH_INTERVAL
+    # Diimpor di sini agar listener biasa tidak ikut memuat scikit-learn
+    import ai_engine
+
+    if shared_stream:
+        # Jendela rolling per proses hanya akan melihat sebagian bacaan tiap device
+        ai_engine.ROLLING_FEATURES_UNSUPPORTED = ai_engine.SHARED_STREAM_ROLLING_REASON
+    if not ai_engine.load_models():
+        print("ERROR: Model gagal dimuat, inline scoring dinonaktifkan.")
+        return False
+    if ai_engine.MODEL_RELOAD_CHECK_INTERVAL > 0:
+        ai_engine.start_model_watcher()
+    SCORER = ai_engine
+    BULK_FLUSH_INTERVAL = min(BULK_FLUSH_INTERVAL, INLINE_FLUSH_INTERVAL)
+    print("Inline scoring aktif: bacaan disimpan beserta is_anomaly.")
+    return True
+
+def score_readings(readings):
+    """
+    Menilai satu micro-batch dengan ai_engine. Mengembalikan is_anomaly per
+    bacaan (None = tidak dinilai), atau None jika inline scoring tidak aktif.
+    """
+    if SCORER is None:
+        return None
+    # Tukar model jika watcher sudah menyiapkan versi baru
+    SCORER.apply_pending_model()
+    rows = [
+        {'id': i, 'timestamp_utc': datetime.fromtimestamp(epoch, tz=timezone.utc),
+         'temperature': temp, 'humidity': hum, 'device_id': device}
+        for i, (epoch, temp, hum, device) in enumerate(readings)
+    ]
+    try:
+        results = SCORER.predict_batch(rows)
+    except Exception as e:
+        print(f"ERROR: Inline scoring gagal, {len(readings)} bacaan disimpan tanpa label: {e}")
+        return None
+    flags = [None] * len(readings)
+    for i, is_anomaly in results:
+        flags[i] = is_anomaly
+    return flags
+
+def is_duplicate_reading(reading):
+    """True jika bacaan ini (device_id, epoch) baru saja diterima dan harus dibuang."""
+    return DEDUP_FILTER is not None and DEDUP_FILTER.is_duplicate(reading[3], reading[0])
+
+def forget_reading(reading):
+    """Dipanggil untuk bacaan yang dibuang sebelum tersimpan (lihat reading_dedup)."""
+    if DEDUP_FILTER is not None:
+        DEDUP_FILTER.forget(reading[3], reading[0])
+
+def suppressed_duplicates():
+    """Jumlah duplikat yang dibuang penyaring memori sejak proses berjalan."""
+    return DEDUP_FILTER.suppressed if DEDUP_FILTER is not None else 0
+
+def dedup_index_available(cur):
+    """Mengecek (sekali per proses) apakah unique index (device_id, timestamp_utc) ada."""
+    global _dedup_index_available
+    if _dedup_index_available is None:
+        cur.execute(
+            "SELECT 1 FROM pg_indexes WHERE tablename = 'sensor_readings' AND indexname = %s;",
+            (DEDUP_UNIQUE_INDEX,),
+        )
+        _dedup_index_available = cur.fetchone() is not None
+        if not _dedup_index_available:
+            print(f"PERINGATAN: unique index '{DEDUP_UNIQUE_INDEX}' belum ada; duplikat di luar "
+                  f"jendela dedup memori tetap tersimpan (lihat DEDUP_UNIQUE_INDEX).")
+    return _dedup_index_available
+
+def insert_rows(conn, rows, flags=None):
+    """
+    Menyimpan banyak bacaan sekaligus dengan satu COPY dan satu COMMIT.
+    flags (opsional) berisi is_anomaly per bacaan dari inline scoring.
+    Mengembalikan jumlah bacaan yang dilewati database karena duplikat.
+    Melempar psycopg2.Error jika gagal (pemanggil yang melakukan rollback).
+    """
+    buf = io.StringIO()
+    if flags is None:
+        columns = "timestamp_utc, temperature, humidity, device_id"
+        for timestamp_epoch, temp, hum, device in rows:
+            ts = datetime.fromtimestamp(timestamp_epoch, tz=timezone.utc).isoformat()
+            buf.write(f"{ts}\t{temp!r}\t{hum!r}\t{_copy_escape(device)}\n")
+    else:
+        columns = "timestamp_utc, temperature, humidity, device_id, is_anomaly"
+        for (timestamp_epoch, temp, hum, device), is_anomaly in zip(rows, flags):
+            ts = datetime.fromtimestamp(timestamp_epoch, tz=timezone.utc).isoformat()
+            flag = '\\N' if is_anomaly is None else ('t' if is_anomaly else 'f')
+            buf.write(f"{ts}\t{temp!r}\t{hum!r}\t{_copy_escape(device)}\t{flag}\n")
+    buf.seek(0)
+
+    skipped = 0
+    with conn.cursor() as cur:
+        if dedup_index_available(cur):
+            # COPY ke tabel staging sementara, lalu salin dengan ON CONFLICT DO NOTHING
+            cur.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS sensor_readings_staging (
+                    timestamp_utc TIMESTAMPTZ, temperature NUMERIC, humidity NUMERIC,
+                    device_id VARCHAR(100), is_anomaly BOOLEAN
+                ) ON COMMIT DELETE ROWS;
+            """)
+            cur.copy_expert(f"COPY sensor_readings_staging ({columns}) FROM STDIN;", buf)
+            cur.execute(f"""
+                INSERT INTO sensor_readings ({columns})
+                SELECT {columns} FROM sensor_readings_staging
+                ON CONFLICT (device_id, timestamp_utc) DO NOTHING;
+            """)
+            skipped = len(rows) - cur.rowcount
+        else:
+            cur.copy_expert(f"COPY sensor_readings ({columns}) FROM STDIN;", buf)
+        # Terkirim saat COMMIT: membangunkan ai_engine dan memberi tahu cache
+        # latest_data device mana yang punya bacaan baru
+        # (payload = JSON daftar device_id, lihat latest_cache.device_notify_payloads)
+        for payload in device_notify_payloads(row[3] for row in rows):
+            cur.execute("SELECT pg_notify(%s, %s);", (NOTIFY_CHANNEL, payload))
+    conn.commit()
+    return skipped
+
+def write_batch(conn, rows, flags=None):
+    """
+    insert_rows yang tahan terhadap baris 'beracun'. Jika database menolak isi
+    data (DataError/IntegrityError, bukan masalah koneksi), batch dibelah dua
+    secara rekursif sampai baris penyebabnya ditemukan; baris itu dicatat dan
+    dibuang, sisanya tetap tersimpan. Mengembalikan (duplikat, ditolak).
+    Error lain (koneksi putus, DB mati) tetap dilempar agar batch dicoba lagi.
+    """
+    try:
+        return insert_rows(conn, rows, flags), 0
+    except (psycopg2.DataError, psycopg2.IntegrityError) as e:
         conn.rollback()
-    finally:
-        cur.close()
+        if len(rows) == 1:
+            print(f"ERROR: Bacaan ditolak database dan dibuang {rows[0]!r}: {str(e).strip()}")
+            forget_reading(rows[0])
+            return 0, 1
+    mid = len(rows) // 2
+    first = write_batch(conn, rows[:mid], flags[:mid] if flags is not None else None)
+    second = write_batch(conn, rows[mid:], flags[mid:] if flags is not None else None)
+    return first[0] + second[0], first[1] + second[1]
+
+class BufferedWriter:
+    """
+    Menampung bacaan dari callback MQTT dan menulisnya ke database dari thread
+    terpisah, per batch (BULK_FLUSH_ROWS baris atau setiap BULK_FLUSH_INTERVAL detik).
+    Callback MQTT tidak pernah menunggu database.
+    """
+
+    def __init__(self, conn, flush_rows=None, flush_interval=None, max_buffered_rows=None):
+        self.conn = conn
+        # Default dibaca saat dibuat (init_inline_scoring bisa memperpendek interval)
+        self.flush_rows = flush_rows or BULK_FLUSH_ROWS
+        self.flush_interval = flush_interval or BULK_FLUSH_INTERVAL
+        self.max_buffered_rows = max_buffered_rows or BULK_MAX_BUFFERED_ROWS
+        self._rows = deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+        # Bacaan yang dilewati unique index di database
+        self.duplicates = 0
+        # Bacaan yang ditolak database (isi tidak valid) dan dibuang
+        self.rejected = 0
+        self.flushes = 0
+
+    def add(self, row):
+        """Dipanggil dari callback MQTT; hanya menambah ke buffer."""
+        with self._cond:
+            if len(self._rows) >= self.max_buffered_rows:
+                # Database tertinggal terlalu jauh: buang bacaan tertua
+                forget_reading(self._rows.popleft())
+                self.dropped += 1
+            self._rows.append(row)
+            if len(self._rows) >= self.flush_rows:
+                self._cond.notify()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._rows)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name='db-writer')
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        """Menghentikan thread writer setelah sisa buffer di-flush."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                # Database tidak tersedia saat shutdown: sisa buffer tidak bisa disimpan
+                print(f"ERROR: {len(self)} bacaan tidak tersimpan saat berhenti.")
+
+    def _take_batch(self):
+        """Menunggu sampai batch penuh / interval habis, lalu mengambil isi buffer."""
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._rows) < self.flush_rows and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = list(self._rows)
+            self._rows.clear()
+            return batch
+
+    def _requeue(self, batch):
+        """Mengembalikan batch yang gagal ke depan buffer (tetap dibatasi max_buffered_rows)."""
+        with self._cond:
+            room = self.max_buffered_rows - len(self._rows)
+            if room < len(batch):
+                lost = len(batch) - max(room, 0)
+                for reading in batch[:lost]:
+                    forget_reading(reading)
+                self.dropped += lost
+                batch = batch[lost:]
+            self._rows.extendleft(reversed(batch))
+
+    def _ensure_connection(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = connect_db()
+        return self.conn is not None
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._flush(batch)
+            with self._cond:
+                if self._stopping and not self._rows:
+                    break
+
+    def _flush(self, batch):
+        if not self._ensure_connection():
+            self._requeue(batch)
+            time.sleep(BULK_RETRY_DELAY)
+            return
+        try:
+            duplicates, rejected = write_batch(self.conn, batch, score_readings(batch))
+        except psycopg2.Error as e:
+            print(f"ERROR: Gagal insert {len(batch)} data: {e}")
+            try:
+                self.conn.rollback()
+            except psycopg2.Error:
+                self.conn.close()
+            self._requeue(batch)
+            time.sleep(BULK_RETRY_DELAY)
+            return
+        stored = len(batch) - duplicates - rejected
+        self.written += stored
+        self.duplicates += duplicates
+        self.rejected += rejected
+        self.flushes += 1
+        print(f"Data tersimpan: {stored} bacaan (total {self.written}, dibuang {self.dropped}, "
+              f"ditolak {self.rejected}, duplikat {suppressed_duplicates() + self.duplicates})")
+
+class SpooledWriter:
+    """
+    Seperti BufferedWriter, tetapi bacaan lebih dulu ditulis ke spool di disk
+    (ingest_spool.DiskSpool). Thread drainer memutar ulang spool ke database per
+    batch besar saat database sehat; selama database lambat/mati bacaan tetap
+    aman di disk, juga setelah listener di-restart.
+    """
+
+    def __init__(self, conn, spool):
+        self.conn = conn
+        self.spool = spool
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+        # Bacaan yang dilewati unique index di database
+        self.duplicates = 0
+        # Bacaan yang tidak bisa di-spool atau ditolak database, lalu dibuang
+        self.rejected = 0
+        self.flushes = 0
+
+    def add(self, row):
+        """Dipanggil dari callback MQTT; hanya append ke spool (salinan memori ke mmap)."""
+        try:
+            appended = self.spool.append(row)
+        except ValueError as e:
+            print(f"ERROR: Bacaan tidak bisa di-spool dan dibuang: {e}")
+            forget_reading(row)
+            self.rejected += 1
+            return
+        if not appended:
+            forget_reading(row)
+            # Spool mencapai SPOOL_MAX_BYTES: bacaan baru tidak bisa disimpan
+            self.dropped += 1
+            return
+        if len(self.spool) >= BULK_FLUSH_ROWS:
+            self._wakeup.set()
+
+    def __len__(self):
+        return len(self.spool)
+
+    def start(self):
+        if len(self.spool):
+            print(f"Spool berisi {len(self.spool)} bacaan yang belum tersimpan, memutar ulang...")
+        self._thread = threading.Thread(target=self._run, daemon=True, name='spool-drainer')
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        """Menghentikan drainer; bacaan yang belum tersimpan tetap di spool untuk run berikutnya."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                # Drainer masih menunggu database: spool (mmap & checkpoint) tetap
+                # miliknya; menutupnya sekarang bisa merusak posisi baca
+                print(f"ERROR: Drainer spool belum berhenti setelah {timeout} detik (database tidak merespons); "
+                      f"spool tidak ditutup, {len(self.spool)} bacaan akan diputar ulang saat listener berjalan lagi.")
+                return
+        self.spool.close()
+        if len(self.spool):
+            print(f"{len(self.spool)} bacaan masih di spool dan akan diputar ulang saat listener berjalan lagi.")
+
+    def _ensure_connection(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = connect_db()
+        return self.conn is not None
+
+    def _run(self):
+        last_sync = time.monotonic()
+        while True:
+            self._wakeup.wait(BULK_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            if time.monotonic() - last_sync >= SPOOL_SYNC_INTERVAL:
+                self.spool.flush()
+                last_sync = time.monotonic()
+
+            # Kosongkan spool per batch besar selama database menerima
+            while len(self.spool) and self._drain_batch():
+                pass
+            if self._stopping:
+                break
+
+    def _drain_batch(self):
+        """Menulis satu batch dari spool. False jika database sedang tidak bisa ditulisi."""
+        if not self._ensure_connection():
+            self._backoff()
+            return False
+        batch, position = self.spool.read_batch(SPOOL_DRAIN_BATCH_ROWS)
+        if not batch:
+            return False
+        try:
+            # Baris yang ditolak database dibuang di sini, jadi checkpoint tetap maju
+            duplicates, rejected = write_batch(self.conn, batch, score_readings(batch))
+        except psycopg2.Error as e:
+            print(f"ERROR: Gagal insert {len(batch)} data dari spool: {e}")
+            try:
+                self.conn.rollback()
+            except psycopg2.Error:
+                self.conn.close()
+            self._backoff()
+            return False
+        # Checkpoint baru maju setelah COMMIT: crash di antaranya berarti batch diputar ulang
+        self.spool.commit(position, len(batch))
+        stored = len(batch) - duplicates - rejected
+        self.written += stored
+        self.duplicates += duplicates
+        self.rejected += rejected
+        self.flushes += 1
+        print(f"Data tersimpan: {stored} bacaan (total {self.written}, di spool {len(self.spool)}, "
+              f"ditolak {self.rejected}, duplikat {suppressed_duplicates() + self.duplicates})")
+        return True
+
+    def _backoff(self):
+        if not self._stopping:
+            self._wakeup.wait(BULK_RETRY_DELAY)
+
+def create_writer(conn, use_spool=SPOOL_ENABLED):
+    """BufferedWriter biasa, atau SpooledWriter dengan spool per proses di SPOOL_DIR."""
+    if not use_spool:
+        return BufferedWriter(conn)
+    # Setiap proses listener (--workers) memakai direktori spool sendiri
+    spool_dir = os.path.join(SPOOL_DIR, multiprocessing.current_process().name)
+    return SpooledWriter(conn, DiskSpool(spool_dir, SPOOL_SEGMENT_BYTES, SPOOL_MAX_BYTES))
 
 # --- FUNGSI MQTT CALLBACKS ---
 
+def subscription_topics(topics, shared_group=None):
+    """Topik yang di-subscribe, dibungkus '$share/<grup>/' jika memakai shared subscription."""
+    if not shared_group:
+        return list(topics)
+    return [f"$share/{shared_group}/{topic}" for topic in topics]
+
 def on_connect(client, userdata, flags, rc):
     """Callback saat berhasil terhubung ke broker."""
     if rc == 0:
         print(f"Terhubung ke MQTT Broker: {MQTT_BROKER}")
-        client.subscribe(MQTT_TOPIC)
+        # Subscribe ulang di setiap (re)connect; daftar topik dibawa lewat userdata
+        topics = (userdata or {}).get('topics') or [MQTT_TOPIC]
+        client.subscribe([(topic, 0) for topic in topics])
     else:
         print(f"Gagal koneksi, kode error: {rc}")
 
 def on_message(client, userdata, msg):
     """Callback saat menerima pesan."""
-    conn = userdata['db_conn']
+    writer = userdata['writer']
     try:
-        payload = msg.payload.decode()
-        data = json.loads(payload)
-        insert_data(conn, data)
-    except json.JSONDecodeError:
-        print("ERROR: Gagal decode JSON.")
+        # JSON, biner ringkas atau MessagePack; satu pesan bisa berisi banyak bacaan
+        for data in decode_payload(msg.payload):
+            reading = parse_reading(data)
+            if reading is not None and not is_duplicate_reading(reading):
+                writer.add(reading)
+    except PayloadError as e:
+        print(f"ERROR: Gagal decode payload: {e}")
     except Exception as e:
         print(f"ERROR umum saat memproses pesan: {e}")
 
 
-def run_mqtt_listener():
+def run_mqtt_listener(topics=None, use_spool=SPOOL_ENABLED):
     conn = connect_db()
-    if not conn:
+    # Dengan spool, listener tetap menerima data walau database belum tersedia
+    if not conn and not use_spool:
         return
 
-    # UserData untuk membawa koneksi DB ke dalam fungsi on_message
-    client = mqtt.Client(userdata={"db_conn": conn})
+    # Koneksi DB dipegang oleh thread writer, bukan oleh loop MQTT
+    writer = create_writer(conn, use_spool).start()
+
+    # UserData untuk membawa writer ke dalam fungsi on_message
+    client = mqtt.Client(userdata={"writer": writer, "topics": topics or MQTT_TOPICS})
     client.on_connect = on_connect
     client.on_message = on_message
 
@@ -94,10 +592,119 @@ def run_mqtt_listener():
     client.connect(MQTT_BROKER, MQTT_PORT, 60)
 
     # Loop untuk menjaga koneksi tetap hidup
-    client.loop_forever()
+    try:
+        client.loop_forever()
+    finally:
+        writer.stop()
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def run_listener_worker(topics, use_asyncio=False, metrics_port=0, inline_scoring=INLINE_SCORING,
+                        use_spool=SPOOL_ENABLED):
+    """Titik masuk satu proses listener (dipakai langsung maupun oleh supervisor)."""
+    # SIGTERM dari supervisor diperlakukan seperti Ctrl+C agar buffer sempat di-flush
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    try:
+        # Setiap proses memuat model sendiri, satu kali
+        shared_stream = any(topic.startswith('$share/') for topic in topics)
+        if inline_scoring and not init_inline_scoring(shared_stream):
+            return
+        if use_asyncio:
+            import asyncio
+            from async_ingest import run_async_listener
+            asyncio.run(run_async_listener(metrics_port, topics, use_spool))
+        else:
+            run_mqtt_listener(topics, use_spool)
+    except KeyboardInterrupt:
+        print("MQTT Listener dihentikan.")
+
+def run_supervisor(num_workers, topics, use_asyncio=False, metrics_port=0, inline_scoring=INLINE_SCORING,
+                   use_spool=SPOOL_ENABLED):
+    """
+    Menjalankan num_workers proses listener dan menyalakan ulang proses yang
+    mati. Setiap proses memiliki koneksi DB dan koneksi MQTT sendiri; topics
+    sebaiknya berupa shared subscription agar pesan tidak diproses dua kali.
+    """
+    def start_worker(i):
+        worker = multiprocessing.Process(
+            target=run_listener_worker, name=f"mqtt-worker-{i + 1}",
+            # Setiap worker punya endpoint metrik sendiri
+            args=(topics, use_asyncio, metrics_port + i if metrics_port else 0, inline_scoring, use_spool),
+        )
+        worker.start()
+        return worker
+
+    print(f"[INFO] Menjalankan {num_workers} worker MQTT listener untuk topik {topics}...")
+    workers = [start_worker(i) for i in range(num_workers)]
+    started_at = [time.monotonic()] * num_workers
+    backoff = [0.0] * num_workers
+    restart_at = [None] * num_workers
+    try:
+        while True:
+            time.sleep(SUPERVISOR_CHECK_INTERVAL)
+            now = time.monotonic()
+            for i, worker in enumerate(workers):
+                if worker.is_alive():
+                    if now - started_at[i] >= WORKER_STABLE_SECONDS:
+                        backoff[i] = 0.0
+                    continue
+                if restart_at[i] is None:
+                    # Worker yang crash berulang kali dinyalakan ulang dengan jeda makin panjang
+                    backoff[i] = min(WORKER_RESTART_BACKOFF_MAX, backoff[i] * 2 or SUPERVISOR_CHECK_INTERVAL)
+                    restart_at[i] = now + backoff[i]
+                    print(f"[WARN] {worker.name} berhenti (exit code {worker.exitcode}), "
+                          f"dinyalakan ulang dalam {backoff[i]:.1f} detik.")
+                if now >= restart_at[i]:
+                    worker.close()
+                    workers[i] = start_worker(i)
+                    started_at[i] = now
+                    restart_at[i] = None
+    except KeyboardInterrupt:
+        print("\n[INFO] Menghentikan semua worker...")
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            worker.join()
 
 if __name__ == '__main__':
+    import argparse
+    import sys
+
+    # async_ingest mengimpor 'mqtt_listener'; arahkan ke modul yang sedang berjalan ini
+    # agar konfigurasi dari argumen (broker, SCORER, ...) terlihat di sana juga
+    sys.modules.setdefault('mqtt_listener', sys.modules[__name__])
+
+    parser = argparse.ArgumentParser(description="MQTT listener sensor SAFE.")
+    parser.add_argument('--asyncio', action='store_true',
+                        help='Pakai pipeline asyncio dengan antrean berbatas (lihat async_ingest.py).')
+    parser.add_argument('--metrics-port', type=int, default=LISTENER_METRICS_PORT,
+                        help='Port endpoint /metrics untuk mode --asyncio (0 = nonaktif).')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Jumlah proses listener paralel dengan supervisor (default: 1).')
+    parser.add_argument('--topic', action='append', default=None,
+                        help=f'Topik MQTT, wildcard diperbolehkan (boleh diulang; default: {MQTT_TOPICS}).')
+    parser.add_argument('--shared-group', default=None,
+                        help=f'Grup shared subscription (default untuk --workers > 1: {SHARED_SUBSCRIPTION_GROUP}).')
+    parser.add_argument('--inline-scoring', action='store_true', default=INLINE_SCORING,
+                        help='Nilai bacaan dengan model ai_engine sebelum ditulis (is_anomaly langsung terisi).')
+    parser.add_argument('--broker', default=MQTT_BROKER, help=f'Alamat broker MQTT (default: {MQTT_BROKER}).')
+    parser.add_argument('--port', type=int, default=MQTT_PORT, help=f'Port broker MQTT (default: {MQTT_PORT}).')
+    parser.add_argument('--spool', action='store_true', default=SPOOL_ENABLED,
+                        help=f'Tulis bacaan ke spool disk ({SPOOL_DIR}/) dulu, lalu putar ulang ke database.')
+    args = parser.parse_args()
+    MQTT_BROKER, MQTT_PORT = args.broker, args.port
+
+    shared_group = args.shared_group
+    if shared_group is None and args.workers > 1:
+        shared_group = SHARED_SUBSCRIPTION_GROUP
+    topics = subscription_topics(args.topic or MQTT_TOPICS, shared_group)
+
     # Pastikan tabel sudah ada sebelum menjalankan listener
     # Anda perlu menjalankan script setup DB (CREATE TABLE) secara terpisah
     print("Memulai MQTT Listener...")
-    run_mqtt_listener()
\ No newline at end of file
+    if args.workers > 1:
+        run_supervisor(args.workers, topics, args.asyncio, args.metrics_port, args.inline_scoring, args.spool)
+    else:
+        run_listener_worker(topics, args.asyncio, args.metrics_port, args.inline_scoring, args.spool)
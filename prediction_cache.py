@@ -0,0 +1,45 @@
+# prediction_cache.py
+# Cache LRU untuk hasil prediksi ai_engine.
+# Sensor DHT melaporkan dengan resolusi 0.1 (°C / %), sehingga di ruangan yang
+# stabil kombinasi (device, temperature, humidity, hour, dayofweek, ...) yang
+# sama berulang ribuan kali per hari. Kuncinya adalah vektor fitur yang sudah
+# di-encode (byte persis), jadi hasil dari cache selalu sama dengan hasil model.
+
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """Cache LRU berukuran tetap: kunci vektor fitur -> hasil prediksi (-1/1)."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Mengembalikan prediksi yang tersimpan atau None (dan mencatat hit/miss)."""
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Dipanggil saat model diganti: semua hasil lama tidak berlaku lagi."""
+        self._entries.clear()
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
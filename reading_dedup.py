@@ -0,0 +1,65 @@
+# reading_dedup.py
+# Penyaring bacaan duplikat di mqtt_listener.
+# Redelivery QoS1 dan device yang reboot mengirim ulang bacaan dengan
+# (device_id, timestamp) yang sama. Penyaring ini mengingat sejumlah epoch
+# terakhir per device (dan sejumlah device terakhir, LRU), sehingga duplikat
+# dibuang sebelum sampai ke database. Ini hanya optimasi: kebenaran tetap
+# dijamin unique index (device_id, timestamp_utc) di database, yang juga
+# menangkap duplikat di luar jendela atau yang diterima proses listener lain.
+#
+# Bacaan dicatat saat diterima, sebelum tersimpan. Bacaan yang kemudian dibuang
+# listener (buffer/spool penuh, ditolak database) harus di-forget(), agar
+# kiriman ulang dari device tidak ikut dibuang sebagai 'duplikat'. Bacaan yang
+# hilang karena proses berhenti tidak perlu: penyaringnya ikut hilang.
+
+import threading
+from collections import OrderedDict, deque
+
+
+class DuplicateFilter:
+    """
+    Jendela (device_id, epoch) terakhir berukuran tetap per device. Aman dipakai
+    dari thread penerima (is_duplicate) dan thread writer (forget) sekaligus.
+    """
+
+    def __init__(self, window_per_device, max_devices):
+        self.window_per_device = window_per_device
+        self.max_devices = max_devices
+        # device_id -> (set epoch, deque epoch urut kedatangan)
+        self._devices = OrderedDict()
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def __len__(self):
+        return len(self._devices)
+
+    def is_duplicate(self, device_id, epoch):
+        """True jika (device_id, epoch) baru saja terlihat; jika tidak, dicatat."""
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is None:
+                state = self._devices[device_id] = (set(), deque())
+                if len(self._devices) > self.max_devices:
+                    self._devices.popitem(last=False)
+            else:
+                self._devices.move_to_end(device_id)
+
+            seen, order = state
+            if epoch in seen:
+                self.suppressed += 1
+                return True
+            seen.add(epoch)
+            order.append(epoch)
+            if len(order) > self.window_per_device:
+                seen.discard(order.popleft())
+            return False
+
+    def forget(self, device_id, epoch):
+        """Membatalkan pencatatan (device_id, epoch) untuk bacaan yang akhirnya dibuang."""
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is None or epoch not in state[0]:
+                return
+            seen, order = state
+            seen.discard(epoch)
+            order.remove(epoch)
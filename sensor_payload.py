@@ -0,0 +1,105 @@
+# sensor_payload.py
+# Decoder (dan encoder) payload MQTT sensor. Format dikenali per pesan dari
+# byte pertamanya, sehingga device lama (JSON) dan baru (biner) bisa bercampur:
+#
+#   '{' / '[' / spasi : JSON, satu objek bacaan atau array objek (batch)
+#   0xC1              : format biner ringkas SAFE (lihat di bawah)
+#   lainnya           : MessagePack (map atau array map), jika modul msgpack terpasang
+#
+# Format biner (little-endian). 0xC1 tidak pernah dipakai oleh MessagePack dan
+# bukan awal UTF-8 yang valid, jadi tidak bisa tertukar dengan format lain:
+#
+#   header : uint8 magic (0xC1), uint8 versi (1), uint8 panjang device_id, device_id (UTF-8)
+#   bacaan : uint32 epoch (detik), int16 temperature x10, uint16 humidity x10   (8 byte)
+#
+# Jumlah bacaan = sisa panjang payload / 8. Satu bacaan JSON ~90 byte, versi biner
+# ~20 byte; batch 10 bacaan ~90 byte. Contoh struct di firmware ESP8266:
+#
+#   struct __attribute__((packed)) Reading { uint32_t epoch; int16_t temp_x10; uint16_t hum_x10; };
+
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+BINARY_MAGIC = 0xC1
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<BBB')
+BINARY_READING = struct.Struct('<IhH')
+
+_JSON_FIRST_BYTES = frozenset(b'{[ \t\r\n')
+
+
+class PayloadError(ValueError):
+    """Payload tidak bisa di-decode (format tidak dikenal atau rusak)."""
+
+
+def _decode_binary(payload):
+    if len(payload) < BINARY_HEADER.size:
+        raise PayloadError("header biner terpotong")
+    _, version, device_len = BINARY_HEADER.unpack_from(payload)
+    if version != BINARY_VERSION:
+        raise PayloadError(f"versi format biner tidak dikenal: {version}")
+    offset = BINARY_HEADER.size + device_len
+    try:
+        device_id = bytes(payload[BINARY_HEADER.size:offset]).decode('utf-8')
+    except UnicodeDecodeError:
+        raise PayloadError("device_id bukan UTF-8")
+    body = len(payload) - offset
+    if body <= 0 or body % BINARY_READING.size:
+        raise PayloadError(f"panjang data biner tidak valid ({len(payload)} byte)")
+
+    return [
+        {'timestamp': epoch, 'temperature': temp_x10 / 10.0,
+         'humidity': hum_x10 / 10.0, 'device_id': device_id}
+        for epoch, temp_x10, hum_x10 in BINARY_READING.iter_unpack(payload[offset:])
+    ]
+
+
+def _as_reading_list(data):
+    if isinstance(data, dict):
+        return [data]
+    if isinstance(data, list) and all(isinstance(item, dict) for item in data):
+        return data
+    raise PayloadError("payload harus berupa objek bacaan atau array objek")
+
+
+def decode_payload(payload):
+    """
+    Mengubah satu payload MQTT (bytes) menjadi daftar dict bacaan dengan kunci
+    timestamp, temperature, humidity, device_id. Melempar PayloadError.
+    """
+    if not payload:
+        raise PayloadError("payload kosong")
+    first = payload[0]
+    if first == BINARY_MAGIC:
+        return _decode_binary(payload)
+    if first in _JSON_FIRST_BYTES:
+        try:
+            return _as_reading_list(json.loads(payload))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise PayloadError("JSON tidak valid")
+    if msgpack is not None:
+        try:
+            data = msgpack.unpackb(payload, raw=False)
+        except Exception as e:
+            raise PayloadError(f"Gagal decode MessagePack: {e}")
+        return _as_reading_list(data)
+    raise PayloadError(f"format payload tidak dikenal (byte pertama 0x{first:02x})")
+
+
+def encode_binary(device_id, readings):
+    """
+    Kebalikan _decode_binary, untuk simulator/pengujian: readings adalah daftar
+    (epoch, temperature, humidity).
+    """
+    device_bytes = device_id.encode('utf-8')
+    if len(device_bytes) > 255:
+        raise ValueError("device_id terlalu panjang untuk format biner (maks 255 byte)")
+    parts = [BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(device_bytes)), device_bytes]
+    for epoch, temperature, humidity in readings:
+        parts.append(BINARY_READING.pack(int(epoch), round(temperature * 10), round(humidity * 10)))
+    return b''.join(parts)
@@ -0,0 +1,6 @@
+# Modul proyek ada di root repo (bukan paket), jadi root ditambahkan ke sys.path
+# agar `pytest` juga jalan tanpa `python -m`.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,45 @@
+# Tes LTTB (downsampling.py): jumlah titik, titik ujung, satu titik per bucket,
+# dan deret yang sudah cukup pendek dikembalikan utuh.
+
+import numpy as np
+import pytest
+
+from downsampling import lttb_indices
+
+
+def series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.uniform(1, 10, n))
+    return x, np.sin(x / 50) * 10 + rng.normal(0, 1, n)
+
+
+@pytest.mark.parametrize('n, threshold', [(1000, 100), (1000, 3), (101, 100), (10, 9), (5000, 4999)])
+def test_threshold_points_with_endpoints_kept(n, threshold):
+    x, y = series(n)
+    selected = lttb_indices(x, y, threshold)
+    assert len(selected) == threshold
+    assert selected[0] == 0 and selected[-1] == n - 1
+    assert np.all(np.diff(selected) > 0)
+
+
+@pytest.mark.parametrize('n, threshold', [(1000, 100), (997, 13), (50, 7)])
+def test_one_point_per_bucket(n, threshold):
+    x, y = series(n, seed=1)
+    selected = lttb_indices(x, y, threshold)
+    # Titik di antara kedua ujung dibagi rata ke threshold - 2 bucket
+    bounds = (np.arange(threshold - 1) * (n - 2)) // (threshold - 2) + 1
+    buckets = np.searchsorted(bounds, selected[1:-1], side='right') - 1
+    assert np.array_equal(buckets, np.arange(threshold - 2))
+
+
+@pytest.mark.parametrize('n, threshold', [(0, 10), (1, 10), (10, 10), (10, 50), (100, 2), (100, 0)])
+def test_short_series_or_tiny_threshold_returns_everything(n, threshold):
+    x, y = series(n)
+    assert np.array_equal(lttb_indices(x, y, threshold), np.arange(n))
+
+
+def test_keeps_a_single_spike():
+    x = np.arange(1000, dtype=float)
+    y = np.zeros(1000)
+    y[437] = 100.0
+    assert 437 in lttb_indices(x, y, 20)
@@ -0,0 +1,106 @@
+# Tes parsing query string /api/v1/historical_data (api_server.py): waktu ISO
+# vs epoch, cursor keyset opaque, dan jalur 400. Semua tanpa database.
+
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import api_server
+from api_server import decode_cursor, encode_cursor, parse_historical_args, parse_time_arg
+
+UTC = timezone.utc
+
+
+def args(**query):
+    return MultiDict(query)
+
+
+def raw_cursor(state):
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2025-01-01T00:00:00Z', datetime(2025, 1, 1, tzinfo=UTC)),
+    ('2025-01-01T07:00:00+07:00', datetime(2025, 1, 1, tzinfo=UTC)),
+    ('2025-01-01 12:30', datetime(2025, 1, 1, 12, 30, tzinfo=UTC)),   # tanpa zona = UTC
+    ('20250101', datetime(2025, 1, 1, tzinfo=UTC)),                   # ISO dasar, bukan epoch 1970
+    ('1735689600', datetime(2025, 1, 1, tzinfo=UTC)),                 # epoch detik
+])
+def test_parse_time_arg_prefers_iso_then_integer_epoch(value, expected):
+    assert parse_time_arg(value) == expected
+
+
+@pytest.mark.parametrize('value', ['123', '1735689600.5', '-1735689600', '99999999999', '1e9', 'kemarin', ''])
+def test_parse_time_arg_rejects_other_values(value):
+    with pytest.raises(ValueError):
+        parse_time_arg(value)
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2025, 1, 1, 12, 0, 0, 123456, tzinfo=UTC)
+    end = datetime(2025, 1, 2, tzinfo=UTC)
+    for device_id in ('sensor_001', None):
+        assert decode_cursor(encode_cursor(timestamp, 42, end, device_id)) == (timestamp, 42, end, device_id)
+
+
+@pytest.mark.parametrize('cursor', [
+    'bukan-base64!!',
+    raw_cursor(['2025-01-01T00:00:00+00:00', 5, '2025-01-02T00:00:00+00:00']),                 # field kurang
+    raw_cursor(['2025-01-01T00:00:00+00:00', '5', '2025-01-02T00:00:00+00:00', None]),         # id bukan int
+    raw_cursor(['2025-01-01T00:00:00+00:00', True, '2025-01-02T00:00:00+00:00', None]),
+    raw_cursor(['2025-01-01T00:00:00+00:00', 5, '2025-01-02T00:00:00+00:00', {'x': 1}]),       # device bukan str
+    raw_cursor(['2025-01-01T00:00:00+00:00', 5, '2025-01-02T00:00:00+00:00', ['a']]),
+    raw_cursor(['kemarin', 5, '2025-01-02T00:00:00+00:00', None]),                             # waktu rusak
+    raw_cursor({'ts': 1}),
+])
+def test_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError, match='cursor'):
+        decode_cursor(cursor)
+
+
+def test_cursor_carries_range_and_device_into_next_page():
+    end = datetime(2025, 1, 2, tzinfo=UTC)
+    position = datetime(2025, 1, 1, 6, tzinfo=UTC)
+    params = parse_historical_args(args(cursor=encode_cursor(position, 7, end, 'sensor_001')))
+    assert params['mode'] == 'raw'
+    assert (params['start'], params['end'], params['device_id']) == (position, end, 'sensor_001')
+    assert params['cursor'] == (position, 7)
+
+
+def test_hours_is_capped_only_outside_raw_mode():
+    long_hours = str(api_server.HISTORICAL_MAX_HOURS * 10)
+    with pytest.raises(ValueError, match='mode=raw'):
+        parse_historical_args(args(hours=long_hours, mode='bucket'))
+    params = parse_historical_args(args(hours=long_hours, mode='raw'))
+    assert params['end'] - params['start'] == timedelta(hours=api_server.HISTORICAL_MAX_HOURS * 10)
+    # Sangat besar: sejak awal data, bukan OverflowError
+    assert parse_historical_args(args(hours='1e300', mode='raw'))['start'].year == 1
+
+
+@pytest.fixture
+def client():
+    api_server.app.config['TESTING'] = True
+    return api_server.app.test_client()
+
+
+@pytest.mark.parametrize('query, message', [
+    ({'hours': 'abc'}, 'must be numbers'),
+    ({'hours': '0'}, "'hours'"),
+    ({'hours': 'nan'}, "'hours'"),
+    ({'points': '2'}, "'points'"),
+    ({'limit': '0', 'mode': 'raw'}, "'limit'"),
+    ({'mode': 'median'}, "'mode'"),
+    ({'mode': 'lttb', 'cursor': 'abc'}, "'cursor'"),
+    ({'start': '20250102', 'end': '20250101'}, 'before'),
+    ({'start': '123'}, 'epoch seconds or ISO 8601'),
+    ({'start': '20250101', 'end': '20250301', 'mode': 'lttb'}, 'mode=raw'),
+    ({'cursor': raw_cursor([1, 2])}, "'cursor'"),
+])
+def test_invalid_query_returns_400(client, query, message):
+    response = client.get('/api/v1/historical_data', query_string=query)
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['status'] == 'error' and message in body['message']
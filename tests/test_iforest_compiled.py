@@ -0,0 +1,106 @@
+# Tes evaluator compiled (iforest_compiled.py): skor dan prediksi harus identik
+# bit-for-bit dengan IsolationForest, lewat matriks penuh, encoding terindeks
+# (kolom device sebagai indeks, termasuk device tak dikenal), cache .npy, dan
+# jalur ai_engine (CSR sklearn dan cache prediksi).
+
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import IsolationForest
+
+import ai_engine
+from iforest_compiled import compile_isolation_forest, load_compiled, save_compiled
+from prediction_cache import PredictionCache
+
+DEVICES = [f"sensor_{i:03d}" for i in range(8)]
+FEATURES = ['temperature', 'humidity', 'hour', 'dayofweek', 'minute'] + [f"device_id_{d}" for d in DEVICES]
+
+
+def make_rows(n, devices, seed):
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        {'id': i + 1, 'device_id': devices[i % len(devices)],
+         'timestamp_utc': start + timedelta(minutes=7 * i),
+         'temperature': float(rng.normal(25, 4)), 'humidity': float(rng.normal(60, 10))}
+        for i in range(n)
+    ]
+
+
+@pytest.fixture(scope='module', params=[1.0, 0.6], ids=['all-features', 'max-features'])
+def fitted(request):
+    """(model, shard) kecil; max_features < 1 menguji pemetaan fitur per pohon."""
+    shard = ai_engine.make_model_shard(None, FEATURES, None)
+    dense, hot_columns, _ = ai_engine.encode_batch(make_rows(600, DEVICES, seed=1), shard)
+    X = pd.DataFrame(ai_engine.expand_to_dense_matrix(dense, hot_columns, shard), columns=FEATURES)
+    model = IsolationForest(n_estimators=40, max_features=request.param, random_state=0).fit(X)
+    shard.model = model
+    shard.compiled = compile_isolation_forest(model)
+    return model, shard
+
+
+def encoded_test_batch(shard):
+    # Sebagian baris dari device yang tidak ada di model (kolom one-hot -1)
+    rows = make_rows(300, DEVICES + ['sensor_new_1', 'sensor_new_2'], seed=2)
+    dense, hot_columns, _ = ai_engine.encode_batch(rows, shard)
+    assert (hot_columns == -1).any() and (hot_columns >= 0).any()
+    matrix = ai_engine.expand_to_dense_matrix(dense, hot_columns, shard)
+    return dense, hot_columns, pd.DataFrame(matrix, columns=FEATURES)
+
+
+def test_dense_matrix_is_bit_identical(fitted):
+    model, shard = fitted
+    _, _, X = encoded_test_batch(shard)
+    assert np.array_equal(shard.compiled.score_samples(X.to_numpy()), model.score_samples(X))
+    assert np.array_equal(shard.compiled.predict(X.to_numpy()), model.predict(X))
+
+
+def test_indexed_encoding_with_unknown_devices_is_bit_identical(fitted):
+    model, shard = fitted
+    dense, hot_columns, X = encoded_test_batch(shard)
+    compiled = shard.compiled
+    assert np.array_equal(compiled.score_samples_indexed(dense, shard.dense_columns, hot_columns),
+                          model.score_samples(X))
+    assert np.array_equal(compiled.predict_indexed(dense, shard.dense_columns, hot_columns), model.predict(X))
+
+
+def test_saved_arrays_load_back_identical(fitted, tmp_path):
+    model, shard = fitted
+    dense, hot_columns, X = encoded_test_batch(shard)
+    directory = str(tmp_path / 'compiled')
+    save_compiled(shard.compiled, directory)
+    loaded = load_compiled(directory)
+    assert np.array_equal(loaded.score_samples_indexed(dense, shard.dense_columns, hot_columns),
+                          model.score_samples(X))
+
+
+def test_sparse_sklearn_path_matches_dense(fitted, monkeypatch):
+    model, shard = fitted
+    dense, hot_columns, X = encoded_test_batch(shard)
+    # Tanpa evaluator compiled, model dengan banyak device memakai matriks CSR
+    monkeypatch.setattr(ai_engine, 'SPARSE_MIN_DEVICES', 1)
+    monkeypatch.setattr(shard, 'compiled', None)
+    assert np.array_equal(ai_engine.predict_encoded(dense, hot_columns, shard), model.predict(X))
+
+
+@pytest.mark.parametrize('use_compiled', [True, False])
+def test_prediction_cache_path_matches_model(fitted, monkeypatch, use_compiled):
+    model, shard = fitted
+    dense, hot_columns, X = encoded_test_batch(shard)
+    if not use_compiled:
+        monkeypatch.setattr(shard, 'compiled', None)
+    cache = PredictionCache(10000)
+    monkeypatch.setattr(ai_engine, 'PREDICTION_CACHE', cache)
+    expected = model.predict(X)
+
+    # Batch berisi vektor berulang: duplikat di dalam batch ikut diuji
+    repeated = np.concatenate((np.arange(len(expected)), np.arange(50)))
+    first = ai_engine.predict_encoded_cached(dense[repeated], hot_columns[repeated], shard)
+    assert np.array_equal(first, expected[repeated])
+    misses = cache.misses
+    # Panggilan kedua dilayani seluruhnya dari cache
+    second = ai_engine.predict_encoded_cached(dense, hot_columns, shard)
+    assert np.array_equal(second, expected)
+    assert cache.misses == misses
@@ -0,0 +1,73 @@
+# Tes decoder payload MQTT (sensor_payload.py): JSON tunggal/batch, format
+# biner 0xC1 (bolak-balik dengan encode_binary), MessagePack, dan input rusak.
+
+import json
+import struct
+
+import pytest
+
+import sensor_payload
+from sensor_payload import BINARY_MAGIC, PayloadError, decode_payload, encode_binary
+
+READING = {'timestamp': 1735689600, 'temperature': 24.5, 'humidity': 61.2, 'device_id': 'sensor_001'}
+
+
+def test_json_object_and_batch_array():
+    assert decode_payload(json.dumps(READING).encode()) == [READING]
+    batch = [READING, dict(READING, timestamp=1735689605, temperature=-3.5)]
+    # Spasi di depan tetap dikenali sebagai JSON
+    assert decode_payload(b'  \n' + json.dumps(batch).encode()) == batch
+
+
+def test_binary_round_trip():
+    readings = [(1735689600, 24.5, 61.2), (1735689605, -12.3, 0.0), (4294967295, 3276.7, 6553.5)]
+    decoded = decode_payload(encode_binary('sensör-7', readings))
+    assert decoded == [
+        {'timestamp': epoch, 'temperature': temperature, 'humidity': humidity, 'device_id': 'sensör-7'}
+        for epoch, temperature, humidity in readings
+    ]
+
+
+@pytest.mark.skipif(sensor_payload.msgpack is None, reason="msgpack tidak terpasang")
+def test_msgpack_object_and_batch():
+    msgpack = sensor_payload.msgpack
+    assert decode_payload(msgpack.packb(READING)) == [READING]
+    assert decode_payload(msgpack.packb([READING, READING])) == [READING, READING]
+
+
+@pytest.mark.parametrize('payload', [
+    b'',                                                    # kosong
+    bytes([BINARY_MAGIC]),                                  # header terpotong
+    bytes([BINARY_MAGIC, 1]),
+    bytes([BINARY_MAGIC, 2, 0]) + b'\x00' * 8,              # versi tidak dikenal
+    encode_binary('sensor_001', []),                        # tanpa bacaan
+    encode_binary('sensor_001', [(1, 2.0, 3.0)])[:-1],      # bacaan terpotong
+    bytes([BINARY_MAGIC, 1, 50]) + b'abc',                  # device_id lebih panjang dari payload
+    bytes([BINARY_MAGIC, 1, 1, 0xff]) + struct.pack('<IhH', 1, 2, 3),  # device_id bukan UTF-8
+    b'{"timestamp": 1',                                     # JSON terpotong
+    b'[1, 2, 3]',                                           # array bukan objek
+    b'"teks"',                                              # bukan objek bacaan
+    b'{"device_id": "\xff"}',                               # JSON bukan UTF-8
+], ids=lambda payload: payload[:12].hex() or 'empty')
+def test_malformed_payloads_raise_payload_error(payload):
+    with pytest.raises(PayloadError):
+        decode_payload(payload)
+
+
+def test_unknown_first_byte_without_msgpack(monkeypatch):
+    monkeypatch.setattr(sensor_payload, 'msgpack', None)
+    with pytest.raises(PayloadError, match='0x93'):
+        decode_payload(b'\x93\x01\x02\x03')
+
+
+@pytest.mark.skipif(sensor_payload.msgpack is None, reason="msgpack tidak terpasang")
+@pytest.mark.parametrize('payload', [b'\x93\x01\x02\x03', b'\x05', b'\xde\x00'])
+def test_unknown_or_broken_msgpack_raises_payload_error(payload):
+    # Byte pertama lain dicoba sebagai MessagePack; hasil yang bukan bacaan tetap ditolak
+    with pytest.raises(PayloadError):
+        decode_payload(payload)
+
+
+def test_encode_binary_rejects_long_device_id():
+    with pytest.raises(ValueError):
+        encode_binary('x' * 256, [(1, 2.0, 3.0)])